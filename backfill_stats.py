@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+从 Claude Code 会话记录回填统计数据。
+~/.claude/projects/*/*.jsonl 中保存了安装 hook 之前的所有 Write / Edit 工具调用：
+多个进程并行流式解析这些文件，用 post_stat.calculate_stats_from_tool_input 计算统计，
+以工具结果的原始时间（东八区）和会话 ID 生成记录，写入对应日期的统计文件。
+
+hook 已经记录过的调用不会重复写入：会话、工具和行数相同，且时间相差不超过 DEDUP_TOLERANCE 秒的
+已有记录视为同一次调用；已被 retention_stats.py 汇总的日期不再回填。已处理完的会话文件（大小和修改时间不变）记录在 .backfill-state.json，
+中断后重新运行会跳过它们；写入本身也是幂等的。
+"""
+
+import heapq
+import os
+import sys
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import post_stat
+import stats_codec
+import view_stats
+from merge_stats import remove_archives
+from retention_stats import day_level
+
+DEFAULT_PROJECTS_DIR = "~/.claude/projects"
+STATE_NAME = ".backfill-state.json"
+
+# 与 hook 的 matcher（Write|Edit）一致
+TOOLS = ('Write', 'Edit')
+
+# hook 记录的是工具执行完成的时间，与会话记录中工具结果的时间通常相差不到一秒
+DEDUP_TOLERANCE = 10
+
+# 每批处理的会话文件数，每批写入后保存一次进度
+DEFAULT_BATCH = 32
+
+BEIJING_TZ = timezone(timedelta(hours=8))
+
+
+def _parse_iso(value):
+    """解析 ISO 时间；Python 3.11 之前的 fromisoformat 不接受末尾的 Z，先换成 +00:00"""
+    if isinstance(value, str) and value.endswith('Z'):
+        value = value[:-1] + '+00:00'
+    return datetime.fromisoformat(value)
+
+
+def _to_local_timestamp(value):
+    """会话记录中的 UTC 时间（...Z）-> 与 hook 相同格式的东八区时间"""
+    try:
+        return _parse_iso(value).astimezone(BEIJING_TZ).isoformat()
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_transcript(path, email):
+    """
+    流式解析一个会话文件，返回 ([(tool_use_id, 记录), ...], 时间无法解析而跳过的调用数)。
+    只统计执行成功的调用（与 PostToolUse hook 相同）：工具调用先记下，遇到对应的成功结果时才生成记录。
+    大部分行与 Write / Edit 无关，先用字节查找过滤，只解析可能相关的行。
+    """
+    pending = {}
+    results = []
+    unparsed = 0
+
+    with open(path, 'rb') as f:
+        for line in f:
+            if b'"tool_use"' in line and (b'"Write"' in line or b'"Edit"' in line):
+                kind = 'tool_use'
+            elif pending and b'"tool_result"' in line and any(tool_id in line for tool_id in pending):
+                kind = 'tool_result'
+            else:
+                continue
+
+            try:
+                entry = stats_codec.loads(line)
+            except ValueError:
+                continue
+            message = entry.get('message') if isinstance(entry, dict) else None
+            content = message.get('content') if isinstance(message, dict) else None
+            if not isinstance(content, list):
+                continue
+
+            for item in content:
+                if not isinstance(item, dict) or item.get('type') != kind:
+                    continue
+                if kind == 'tool_use':
+                    if item.get('name') in TOOLS and isinstance(item.get('input'), dict):
+                        pending[item.get('id', '').encode()] = (item['name'], item['input'])
+                    continue
+
+                call = pending.pop(str(item.get('tool_use_id', '')).encode(), None)
+                if call is None or item.get('is_error'):
+                    continue
+                timestamp = _to_local_timestamp(entry.get('timestamp'))
+                if timestamp is None:
+                    unparsed += 1
+                    continue
+
+                tool_name, tool_input = call
+                additions, deletions, net_change, content_delta = \
+                    post_stat.calculate_stats_from_tool_input(tool_name, tool_input)
+                if additions == 0 and deletions == 0:
+                    continue
+
+                record = {
+                    "timestamp": timestamp,
+                    "session_id": entry.get('sessionId') or path.stem,
+                    "email": email,
+                    "tool": tool_name,
+                    "additions": additions,
+                    "deletions": deletions,
+                    "net_change": net_change,
+                }
+                record.update(content_delta)
+                results.append((item['tool_use_id'], record))
+
+    return results, unparsed
+
+
+def _parse_task(args):
+    """进程池任务入口"""
+    path, email = args
+    return path, parse_transcript(Path(path), email)
+
+
+def _dedup_key(record):
+    return (record.get('session_id'), record.get('tool'),
+            record.get('additions'), record.get('deletions'), record.get('net_change'))
+
+
+def _epoch(timestamp):
+    try:
+        return _parse_iso(timestamp).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def load_existing(dates, stats_dir):
+    """
+    已有记录的索引：去重键 -> 时间（秒）列表。
+    跨午夜的调用可能被 hook 记到相邻日期，因此同时读取前后各一天。
+    """
+    days = set()
+    for date_str in dates:
+        day = datetime.strptime(date_str, "%Y-%m-%d")
+        days.update((day + timedelta(days=delta)).strftime("%Y-%m-%d") for delta in (-1, 0, 1))
+
+    existing = defaultdict(list)
+    for date_str in sorted(days):
+        for record in view_stats.iter_stats_file(date_str, stats_dir=stats_dir):
+            seconds = _epoch(record.get('timestamp'))
+            if seconds is not None:
+                existing[_dedup_key(record)].append(seconds)
+    return existing
+
+
+def drop_logged(records, existing):
+    """去掉已有记录中已存在的调用；每条已有记录最多抵消一条回填记录"""
+    fresh = []
+    for record in records:
+        seconds = _epoch(record['timestamp'])
+        candidates = existing.get(_dedup_key(record))
+        if candidates:
+            nearest = min(range(len(candidates)), key=lambda i: abs(candidates[i] - seconds))
+            if abs(candidates[nearest] - seconds) <= DEDUP_TOLERANCE:
+                candidates.pop(nearest)
+                continue
+        fresh.append(record)
+    return fresh
+
+
+def write_day(date_str, records, stats_dir, today):
+    """
+    把一天的回填记录写入统计文件。
+    今天的文件 hook 仍在追加，按 hook 的方式加锁追加；之前的日期与已有记录按时间归并后整体替换。
+    """
+    records = sorted(records, key=lambda r: r['timestamp'])
+    out_path = stats_dir / f"{date_str}.jsonl"
+
+    if date_str == today:
+        with open(out_path, 'a', encoding='utf-8') as f:
+            post_stat.lock_file(f)
+            try:
+                f.write(''.join(stats_codec.dumps(r) + '\n' for r in records))
+                f.flush()
+            finally:
+                post_stat.unlock_file(f)
+        return
+
+    existing = view_stats.iter_stats_file(date_str, stats_dir=stats_dir)
+    tmp_path = stats_dir / f"{date_str}.jsonl.part"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for record in heapq.merge(existing, records, key=lambda r: r.get('timestamp', '')):
+            f.write(stats_codec.dumps(record) + '\n')
+    os.replace(tmp_path, out_path)
+    remove_archives(date_str, stats_dir)
+
+
+def load_state(stats_dir):
+    """已处理完的会话文件：路径 -> [大小, 修改时间]"""
+    try:
+        with open(Path(stats_dir) / STATE_NAME, 'rb') as f:
+            state = stats_codec.loads(f.read())
+    except (OSError, ValueError):
+        return {}
+    return state if isinstance(state, dict) else {}
+
+
+def save_state(stats_dir, state):
+    state_path = Path(stats_dir) / STATE_NAME
+    tmp_path = state_path.with_name(f"{state_path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(stats_codec.dumps(state))
+    os.replace(tmp_path, state_path)
+
+
+def _file_signature(path):
+    stat = path.stat()
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def find_transcripts(projects_dir, state):
+    """列出需要处理的会话文件（新文件，或上次处理后又有变化的文件）"""
+    pending = []
+    for path in sorted(Path(projects_dir).expanduser().glob("*/*.jsonl")):
+        if state.get(str(path)) != _file_signature(path):
+            pending.append(path)
+    return pending
+
+
+def backfill(projects_dir, stats_dir, email, workers=None, batch=DEFAULT_BATCH, progress=None):
+    """
+    回填统计数据，返回 (处理的会话文件数, 写入记录数, 跳过的已记录调用数)。
+    每批会话文件并行解析，去重后写入，再保存进度。
+    一批中的成功调用全部因时间无法解析而被跳过时抛出 ValueError（不保存进度），不静默丢弃整批数据。
+    """
+    stats_dir = Path(stats_dir)
+    stats_dir.mkdir(parents=True, exist_ok=True)
+    state = load_state(stats_dir)
+    transcripts = find_transcripts(projects_dir, state)
+    if not transcripts:
+        return 0, 0, 0
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    seen_calls = set()
+    written = skipped = 0
+    workers = min(workers or os.cpu_count() or 1, len(transcripts))
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for first in range(0, len(transcripts), batch):
+            paths = transcripts[first:first + batch]
+            signatures = {str(p): _file_signature(p) for p in paths}
+
+            records = []
+            unparsed = 0
+            for _, (calls, bad_timestamps) in pool.map(_parse_task, [(str(p), email) for p in paths]):
+                unparsed += bad_timestamps
+                # 恢复的会话会把之前的消息复制到新文件中，同一调用按 tool_use_id 只统计一次
+                for tool_use_id, record in calls:
+                    if tool_use_id not in seen_calls:
+                        seen_calls.add(tool_use_id)
+                        records.append(record)
+
+            if unparsed and not records:
+                raise ValueError(f"会话记录中 {unparsed} 个调用的时间都无法解析，未写入任何记录")
+
+            by_date = defaultdict(list)
+            if records:
+                existing = load_existing({r['timestamp'][:10] for r in records}, stats_dir)
+                fresh = drop_logged(records, existing)
+                skipped += len(records) - len(fresh)
+                for record in fresh:
+                    by_date[record['timestamp'][:10]].append(record)
+
+            today = datetime.now(BEIJING_TZ).strftime("%Y-%m-%d")
+            for date_str, day_records in sorted(by_date.items()):
+                # 已被 retention_stats 汇总的日期无法与原始记录去重，不再写入
+                if day_level(date_str, stats_dir) not in (None, 'raw'):
+                    skipped += len(day_records)
+                    continue
+                write_day(date_str, day_records, stats_dir, today)
+                written += len(day_records)
+
+            state.update(signatures)
+            save_state(stats_dir, state)
+            if progress:
+                progress(first + len(paths), len(transcripts), written)
+
+    return len(transcripts), written, skipped
+
+
+def main():
+    """主函数"""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='从 Claude Code 会话记录回填统计数据',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+示例：
+  %(prog)s                                    # 回填 ~/.claude/projects 中的所有会话
+  %(prog)s --projects /backup/projects -j 8   # 指定会话目录，使用 8 个进程
+  %(prog)s --dir /tmp/code-log                # 写入其他统计目录
+中断后重新运行即可继续，已处理的会话文件会被跳过。
+        """
+    )
+
+    parser.add_argument('--projects', default=DEFAULT_PROJECTS_DIR,
+                        help=f'Claude Code 会话目录（默认 {DEFAULT_PROJECTS_DIR}）')
+    parser.add_argument('--dir', default=str(post_stat.STATS_DIR), help='统计目录（默认 hook 的 code-log）')
+    parser.add_argument('--email', help='记录中的用户邮箱（默认 git 配置的邮箱）')
+    parser.add_argument('--workers', '-j', type=int, help='并行进程数（默认 CPU 核数）')
+    parser.add_argument('--batch', type=int, default=DEFAULT_BATCH,
+                        help=f'每批处理的会话文件数，每批完成后保存进度（默认 {DEFAULT_BATCH}）')
+
+    args = parser.parse_args()
+
+    projects_dir = Path(args.projects).expanduser()
+    if not projects_dir.is_dir():
+        print(f"错误：目录不存在: {projects_dir}", file=sys.stderr)
+        sys.exit(1)
+
+    email = args.email or post_stat.get_git_user_email()
+
+    def progress(done, total, written):
+        print(f"\r已处理 {done}/{total} 个会话文件，写入 {written} 条记录", end="", flush=True)
+
+    processed, written, skipped = backfill(projects_dir, args.dir, email, args.workers,
+                                           max(1, args.batch), progress)
+    if not processed:
+        print("没有需要处理的会话文件")
+        return
+
+    print(f"\n\n共处理 {processed} 个会话文件：写入 {written} 条记录，跳过 {skipped} 条 hook 已记录（或所在日期已汇总）的调用")
+    print(f"查询：python view_stats.py --dir {args.dir} --history")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\n\n已取消（重新运行即可继续）", file=sys.stderr)
+        sys.exit(130)
+    except Exception as e:
+        print(f"错误：{e}", file=sys.stderr)
+        import traceback
+        traceback.print_exc(file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+归档格式基准测试。
+对比原始 JSONL 与分块压缩归档（gzip / zstd）的文件大小、全量扫描吞吐量和一小时范围查询耗时。
+"""
+
+import argparse
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# 允许从仓库根目录导入模块
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import stats_archive
+import stats_codec
+import view_stats
+
+DATE = "2026-01-15"
+
+
+def write_day_file(path, n, date_str=DATE):
+    """写入 n 条时间均匀分布在一天内的样例记录"""
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(n):
+            seconds = i * 86400 // n
+            additions = (i * 7) % 120
+            deletions = (i * 3) % 40
+            f.write(stats_codec.dumps({
+                "timestamp": f"{date_str}T{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}+08:00",
+                "session_id": f"session-{i // 50:06d}",
+                "email": f"user{i % 7}@example.com",
+                "tool": "Edit" if i % 3 else "Write",
+                "additions": additions,
+                "deletions": deletions,
+                "net_change": additions - deletions,
+            }) + '\n')
+
+
+def timed_read(start=None, end=None, repeat=3):
+    """返回 (最快耗时, 记录数)"""
+    best = float('inf')
+    count = 0
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        count = len(view_stats.read_stats_file(DATE, start, end))
+        best = min(best, time.perf_counter() - t0)
+    return best, count
+
+
+def main():
+    parser = argparse.ArgumentParser(description='归档格式基准测试')
+    parser.add_argument('--records', '-n', type=int, default=200000, help='单日记录数')
+    parser.add_argument('--block-size', type=int, default=256, metavar='KB', help='压缩块大小（KB）')
+    args = parser.parse_args()
+
+    codecs = ['gzip']
+    try:
+        stats_archive._zstd()
+        codecs.append('zstd')
+    except RuntimeError:
+        print("提示：未安装 zstandard，跳过 zstd\n")
+
+    range_start = f"{DATE}T10:00:00+08:00"
+    range_end = f"{DATE}T11:00:00+08:00"
+
+    work_dir = Path(tempfile.mkdtemp(prefix="claude-stats-bench-"))
+    try:
+        raw_dir = work_dir / "raw"
+        raw_dir.mkdir()
+        raw_path = raw_dir / f"{DATE}.jsonl"
+        write_day_file(raw_path, args.records)
+        raw_size = raw_path.stat().st_size
+
+        print(f"记录数：{args.records}，块大小：{args.block_size} KB\n")
+        print(f"{'格式':8s} {'大小':>12s} {'压缩比':>8s} {'全量扫描':>14s} {'1 小时范围查询':>16s}")
+        print("-" * 64)
+
+        results = []
+        view_stats.STATS_DIR = raw_dir
+        scan_time, count = timed_read()
+        range_time, _ = timed_read(range_start, range_end)
+        results.append(('jsonl', raw_size, scan_time, count, range_time))
+
+        for codec in codecs:
+            codec_dir = work_dir / codec
+            codec_dir.mkdir()
+            shutil.copy2(raw_path, codec_dir / raw_path.name)
+            info = stats_archive.archive_day(codec_dir / raw_path.name, codec=codec,
+                                             block_size=args.block_size * 1024)
+            view_stats.STATS_DIR = codec_dir
+            scan_time, count = timed_read()
+            range_time, _ = timed_read(range_start, range_end)
+            results.append((codec, info['archive_bytes'], scan_time, count, range_time))
+
+        for name, size, scan_time, count, range_time in results:
+            print(f"{name:8s} {stats_archive.format_size(size):>12s} {size / raw_size:8.1%} "
+                  f"{count / scan_time:12,.0f}/s {range_time * 1000:13.1f} ms")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
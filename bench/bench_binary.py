@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+二进制记录存储基准测试。
+对比 JSONL 与 stats_binary 定长记录的文件大小、解码为记录字典的吞吐量，
+以及查询 API 在二进制存储上直接聚合与逐行扫描 JSONL 的耗时。
+"""
+
+import argparse
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# 允许从仓库根目录导入模块
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import gen_dataset
+import stats_archive
+import stats_binary
+import stats_codec
+from stats_api import Stats
+
+
+def best_of(func, repeat):
+    """返回 (最快耗时, 结果)"""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='二进制记录存储基准测试')
+    parser.add_argument('--records', '-n', type=int, default=200000, help='单日记录数')
+    parser.add_argument('--repeat', type=int, default=3, help='每项重复次数（取最快）')
+    args = parser.parse_args()
+
+    work_dir = Path(tempfile.mkdtemp(prefix="claude-stats-bench-"))
+    try:
+        date_str = gen_dataset.generate(work_dir, args.records, days=1)[0]
+        stats_file = work_dir / f"{date_str}.jsonl"
+
+        t0 = time.perf_counter()
+        count, json_size, binary_size = stats_binary.convert_day(work_dir, date_str)
+        convert_time = time.perf_counter() - t0
+
+        print(f"记录数：{count}，转换耗时 {convert_time:.2f}s\n")
+        print(f"JSONL      {stats_archive.format_size(json_size):>12s}")
+        print(f"二进制存储 {stats_archive.format_size(binary_size):>12s} {binary_size / json_size:8.1%}\n")
+
+        print(f"{'读取方式':24s} {'耗时':>10s} {'吞吐量':>14s}")
+        print("-" * 52)
+
+        def report(name, elapsed):
+            print(f"{name:24s} {elapsed * 1000:8.0f}ms {count / elapsed:12,.0f}/s")
+
+        lines = stats_file.read_bytes().splitlines()
+        for backend in stats_codec.available_backends():
+            elapsed, _ = best_of(lambda: [backend.decode_record(line) for line in lines], args.repeat)
+            report(f"JSONL 解码（{backend.name}）", elapsed)
+
+        data, strings = stats_binary.open_day(work_dir, date_str)
+        elapsed, _ = best_of(lambda: list(stats_binary.iter_decode(data, strings)), args.repeat)
+        report("二进制解码为字典", elapsed)
+        elapsed, _ = best_of(lambda: sum(row[6] for row in stats_binary.RECORD.iter_unpack(data)), args.repeat)
+        report("二进制 iter_unpack", elapsed)
+
+        print(f"\n{'查询 API':24s} {'二进制存储':>10s} {'扫描 JSONL':>12s} {'加速':>8s}")
+        print("-" * 58)
+        queries = [
+            ("按用户分组", lambda s: s.group_by('user')),
+            ("按工具 × 小时分组", lambda s: s.group_by('tool', 'hour')),
+            ("按会话分组", lambda s: s.group_by('session')),
+        ]
+        for name, build in queries:
+            query = build(Stats.open(work_dir)).agg('operations', 'additions', 'deletions', 'last_time')
+            binary_time, binary_rows = best_of(lambda: list(query), args.repeat)
+            (work_dir / stats_binary.BINARY_DIR_NAME).rename(work_dir / "binary-off")
+            scan_time, scan_rows = best_of(lambda: list(query), args.repeat)
+            (work_dir / "binary-off").rename(work_dir / stats_binary.BINARY_DIR_NAME)
+            same = "" if binary_rows == scan_rows else "（结果不一致！）"
+            print(f"{name:24s} {binary_time * 1000:8.0f}ms {scan_time * 1000:10.0f}ms "
+                  f"{scan_time / binary_time:7.1f}x{same}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
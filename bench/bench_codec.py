@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+JSON 编解码后端基准测试。
+对每个可用后端测量序列化、通用解析和按记录结构解码的吞吐量（条/秒）。
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+# 允许从仓库根目录导入模块
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import stats_codec
+
+
+def make_records(n):
+    """生成 n 条结构固定的样例记录"""
+    records = []
+    for i in range(n):
+        additions = (i * 7) % 120
+        deletions = (i * 3) % 40
+        records.append({
+            "timestamp": f"2026-02-02T15:{(i // 60) % 60:02d}:{i % 60:02d}+08:00",
+            "session_id": f"session-{i % 97:04d}",
+            "email": f"user{i % 5}@example.com",
+            "tool": "Edit" if i % 3 else "Write",
+            "additions": additions,
+            "deletions": deletions,
+            "net_change": additions - deletions,
+        })
+    return records
+
+
+def measure(func, items, repeat):
+    """返回最快一轮的吞吐量（条/秒）"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in items:
+            func(item)
+        best = min(best, time.perf_counter() - start)
+    return len(items) / best if best > 0 else float('inf')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='JSON 编解码后端基准测试')
+    parser.add_argument('--records', '-n', type=int, default=100000, help='每轮处理的记录数')
+    parser.add_argument('--repeat', type=int, default=3, help='重复轮数（取最快一轮）')
+    args = parser.parse_args()
+
+    records = make_records(args.records)
+
+    print(f"记录数：{args.records}，重复：{args.repeat} 轮，默认后端：{stats_codec.BACKEND_NAME}\n")
+    print(f"{'后端':10s} {'序列化':>14s} {'解析':>14s} {'结构解码':>14s}")
+    print("-" * 56)
+
+    for backend in stats_codec.available_backends():
+        lines = [backend.dumps(r) for r in records]
+        encode_rate = measure(backend.dumps, records, args.repeat)
+        parse_rate = measure(backend.loads, lines, args.repeat)
+        decode_rate = measure(backend.decode_record, lines, args.repeat)
+        print(f"{backend.name:10s} {encode_rate:12,.0f}/s {parse_rate:12,.0f}/s {decode_rate:12,.0f}/s")
+
+
+if __name__ == "__main__":
+    main()
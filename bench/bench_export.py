@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+流式导出基准测试。
+生成多天的样例数据，测量 --dump 在 jsonl / csv / json 格式下的导出吞吐量，
+并用 tracemalloc 对比导出 1 天与全部日期时的内存峰值，验证内存占用与数据量无关。
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+# 允许从仓库根目录导入模块
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import view_stats
+from bench_archive import write_day_file
+
+
+def export(fmt, from_date=None, to_date=None):
+    """导出原始记录到 /dev/null，返回 (耗时, 记录数, 内存峰值)"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    with open(os.devnull, 'w', encoding='utf-8') as out:
+        count = view_stats.write_rows(view_stats.iter_range_records(from_date, to_date), fmt,
+                                      view_stats.stats_codec.RECORD_FIELDS, out)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, count, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description='流式导出基准测试')
+    parser.add_argument('--days', type=int, default=10, help='生成的天数')
+    parser.add_argument('--records', '-n', type=int, default=50000, help='每天的记录数')
+    args = parser.parse_args()
+
+    work_dir = Path(tempfile.mkdtemp(prefix="claude-stats-bench-"))
+    try:
+        dates = [f"2026-01-{day:02d}" for day in range(1, args.days + 1)]
+        for date_str in dates:
+            write_day_file(work_dir / f"{date_str}.jsonl", args.records, date_str)
+        view_stats.STATS_DIR = work_dir
+
+        print(f"数据：{args.days} 天 × {args.records} 条\n")
+        print(f"{'格式':6s} {'范围':8s} {'记录数':>10s} {'吞吐量':>14s} {'内存峰值':>10s}")
+        print("-" * 54)
+
+        for fmt in ('jsonl', 'csv', 'json'):
+            for label, to_date in (('1 天', dates[0]), ('全部', None)):
+                elapsed, count, peak = export(fmt, dates[0], to_date)
+                print(f"{fmt:6s} {label:8s} {count:10d} {count / elapsed:12,.0f}/s {peak / 1024:8.0f} KB")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+内容指标基准测试。
+对比只统计行数的 count_lines 与 content_metrics.measure 在不同文本规模下的单次耗时，
+并估算每次 hook 调用（Edit：新旧两段文本）增加的开销，
+与进程内调用 post_stat.record() 的完整耗时和 hook 进程的启动耗时对照。
+"""
+
+import argparse
+import contextlib
+import io
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# 允许从仓库根目录导入模块
+REPO_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_DIR))
+
+import content_metrics
+import post_stat
+
+# 样例文本的一组行：代码、注释和空行混合
+SAMPLE_LINES = (
+    "def handle(request):\n",
+    "    # 解析请求参数\n",
+    "    value = request.get('value', 0)\n",
+    "\n",
+    "    return {'value': value * 2}  // 注释\n",
+    "    /* 块注释 */\n",
+)
+
+DEFAULT_SIZES = '5,50,500,5000'
+
+
+def count_lines(text):
+    """基线：只统计行数（内容指标之前 hook 的计算方式）"""
+    if not text:
+        return 0
+    return text.count('\n') + (1 if not text.endswith('\n') else 0)
+
+
+def make_text(lines):
+    """生成指定行数的样例文本"""
+    return ''.join(SAMPLE_LINES[i % len(SAMPLE_LINES)] for i in range(lines))
+
+
+def per_call_us(func, text, repeat):
+    """返回最快一轮的单次调用耗时（微秒）"""
+    number = max(1, 200000 // max(1, len(text)))
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func(text)
+        best = min(best, (time.perf_counter() - start) / number)
+    return best * 1e6
+
+
+def hook_startup_ms(repeat):
+    """启动解释器并导入 post_stat 的耗时（毫秒），即每次 hook 调用的固定开销"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', 'import post_stat'], cwd=REPO_DIR, check=True)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def record_us(repeat, calls=500):
+    """进程内调用 post_stat.record() 的单次耗时（微秒），写入临时统计目录"""
+    original_dir = post_stat.STATS_DIR
+    best = float('inf')
+    try:
+        for _ in range(repeat):
+            with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stderr(io.StringIO()):
+                post_stat.STATS_DIR = Path(tmp)
+                payload = {"session_id": "bench", "tool_input": {"___TOOL_NAME___": "Write", "content": make_text(50)}}
+                start = time.perf_counter()
+                for _ in range(calls):
+                    post_stat.record(payload, email="bench@example.com")
+                best = min(best, (time.perf_counter() - start) / calls)
+    finally:
+        post_stat.STATS_DIR = original_dir
+    return best * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description='内容指标基准测试')
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help=f'文本行数列表（默认 {DEFAULT_SIZES}）')
+    parser.add_argument('--repeat', type=int, default=5, help='重复轮数（取最快一轮）')
+    args = parser.parse_args()
+
+    print(f"{'行数':>8s} {'字节':>10s} {'count_lines':>14s} {'measure':>12s} {'每次 Edit 增加':>16s}")
+    print("-" * 66)
+
+    for size in (int(s) for s in args.sizes.split(',') if s.strip()):
+        text = make_text(size)
+        baseline = per_call_us(count_lines, text, args.repeat)
+        metrics = per_call_us(content_metrics.measure, text, args.repeat)
+        # Edit 分别计算新旧两段文本
+        extra = 2 * (metrics - baseline)
+        print(f"{size:8d} {len(text.encode('utf-8')):10,d} {baseline:12.2f}µs {metrics:10.2f}µs {extra:14.2f}µs")
+
+    print(f"\n进程内调用 post_stat.record()（50 行 Write，含写入）每次 {record_us(args.repeat):.1f} µs")
+    print(f"对比：hook 进程启动并导入 post_stat 需要 {hook_startup_ms(args.repeat):.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+查看工具基准测试套件。
+在不同数据规模（默认 10k / 1M / 10M 条）下测量 show_summary、show_history、
+show_recent 和 --list 的耗时与内存峰值。每项测量在独立子进程中运行，互不影响。
+可保存结果并与基准结果对比，超出容差时以非零状态退出，用于发现读取和聚合代码的性能回退。
+"""
+
+import argparse
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parent))
+
+CASES = ('summary', 'history', 'recent', 'list')
+DEFAULT_SIZES = '10k,1m,10m'
+DAYS = 30
+
+
+def parse_size(text):
+    """解析 10k / 1m 这样的规模"""
+    text = text.strip().lower()
+    factor = {'k': 1000, 'm': 1000000}.get(text[-1], 1)
+    return int(float(text.rstrip('km')) * factor)
+
+
+def ensure_dataset(data_root, size):
+    """生成（或复用）指定规模的数据集，返回目录"""
+    from gen_dataset import generate
+
+    data_dir = Path(data_root) / f"records-{size}"
+    marker = data_dir / ".complete"
+    today = time.strftime('%Y-%m-%d', time.gmtime(time.time() + 8 * 3600))
+    # 数据集的最后一天必须是今天，show_recent 才有数据
+    if marker.exists() and marker.read_text() == today:
+        return data_dir
+
+    print(f"正在生成 {size} 条记录...", end=" ", flush=True, file=sys.stderr)
+    for old in data_dir.glob("*.jsonl"):
+        old.unlink()
+    generate(data_dir, size, days=DAYS)
+    marker.write_text(today)
+    print("完成", file=sys.stderr)
+    return data_dir
+
+
+def peak_memory_kb():
+    """当前进程的内存峰值（KB）"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 单位为字节，Linux 为 KB
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def run_case(case, data_dir):
+    """子进程中执行单项测量，输出 JSON 结果"""
+    import view_stats
+
+    view_stats.STATS_DIR = Path(data_dir)
+    dates = view_stats.list_available_dates()
+    baseline_kb = peak_memory_kb()
+
+    real_stdout = sys.stdout
+    sys.stdout = io.StringIO() if case == 'recent' else open(os.devnull, 'w', encoding='utf-8')
+    start = time.perf_counter()
+    try:
+        if case == 'summary':
+            view_stats.show_summary(dates[-1])
+        elif case == 'history':
+            view_stats.show_history()
+        elif case == 'recent':
+            view_stats.show_recent(20)
+        elif case == 'list':
+            view_stats.show_list()
+        elapsed = time.perf_counter() - start
+    finally:
+        sys.stdout.close()
+        sys.stdout = real_stdout
+
+    print(json.dumps({'seconds': elapsed, 'peak_kb': peak_memory_kb(), 'baseline_kb': baseline_kb}))
+
+
+def measure(case, data_dir, repeat):
+    """在新进程中运行一项测量，重复 repeat 次取耗时最短的一次"""
+    best = None
+    for _ in range(repeat):
+        result = subprocess.run(
+            [sys.executable, str(Path(__file__).resolve()), '--run-case', case, str(data_dir)],
+            capture_output=True, text=True, check=True
+        )
+        result = json.loads(result.stdout.strip().splitlines()[-1])
+        if best is None or result['seconds'] < best['seconds']:
+            best = result
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='查看工具基准测试套件')
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help=f'数据规模列表（默认 {DEFAULT_SIZES}）')
+    parser.add_argument('--cases', default=','.join(CASES), help='要测量的项目')
+    parser.add_argument('--data-dir', default=str(Path(tempfile.gettempdir()) / "claude-stats-bench-data"),
+                        help='数据集缓存目录（按规模复用）')
+    parser.add_argument('--output', '-o', help='将结果保存为 JSON')
+    parser.add_argument('--baseline', help='与之前保存的结果对比')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='允许的耗时 / 内存增长比例（默认 0.2）')
+    parser.add_argument('--min-delta', type=float, default=0.05, metavar='SECONDS',
+                        help='耗时增长低于该秒数时视为噪声（默认 0.05）')
+    parser.add_argument('--repeat', type=int, default=3, help='每项重复次数（取最快一次）')
+    parser.add_argument('--run-case', nargs=2, metavar=('CASE', 'DIR'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        run_case(*args.run_case)
+        return 0
+
+    sizes = [parse_size(s) for s in args.sizes.split(',') if s.strip()]
+    cases = [c for c in args.cases.split(',') if c in CASES]
+
+    results = {}
+    print(f"{'规模':>10s} {'项目':8s} {'耗时':>10s} {'内存峰值':>12s} {'增量':>10s}")
+    print("-" * 56)
+    for size in sizes:
+        data_dir = ensure_dataset(args.data_dir, size)
+        for case in cases:
+            result = measure(case, data_dir, args.repeat)
+            results[f"{size}:{case}"] = result
+            peak = result['peak_kb']
+            delta = peak - result['baseline_kb'] if peak is not None else None
+            print(f"{size:>10,d} {case:8s} {result['seconds']:9.3f}s "
+                  f"{(f'{peak / 1024:.1f} MB') if peak else 'N/A':>12s} "
+                  f"{(f'{delta / 1024:.1f} MB') if delta is not None else 'N/A':>10s}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\n结果已保存到 {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = []
+        for key, result in results.items():
+            old = baseline.get(key)
+            if not old:
+                continue
+            slower = result['seconds'] - old['seconds']
+            if slower > args.min_delta and result['seconds'] > old['seconds'] * (1 + args.tolerance):
+                regressions.append(f"{key} 耗时 {old['seconds']:.3f}s -> {result['seconds']:.3f}s")
+            if result['peak_kb'] and old.get('peak_kb') and result['peak_kb'] > old['peak_kb'] * (1 + args.tolerance):
+                regressions.append(f"{key} 内存 {old['peak_kb']} KB -> {result['peak_kb']} KB")
+        if regressions:
+            print("\n❌ 发现性能回退：")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print("\n✓ 未发现性能回退")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+合成 code-log 数据生成器。
+按可配置的用户数、每天会话数、天数和每天记录数生成与 hook 输出格式一致的数据：
+用户活跃度、会话长度服从 Zipf 分布，编辑规模服从 Pareto 分布（大量小改动、少量大改动）。
+"""
+
+import argparse
+import random
+import sys
+from pathlib import Path
+from datetime import datetime, timedelta, timezone
+
+# 允许从仓库根目录导入模块
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import stats_codec
+
+BEIJING_TZ = timezone(timedelta(hours=8))
+
+# Write / Edit 调用比例
+WRITE_RATIO = 0.2
+
+
+def zipf_weights(n, exponent):
+    """第 k 名的权重为 1 / k^exponent"""
+    return [1.0 / (rank ** exponent) for rank in range(1, n + 1)]
+
+
+def edit_size(rng, alpha):
+    """Pareto 分布的编辑行数（至少 1 行）"""
+    return max(1, int(rng.paretovariate(alpha)))
+
+
+def make_day_records(rng, date, count, emails, user_weights, sessions_per_day, alpha):
+    """生成一天的记录（按时间排序）"""
+    # 每个会话属于一个用户，会话长度同样偏斜
+    sessions = []
+    for _ in range(sessions_per_day):
+        email = rng.choices(emails, weights=user_weights)[0]
+        sessions.append((f"{rng.getrandbits(64):016x}", email))
+    session_weights = zipf_weights(len(sessions), 1.1)
+
+    midnight = datetime(date.year, date.month, date.day, tzinfo=BEIJING_TZ)
+    offsets = sorted(rng.random() * 86400 for _ in range(count))
+    picked = rng.choices(sessions, weights=session_weights, k=count)
+
+    for offset, (session_id, email) in zip(offsets, picked):
+        if rng.random() < WRITE_RATIO:
+            tool = "Write"
+            additions = edit_size(rng, alpha) * 5
+            deletions = 0
+        else:
+            tool = "Edit"
+            old_lines = edit_size(rng, alpha)
+            new_lines = edit_size(rng, alpha)
+            additions = max(0, new_lines - old_lines)
+            deletions = max(0, old_lines - new_lines)
+            if additions == 0 and deletions == 0:
+                additions = 1
+        yield {
+            "timestamp": (midnight + timedelta(seconds=offset)).isoformat(),
+            "session_id": session_id,
+            "email": email,
+            "tool": tool,
+            "additions": additions,
+            "deletions": deletions,
+            "net_change": additions - deletions,
+        }
+
+
+def generate(out_dir, total_records, days=30, users=20, sessions_per_day=200,
+             seed=42, end_date=None, alpha=1.6):
+    """
+    生成数据集到 out_dir，最后一天默认为今天（东八区）。
+    返回生成的日期列表。
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    rng = random.Random(seed)
+
+    end_date = end_date or datetime.now(BEIJING_TZ).date()
+    emails = [f"user{i:03d}@example.com" for i in range(users)]
+    user_weights = zipf_weights(users, 1.2)
+
+    dates = [end_date - timedelta(days=days - 1 - i) for i in range(days)]
+    per_day, remainder = divmod(total_records, days)
+
+    for i, date in enumerate(dates):
+        count = per_day + (1 if i < remainder else 0)
+        path = out_dir / f"{date.strftime('%Y-%m-%d')}.jsonl"
+        with open(path, 'w', encoding='utf-8', buffering=1024 * 1024) as f:
+            for record in make_day_records(rng, date, count, emails, user_weights, sessions_per_day, alpha):
+                f.write(stats_codec.dumps(record) + '\n')
+
+    return [d.strftime('%Y-%m-%d') for d in dates]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='生成合成的 code-log 数据')
+    parser.add_argument('out', help='输出目录')
+    parser.add_argument('--records', '-n', type=int, default=100000, help='总记录数')
+    parser.add_argument('--days', type=int, default=30, help='天数（最后一天为今天）')
+    parser.add_argument('--users', type=int, default=20, help='用户数')
+    parser.add_argument('--sessions', type=int, default=200, help='每天的会话数')
+    parser.add_argument('--alpha', type=float, default=1.6, help='编辑规模 Pareto 分布参数（越小越偏斜）')
+    parser.add_argument('--seed', type=int, default=42, help='随机种子')
+    args = parser.parse_args()
+
+    dates = generate(args.out, args.records, args.days, args.users, args.sessions, args.seed, alpha=args.alpha)
+    print(f"已生成 {args.records} 条记录：{dates[0]} 至 {dates[-1]}，目录 {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+内容指标计算。
+对一段文本一次性计算行数、字节数、字符数、空行数和注释行数：
+文本只编码一次，之后的计数全部由 bytes.count、bytes.translate 等 C 层原语完成，不逐行循环。
+"""
+
+import stats_codec
+
+METRIC_FIELDS = ('lines', 'bytes', 'chars', 'blank_lines', 'comment_lines')
+
+# 记录中由本模块计算的内容字段
+DELTA_FIELDS = tuple(field for field in stats_codec.CONTENT_FIELDS if field in METRIC_FIELDS)
+
+# 行内空白（换行符除外），删除后每行的首字节就是原来第一个非空白字符
+_INLINE_WHITESPACE = b' \t\r\f\v'
+
+# 把换行符以外的所有字节映射为 x，之后 \nx 的个数就是非空行数
+_NON_NEWLINE_TO_X = bytes(b if b == ord('\n') else ord('x') for b in range(256))
+
+# 注释标记（删除空白后位于行首）；各标记互不为前缀的重复计数
+COMMENT_MARKERS = (b'#', b'//', b'/*', b'*', b'--', b'<!--')
+
+
+def measure(text):
+    """
+    计算文本的内容指标。
+    行数规则：空字符串 = 0 行，末尾无换行符的残行计为一行。
+    空行指只含空白的行；注释行指去掉缩进后以常见注释标记开头的行。
+    """
+    if not text:
+        return dict.fromkeys(METRIC_FIELDS, 0)
+
+    data = text.encode('utf-8', errors='surrogatepass')
+    lines = data.count(b'\n') + (0 if data.endswith(b'\n') else 1)
+
+    # 开头补一个换行符，使第一行与其他行一样以 \n 为行首
+    squeezed = b'\n' + data.translate(None, _INLINE_WHITESPACE)
+    non_blank = squeezed.translate(_NON_NEWLINE_TO_X).count(b'\nx')
+
+    return {
+        'lines': lines,
+        'bytes': len(data),
+        'chars': len(text),
+        'blank_lines': lines - non_blank,
+        'comment_lines': sum(squeezed.count(b'\n' + marker) for marker in COMMENT_MARKERS),
+    }
+
+
+def content_delta(old, new):
+    """两份指标之间记录到统计中的内容字段净变化（new - old）"""
+    return {field: new[field] - old[field] for field in DELTA_FIELDS}
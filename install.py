@@ -4,13 +4,15 @@ Claude Code Stats Hook 安装/更新脚本
 """
 
 import argparse
+import compileall
 import json
 import os
 import shutil
 import subprocess
 import sys
 import tempfile
-from datetime import datetime
+import time
+from datetime import datetime, timezone, timedelta
 from pathlib import Path
 
 
@@ -19,9 +21,12 @@ class Installer:
 
     REPO_URL = "https://github.com/Mark24Code/claude-code-stats-hook.git"
     DEFAULT_INSTALL_PATH = "~/.claude/hooks/claude-code-stats-hook"
+    SNAPSHOT_DIR = "code-log.snapshots"
+    DEFAULT_KEEP_SNAPSHOTS = 5
 
-    def __init__(self, custom_path=None):
+    def __init__(self, custom_path=None, keep_snapshots=DEFAULT_KEEP_SNAPSHOTS):
         self.custom_path = custom_path
+        self.keep_snapshots = keep_snapshots
         self.install_path = None
         self.temp_dir = None
 
@@ -137,6 +142,10 @@ class Installer:
 
             dest = self.install_path / item.name
 
+            # 已有的统计数据不能被仓库中的空目录覆盖
+            if item.name == 'code-log' and dest.exists():
+                continue
+
             if item.is_dir():
                 if dest.exists():
                     shutil.rmtree(dest)
@@ -155,13 +164,48 @@ class Installer:
         if os.name != 'posix':
             return
 
-        scripts = ["post_stat.py", "view_stats.py"]
+        scripts = ["post_stat.py", "hook_launcher.py", "view_stats.py", "stats_archive.py", "metrics_exporter.py",
+                   "merge_stats.py", "backfill_stats.py", "retention_stats.py", "reconcile_stats.py", "stats_binary.py"]
 
         for script in scripts:
             script_path = self.install_path / script
             if script_path.exists():
                 script_path.chmod(0o755)
 
+    def compile_modules(self):
+        """预编译安装目录下的模块，hook 启动时直接加载 __pycache__ 中的字节码"""
+        print("正在预编译模块...", end=" ", flush=True)
+        ok = compileall.compile_dir(str(self.install_path), maxlevels=0, quiet=1)
+        print("完成" if ok else "部分失败（首次运行时会自动编译）")
+
+    def measure_hook_startup(self, repeat=5):
+        """
+        测量 hook 冷启动耗时（毫秒，取最快一次）：直接运行 post_stat.py 与通过启动器运行。
+        输入为空时 hook 立即跳过，不会写入统计数据。
+        """
+        timings = {}
+        for script in ("post_stat.py", "hook_launcher.py"):
+            best = float('inf')
+            for _ in range(repeat):
+                start = time.perf_counter()
+                subprocess.run([sys.executable, str(self.install_path / script)],
+                               input=b'', capture_output=True, cwd=self.install_path)
+                best = min(best, time.perf_counter() - start)
+            timings[script] = best * 1000
+        return timings
+
+    def show_startup_timing(self):
+        """显示 hook 冷启动耗时对比"""
+        try:
+            timings = self.measure_hook_startup()
+        except OSError as e:
+            print(f"\n警告: 无法测量 hook 启动耗时 - {e}")
+            return
+        direct, launcher = timings["post_stat.py"], timings["hook_launcher.py"]
+        print("\nHook 冷启动耗时:")
+        print(f"  post_stat.py（每次从源码编译）: {direct:.1f} ms")
+        print(f"  hook_launcher.py（预编译字节码）: {launcher:.1f} ms（{launcher - direct:+.1f} ms）")
+
     def show_config_instruction(self):
         """显示配置说明"""
         print("\n" + "="*60)
@@ -180,7 +224,7 @@ class Installer:
             config = json.load(f)
 
         # 更新 hook 命令路径为用户的安装路径
-        hook_script = self.install_path / "post_stat.py"
+        hook_script = self.install_path / "hook_launcher.py"
         if "hooks" in config and "PostToolUse" in config["hooks"]:
             for hook in config["hooks"]["PostToolUse"]:
                 if "command" in hook:
@@ -200,6 +244,8 @@ class Installer:
         print("="*60)
         print(f"安装路径: {self.simplify_path(self.install_path)}")
 
+        self.show_startup_timing()
+
         print("\n下一步:")
         print("1. 按照上方配置说明，将 Hook 添加到 .claude/settings.local.json")
         print(f"2. 使用 Claude Code 时会自动记录统计信息")
@@ -212,6 +258,146 @@ class Installer:
         install_script = Path(__file__).resolve()
         print(f"  更新: python {self.simplify_path(install_script)} update")
 
+    def locate_installation(self):
+        """定位已有的安装（update / restore 使用），不存在时退出"""
+        if self.custom_path:
+            install_path = self.expand_path(self.custom_path)
+        else:
+            install_path = self.expand_path(self.DEFAULT_INSTALL_PATH)
+
+        if not install_path.exists():
+            print(f"错误: 未找到安装，请先运行 install 命令")
+            print(f"检查路径: {self.simplify_path(install_path)}")
+            sys.exit(1)
+
+        self.install_path = install_path
+
+    def list_snapshots(self):
+        """按时间顺序列出已完成的快照目录"""
+        snapshot_root = self.install_path / self.SNAPSHOT_DIR
+        if not snapshot_root.exists():
+            return []
+        return sorted(p for p in snapshot_root.iterdir() if p.is_dir() and not p.name.startswith('.'))
+
+    @staticmethod
+    def is_closed_day_file(relative_path, today):
+        """是否为今天之前的日期文件（原始文件、归档或索引），这些文件通常不再变化"""
+        if len(relative_path.parts) != 1:
+            return False
+        date_str = relative_path.name.split('.', 1)[0]
+        try:
+            datetime.strptime(date_str, "%Y-%m-%d")
+        except ValueError:
+            return False
+        return date_str < today
+
+    def snapshot_data(self, prune=True):
+        """
+        为 code-log 创建增量快照。
+        今天之前的日期文件如果与上一个快照中的副本大小和修改时间相同，直接硬链接该副本；
+        今天的文件、有变化的文件和其他状态文件才复制。
+        快照先写入临时目录，完成后再改名，中途失败不会留下不完整的快照。
+        prune 为 True 时随后清理超出保留数量的旧快照。
+
+        返回：(快照目录, 硬链接文件数, 复制文件数)，没有数据时返回 (None, 0, 0)
+        """
+        log_dir = self.install_path / "code-log"
+        if not log_dir.exists() or not any(log_dir.iterdir()):
+            return None, 0, 0
+
+        snapshot_root = self.install_path / self.SNAPSHOT_DIR
+        snapshot_root.mkdir(exist_ok=True)
+        snapshots = self.list_snapshots()
+        previous = snapshots[-1] if snapshots else None
+
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        target = snapshot_root / timestamp
+        suffix = 1
+        # 同一秒内的多个快照加序号，保证名称按时间排序
+        while target.exists() or (previous is not None and target.name <= previous.name):
+            target = snapshot_root / f"{timestamp}_{suffix:02d}"
+            suffix += 1
+        partial = snapshot_root / f".{target.name}.partial"
+        if partial.exists():
+            shutil.rmtree(partial)
+
+        today = datetime.now(timezone(timedelta(hours=8))).strftime("%Y-%m-%d")
+        linked = copied = 0
+
+        for src in sorted(log_dir.rglob('*')):
+            relative_path = src.relative_to(log_dir)
+            dest = partial / relative_path
+            if src.is_dir():
+                dest.mkdir(parents=True, exist_ok=True)
+                continue
+            dest.parent.mkdir(parents=True, exist_ok=True)
+
+            if previous is not None and self.is_closed_day_file(relative_path, today):
+                old = previous / relative_path
+                try:
+                    src_stat, old_stat = src.stat(), old.stat()
+                    if src_stat.st_size == old_stat.st_size and src_stat.st_mtime_ns == old_stat.st_mtime_ns:
+                        os.link(old, dest)
+                        linked += 1
+                        continue
+                except OSError:
+                    # 上一个快照中没有该文件，或文件系统不支持硬链接
+                    pass
+
+            shutil.copy2(src, dest)
+            copied += 1
+
+        partial.rename(target)
+        if prune:
+            self.prune_snapshots()
+        return target, linked, copied
+
+    def prune_snapshots(self):
+        """只保留最近 keep_snapshots 个快照（硬链接的文件在最后一个引用删除后才释放空间）"""
+        snapshots = self.list_snapshots()
+        for old in snapshots[:max(0, len(snapshots) - self.keep_snapshots)]:
+            shutil.rmtree(old)
+
+    def restore(self, snapshot_name=None):
+        """从快照恢复 code-log（默认最近一个），恢复前为当前数据创建快照"""
+        self.locate_installation()
+        snapshots = self.list_snapshots()
+
+        if not snapshots:
+            print(f"错误: 没有可用的快照: {self.simplify_path(self.install_path / self.SNAPSHOT_DIR)}")
+            sys.exit(1)
+
+        if snapshot_name:
+            matches = [p for p in snapshots if p.name == snapshot_name]
+            if not matches:
+                print(f"错误: 未找到快照 {snapshot_name}，可用的快照:")
+                for p in snapshots:
+                    print(f"  {p.name}")
+                sys.exit(1)
+            source = matches[0]
+        else:
+            source = snapshots[-1]
+
+        print(f"正在从快照 {source.name} 恢复数据...")
+
+        # 当前数据先做一次快照，恢复错了还能找回（恢复完成后再清理，避免要恢复的快照先被删除）
+        current, _, _ = self.snapshot_data(prune=False)
+        if current:
+            print(f"当前数据已保存为快照: {current.name}")
+
+        # 复制（而不是硬链接）快照内容，之后对 code-log 的写入不会改动快照
+        log_dir = self.install_path / "code-log"
+        restoring = self.install_path / "code-log.restoring"
+        if restoring.exists():
+            shutil.rmtree(restoring)
+        shutil.copytree(source, restoring)
+        if log_dir.exists():
+            shutil.rmtree(log_dir)
+        restoring.rename(log_dir)
+        self.prune_snapshots()
+
+        print(f"恢复完成: {self.simplify_path(log_dir)}")
+
     def cleanup(self):
         """清理临时文件"""
         if self.temp_dir and Path(self.temp_dir).exists():
@@ -223,6 +409,7 @@ class Installer:
             self.choose_install_path()
             self.clone_repo()
             self.copy_files()
+            self.compile_modules()
             self.set_permissions()
             self.show_config_instruction()
             self.verify_installation()
@@ -231,38 +418,21 @@ class Installer:
 
     def update(self):
         """执行更新"""
-        # 检测安装
-        if self.custom_path:
-            install_path = self.expand_path(self.custom_path)
-        else:
-            install_path = self.expand_path(self.DEFAULT_INSTALL_PATH)
-
-        if not install_path.exists():
-            print(f"错误: 未找到安装，请先运行 install 命令")
-            print(f"检查路径: {self.simplify_path(install_path)}")
-            sys.exit(1)
-
-        self.install_path = install_path
+        self.locate_installation()
         print(f"更新路径: {self.simplify_path(self.install_path)}\n")
 
         try:
-            # 备份数据
-            log_dir = self.install_path / "code-log"
-            backup_log_dir = None
-
-            if log_dir.exists() and any(log_dir.iterdir()):
-                print("正在备份数据...", end=" ", flush=True)
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                backup_log_dir = self.install_path / f"code-log.backup.{timestamp}"
-                shutil.copytree(log_dir, backup_log_dir)
-                print("完成")
+            # 增量快照数据
+            print("正在创建数据快照...", end=" ", flush=True)
+            snapshot, linked, copied = self.snapshot_data()
+            print(f"完成（复制 {copied} 个文件，硬链接 {linked} 个未变化的文件）" if snapshot else "无数据，跳过")
 
             # 获取最新代码
             self.clone_repo()
 
             # 删除旧文件（保留 code-log 和配置）
             for item in self.install_path.iterdir():
-                if item.name in ['code-log', 'settings.local.json']:
+                if item.name in ['code-log', 'settings.local.json', 'config.json', self.SNAPSHOT_DIR]:
                     continue
                 if item.name.startswith('code-log.backup.'):
                     continue
@@ -272,14 +442,9 @@ class Installer:
                 else:
                     item.unlink()
 
-            # 复制新文件
+            # 复制新文件（不会覆盖已有的 code-log）
             self.copy_files()
-
-            # 恢复数据（如果备份了）
-            if backup_log_dir:
-                if log_dir.exists():
-                    shutil.rmtree(log_dir)
-                shutil.copytree(backup_log_dir, log_dir)
+            self.compile_modules()
 
             # 设置权限
             self.set_permissions()
@@ -290,15 +455,30 @@ class Installer:
             print("="*60)
             print(f"安装路径: {self.simplify_path(self.install_path)}")
 
-            if backup_log_dir:
-                print(f"数据备份: {self.simplify_path(backup_log_dir)}")
+            if snapshot:
+                print(f"数据快照: {self.simplify_path(snapshot)}")
+                print(f"恢复快照: python {self.simplify_path(self.install_path / 'install.py')} restore")
+
+            self.show_startup_timing()
 
             print("\n注意: 配置文件未改动")
+            print("      Hook 命令可改为 hook_launcher.py 以使用预编译字节码（原 post_stat.py 仍可用）")
 
         finally:
             self.cleanup()
 
 
+def snapshot_count(value):
+    """--keep 的取值：至少保留 1 个快照（否则 update 刚创建的快照会被立即清理）"""
+    try:
+        count = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"不是整数: {value}")
+    if count < 1:
+        raise argparse.ArgumentTypeError(f"至少保留 1 个快照: {value}")
+    return count
+
+
 def main():
     """主函数"""
     parser = argparse.ArgumentParser(
@@ -320,6 +500,13 @@ def main():
 
   # 更新指定路径的安装
   python install.py update --path /custom/path
+
+  # 更新时只保留最近 10 个数据快照
+  python install.py update --keep 10
+
+  # 从最近的快照恢复数据（或用 --snapshot 指定）
+  python install.py restore
+  python install.py restore --snapshot 20260201_093000
         """
     )
 
@@ -327,8 +514,8 @@ def main():
         'command',
         nargs='?',  # 可选参数
         default='install',  # 默认为 install
-        choices=['install', 'update'],
-        help='命令: install (安装，默认) 或 update (更新)'
+        choices=['install', 'update', 'restore'],
+        help='命令: install (安装，默认)、update (更新) 或 restore (从快照恢复数据)'
     )
 
     parser.add_argument(
@@ -336,8 +523,24 @@ def main():
         help='自定义安装路径（可选）'
     )
 
+    parser.add_argument(
+        '--keep',
+        type=snapshot_count,
+        default=Installer.DEFAULT_KEEP_SNAPSHOTS,
+        help=f'保留的数据快照数量（默认 {Installer.DEFAULT_KEEP_SNAPSHOTS}）'
+    )
+
+    parser.add_argument(
+        '--snapshot',
+        help='restore 使用的快照名称（默认最近一个）'
+    )
+
     args = parser.parse_args()
 
+    if args.command == 'restore':
+        Installer(custom_path=args.path, keep_snapshots=args.keep).restore(args.snapshot)
+        return
+
     # 检查 git 是否可用
     try:
         subprocess.run(['git', '--version'], capture_output=True, check=True)
@@ -345,7 +548,7 @@ def main():
         print("错误: 未找到 git 命令，请先安装 git")
         sys.exit(1)
 
-    installer = Installer(custom_path=args.path)
+    installer = Installer(custom_path=args.path, keep_snapshots=args.keep)
 
     if args.command == 'install':
         installer.install()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+多台机器统计目录合并工具。
+把多个 code-log 目录按天合并到一个目录：每天的各来源文件按时间戳流式 k 路归并，
+按稳定记录 ID 去除重复拷贝的记录，不同日期在进程池中并行处理。
+合并结果与 code-log 布局相同，可用 view_stats.py --dir 查询。
+"""
+
+import heapq
+import os
+import sys
+from pathlib import Path
+from collections import OrderedDict
+
+import stats_archive
+import stats_codec
+import view_stats
+
+# 去重时记住的最近记录 ID 数量。重复拷贝的记录时间戳相同，归并后彼此相邻，
+# 有限窗口即可覆盖，内存占用与数据量无关
+DEDUP_WINDOW = 4096
+
+
+def collect_dates(source_dirs):
+    """日期 -> 包含该日期数据的来源目录列表"""
+    dates = {}
+    for stats_dir in source_dirs:
+        for date_str in view_stats.list_available_dates(stats_dir):
+            dates.setdefault(date_str, []).append(str(stats_dir))
+    return dates
+
+
+def merge_day(date_str, source_dirs, out_dir):
+    """
+    合并一天的数据并写入 out_dir/YYYY-MM-DD.jsonl。
+    各来源文件按追加顺序基本有序，heapq.merge 只需各持有一条记录即可流式归并。
+
+    返回：(写入记录数, 丢弃的重复记录数)
+    """
+    out_dir = Path(out_dir)
+    # 来源目录只读取，不写入校验位置和隔离文件
+    streams = [view_stats.iter_stats_file(date_str, stats_dir=d, persist=False) for d in source_dirs]
+    merged = heapq.merge(*streams, key=lambda r: r.get('timestamp', ''))
+
+    out_path = out_dir / f"{date_str}.jsonl"
+    tmp_path = out_dir / f"{date_str}.jsonl.part"
+
+    recent_ids = OrderedDict()
+    written = 0
+    duplicates = 0
+
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for record in merged:
+            rid = stats_codec.record_id(record)
+            if rid in recent_ids:
+                duplicates += 1
+                continue
+            recent_ids[rid] = None
+            if len(recent_ids) > DEDUP_WINDOW:
+                recent_ids.popitem(last=False)
+            f.write(stats_codec.dumps(record) + '\n')
+            written += 1
+
+    os.replace(tmp_path, out_path)
+    remove_archives(date_str, out_dir)
+
+    return written, duplicates
+
+
+def remove_archives(date_str, out_dir):
+    """删除该日期旧的归档及其索引（已被新写入的 .jsonl 取代）"""
+    for suffix in stats_archive.ARCHIVE_SUFFIXES:
+        old_archive = Path(out_dir) / f"{date_str}.jsonl{suffix}"
+        if old_archive.exists():
+            old_archive.unlink()
+            stats_archive.index_path(old_archive).unlink(missing_ok=True)
+
+
+def _merge_task(args):
+    """进程池任务入口"""
+    date_str, source_dirs, out_dir = args
+    return date_str, len(source_dirs), merge_day(date_str, source_dirs, out_dir)
+
+
+def merge_dirs(source_dirs, out_dir, workers=None):
+    """
+    合并多个统计目录到 out_dir。
+    out_dir 中已有的数据同样作为来源参与合并，因此重复执行结果不变。
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    sources = [Path(d).resolve() for d in source_dirs]
+    if out_dir.resolve() not in sources:
+        sources.append(out_dir.resolve())
+
+    dates = collect_dates(sources)
+    tasks = [(date_str, dirs, str(out_dir)) for date_str, dirs in sorted(dates.items())]
+    if not tasks:
+        return []
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    workers = min(workers or os.cpu_count() or 1, len(tasks))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_merge_task, tasks))
+
+
+def main():
+    """主函数"""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='合并多个 code-log 目录（按时间归并并去重）',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+示例：
+  %(prog)s merged/ alice/code-log bob/code-log     # 合并两台机器的数据到 merged/
+  %(prog)s merged/ */code-log --workers 8          # 使用 8 个进程
+  python view_stats.py --dir merged/ --history     # 查询合并结果
+        """
+    )
+
+    parser.add_argument('output', help='合并结果目录（已有数据会一并合并）')
+    parser.add_argument('sources', nargs='+', help='要合并的 code-log 目录')
+    parser.add_argument('--workers', '-j', type=int, help='并行进程数（默认 CPU 核数）')
+
+    args = parser.parse_args()
+
+    for source in args.sources:
+        if not Path(source).is_dir():
+            print(f"错误：目录不存在: {source}", file=sys.stderr)
+            sys.exit(1)
+
+    results = merge_dirs(args.sources, args.output, args.workers)
+    if not results:
+        print("没有找到任何统计记录")
+        return
+
+    total_written = 0
+    total_duplicates = 0
+    for date_str, source_count, (written, duplicates) in results:
+        print(f"{date_str}: {source_count} 个来源 | 写入 {written} 条 | 去重 {duplicates} 条")
+        total_written += written
+        total_duplicates += duplicates
+
+    print(f"\n共合并 {len(results)} 天：写入 {total_written} 条记录，去除 {total_duplicates} 条重复记录")
+    print(f"查询：python view_stats.py --dir {args.output} --history")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\n\n已取消", file=sys.stderr)
+        sys.exit(130)
+    except Exception as e:
+        print(f"错误：{e}", file=sys.stderr)
+        import traceback
+        traceback.print_exc(file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+"""
+本地 Prometheus 指标导出服务。
+后台增量读取每天的统计文件（只读取上次位置之后新追加的完整行），
+在内存中维护按用户和工具划分的计数器，以 Prometheus 文本格式提供 /metrics。
+读取位置和计数器定期写入检查点文件，重启后从检查点继续，不会重复计数。
+"""
+
+import os
+import socket
+import sys
+import threading
+import time
+from pathlib import Path
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import stats_archive
+import stats_codec
+import view_stats
+
+# 路径配置
+SCRIPT_DIR = Path(__file__).resolve().parent
+STATS_DIR = SCRIPT_DIR / "code-log"
+
+# 只允许监听本机地址
+LOCAL_HOSTS = ('127.0.0.1', '::1', 'localhost')
+DEFAULT_PORT = 9477
+DEFAULT_INTERVAL = 5.0
+
+CHECKPOINT_NAME = ".exporter-state.json"
+CHECKPOINT_VERSION = 1
+
+METRIC_PREFIX = "claude_code_stats"
+
+# 一次读取中检测到文件被重写后重新读取的最多次数
+REWRITE_RETRIES = 3
+
+# 计数器名称 -> 说明
+COUNTERS = {
+    'additions': '新增行数',
+    'deletions': '删除行数',
+    'operations': '记录的工具调用次数',
+}
+
+
+def escape_label(value):
+    """转义 Prometheus 标签值"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class MetricsState:
+    """
+    内存中的计数器和各文件的读取位置。
+    所有修改都在锁内进行，HTTP 线程渲染时读取一致的快照。
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # (用户, 工具) -> {additions, deletions, net_change, operations}
+        self.counters = defaultdict(lambda: dict.fromkeys(('additions', 'deletions', 'net_change', 'operations'), 0))
+        # 文件名 -> {'offset': 已处理字节数, 'ino': inode} 或 {'archived': True}
+        self.files = {}
+        self.last_poll = 0.0
+        self.dirty = False
+
+    def apply(self, record):
+        """累加一条记录（调用方持有锁；采样记录按权重计入，汇总行按其操作数计入）"""
+        stats = self.counters[(record.get('email', 'unknown'), record.get('tool', 'Unknown'))]
+        w = record.get('weight', 1)
+        stats['additions'] += w * record['additions']
+        stats['deletions'] += w * record['deletions']
+        stats['net_change'] += w * record['net_change']
+        stats['operations'] += record.get('operations', w)
+        self.dirty = True
+
+    def reset(self):
+        """清空计数器和读取位置（检测到文件被重写时调用）"""
+        self.counters.clear()
+        self.files.clear()
+        self.dirty = True
+
+    def render(self):
+        """生成 Prometheus 文本格式"""
+        with self.lock:
+            snapshot = {key: dict(stats) for key, stats in self.counters.items()}
+            tracked = len(self.files)
+            last_poll = self.last_poll
+
+        lines = []
+        for name, help_text in COUNTERS.items():
+            metric = f"{METRIC_PREFIX}_{name}_total"
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} counter")
+            for (email, tool), stats in sorted(snapshot.items()):
+                lines.append(f'{metric}{{user="{escape_label(email)}",tool="{escape_label(tool)}"}} {stats[name]}')
+
+        # 净变化可能减少，只能作为 gauge
+        metric = f"{METRIC_PREFIX}_net_change"
+        lines.append(f"# HELP {metric} 累计净变化行数")
+        lines.append(f"# TYPE {metric} gauge")
+        for (email, tool), stats in sorted(snapshot.items()):
+            lines.append(f'{metric}{{user="{escape_label(email)}",tool="{escape_label(tool)}"}} {stats["net_change"]}')
+
+        lines.append(f"# HELP {METRIC_PREFIX}_tracked_files 已跟踪的日期文件数")
+        lines.append(f"# TYPE {METRIC_PREFIX}_tracked_files gauge")
+        lines.append(f"{METRIC_PREFIX}_tracked_files {tracked}")
+        lines.append(f"# HELP {METRIC_PREFIX}_last_poll_timestamp_seconds 最近一次读取文件的时间")
+        lines.append(f"# TYPE {METRIC_PREFIX}_last_poll_timestamp_seconds gauge")
+        lines.append(f"{METRIC_PREFIX}_last_poll_timestamp_seconds {last_poll:.3f}")
+        return '\n'.join(lines) + '\n'
+
+    def to_checkpoint(self):
+        """序列化为检查点（调用方持有锁）"""
+        return {
+            'version': CHECKPOINT_VERSION,
+            'files': self.files,
+            'counters': [[email, tool, stats] for (email, tool), stats in self.counters.items()],
+        }
+
+    def load_checkpoint(self, data):
+        """从检查点恢复，版本不符时忽略"""
+        if data.get('version') != CHECKPOINT_VERSION:
+            return
+        self.files = dict(data.get('files', {}))
+        for email, tool, stats in data.get('counters', []):
+            self.counters[(email, tool)].update(stats)
+
+
+class FileRewritten(Exception):
+    """已跟踪的文件被替换或截断"""
+
+
+class DayFileTailer:
+    """增量读取统计目录中的日期文件"""
+
+    def __init__(self, stats_dir, state, checkpoint_path):
+        self.stats_dir = Path(stats_dir)
+        self.state = state
+        self.checkpoint_path = Path(checkpoint_path)
+
+    def load(self):
+        """读取检查点（不存在或损坏时从头开始）"""
+        try:
+            with open(self.checkpoint_path, 'rb') as f:
+                data = stats_codec.loads(f.read())
+        except (OSError, ValueError):
+            return
+        with self.state.lock:
+            self.state.load_checkpoint(data)
+
+    def save(self):
+        """原子写入检查点"""
+        with self.state.lock:
+            if not self.state.dirty:
+                return
+            payload = stats_codec.dumps(self.state.to_checkpoint())
+            self.state.dirty = False
+        tmp_path = self.checkpoint_path.with_name(self.checkpoint_path.name + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(payload)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def _tail_raw(self, path):
+        """读取原始文件中上次位置之后新增的完整行"""
+        entry = self.state.files.get(path.name)
+
+        with view_stats.MappedStatsFile(path) as mapped:
+            if entry is not None and (entry.get('ino') != mapped.ino or mapped.size < entry.get('offset', 0)):
+                # 文件被替换或截断（例如合并、回填重写），已累加的值无法撤销，整体重建
+                raise FileRewritten(path)
+
+            # 只处理到最后一个换行符，末尾未写完的行留到下次
+            offset = entry['offset'] if entry else 0
+            complete = mapped.complete_size()
+            if complete <= offset:
+                return
+            # 与查看工具相同的容错解析：跳过损坏的行，找回拼接在残行后面的记录
+            records = list(view_stats.scan_spans(mapped, offset, complete))
+            ino = mapped.ino
+
+        with self.state.lock:
+            for record in records:
+                self.state.apply(record)
+            self.state.files[path.name] = {'offset': complete, 'ino': ino}
+            self.state.dirty = True
+
+    def _load_archived(self, date_str):
+        """首次遇到只有归档的日期时完整读取一次"""
+        records = list(view_stats.iter_stats_file(date_str, stats_dir=self.stats_dir))
+        with self.state.lock:
+            for record in records:
+                self.state.apply(record)
+            self.state.files[f"{date_str}.jsonl"] = {'archived': True}
+            self.state.dirty = True
+
+    def poll(self):
+        """
+        检查所有日期文件并读取新增内容。
+        检测到文件被重写时清空计数器重新读取，最多 REWRITE_RETRIES 次（文件在读取期间被反复重写时留到下次）。
+        """
+        for attempt in range(REWRITE_RETRIES):
+            try:
+                self._poll_once()
+                break
+            except FileRewritten as e:
+                print(f"检测到文件被重写：{e}，重新计算全部计数器", file=sys.stderr)
+                with self.state.lock:
+                    self.state.reset()
+
+        with self.state.lock:
+            self.state.last_poll = time.time()
+
+    def _poll_once(self):
+        for date_str in view_stats.list_available_dates(self.stats_dir):
+            path = stats_archive.find_day_file(date_str, self.stats_dir)
+            if path is None:
+                continue
+            if stats_archive.archive_codec(path):
+                # 已跟踪的日期归档后内容不变，无需处理
+                if f"{date_str}.jsonl" not in self.state.files:
+                    self._load_archived(date_str)
+            else:
+                self._tail_raw(path)
+
+    def run(self, interval, stop_event):
+        """后台循环：读取、保存检查点、等待"""
+        while not stop_event.is_set():
+            try:
+                self.poll()
+                self.save()
+            except Exception as e:
+                print(f"错误：读取统计文件失败 - {e}", file=sys.stderr)
+            stop_event.wait(interval)
+
+
+def make_handler(state):
+    """创建绑定到指定状态的请求处理类"""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?', 1)[0] == '/metrics':
+                body = state.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            else:
+                body = b'claude-code-stats exporter: see /metrics\n'
+                self.send_response(404)
+                self.send_header('Content-Type', 'text/plain; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # 不输出每个请求的访问日志
+            pass
+
+    return MetricsHandler
+
+
+def main():
+    """主函数"""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='本地 Prometheus 指标导出服务',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+示例：
+  %(prog)s                     # 在 127.0.0.1:9477 提供 /metrics
+  %(prog)s --port 9500         # 指定端口
+  %(prog)s --interval 2        # 每 2 秒读取一次新增记录
+        """
+    )
+
+    parser.add_argument('--host', default='127.0.0.1', choices=LOCAL_HOSTS, help='监听地址（仅限本机）')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f'监听端口（默认 {DEFAULT_PORT}）')
+    parser.add_argument('--interval', type=float, default=DEFAULT_INTERVAL, help='读取新增记录的间隔秒数')
+    parser.add_argument('--dir', help='统计目录（默认 code-log）')
+    parser.add_argument('--state', help=f'检查点文件（默认 <统计目录>/{CHECKPOINT_NAME}）')
+
+    args = parser.parse_args()
+
+    stats_dir = Path(args.dir) if args.dir else STATS_DIR
+    if not stats_dir.exists():
+        print(f"错误：统计目录不存在: {stats_dir}", file=sys.stderr)
+        sys.exit(1)
+
+    state = MetricsState()
+    tailer = DayFileTailer(stats_dir, state, args.state or stats_dir / CHECKPOINT_NAME)
+    tailer.load()
+    tailer.poll()
+    tailer.save()
+
+    stop_event = threading.Event()
+    worker = threading.Thread(target=tailer.run, args=(args.interval, stop_event), daemon=True)
+    worker.start()
+
+    if args.host == '::1':
+        ThreadingHTTPServer.address_family = socket.AF_INET6
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(state))
+    print(f"指标服务已启动：http://{args.host}:{args.port}/metrics", file=sys.stderr)
+
+    try:
+        server.serve_forever()
+    finally:
+        stop_event.set()
+        worker.join()
+        tailer.save()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\n\n已停止", file=sys.stderr)
+        sys.exit(0)
+    except Exception as e:
+        print(f"错误：{e}", file=sys.stderr)
+        import traceback
+        traceback.print_exc(file=sys.stderr)
+        sys.exit(1)
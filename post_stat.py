@@ -5,7 +5,7 @@
 无 git 依赖 - 支持并发 agents。
 """
 
-import json
+import os
 import sys
 import time
 import platform
@@ -13,6 +13,12 @@ import subprocess
 from pathlib import Path
 from datetime import datetime, timezone, timedelta
 
+import content_metrics
+import stats_churn
+import stats_codec
+import stats_counters
+import stats_dedup
+
 # 根据平台导入相应的文件锁模块
 PLATFORM = platform.system()
 if PLATFORM == 'Windows':
@@ -23,6 +29,12 @@ else:
 # 路径配置（跨平台兼容）
 SCRIPT_DIR = Path(__file__).resolve().parent
 STATS_DIR = SCRIPT_DIR / "code-log"  # 统计数据目录
+CONFIG_FILE = SCRIPT_DIR / "config.json"  # 可选配置（预算、锁等待时间等）
+SPILL_DIR_NAME = ".spill"  # 等不到锁时记录暂存的目录（位于统计目录下）
+CLAIMED_SUFFIX = ".claimed"  # 正在回写的暂存文件的后缀（回写中途退出时据此恢复）
+
+# 等待文件锁的默认最长时间（秒），可在 config.json 中用 lock_timeout 修改
+DEFAULT_LOCK_TIMEOUT = 2.0
 
 # Hook 名称（用于日志输出）
 HOOK_NAME = "stats-hook"
@@ -38,6 +50,31 @@ def get_today_stats_file():
     return STATS_DIR / f"{date_str}.jsonl"
 
 
+def parse_hook_input(data):
+    """
+    从 hook 的 JSON 输入（已解析的字典）中提取工具信息。
+    返回包含 tool_name、tool_input 和 session_id 的字典。
+    """
+    if not isinstance(data, dict):
+        raise ValueError("hook 输入不是 JSON 对象")
+
+    # 提取工具信息
+    tool_input = data.get('tool_input', {})
+    tool_name = tool_input.get('___TOOL_NAME___') or data.get('tool_name', 'Unknown')
+
+    # 提取 session ID（如果没有则生成一个）
+    session_id = data.get('session_id') or str(int(time.time()))
+
+    print(f"[{HOOK_NAME}] 接收到工具调用：{tool_name}", file=sys.stderr)
+
+    return {
+        'tool_name': tool_name,
+        'tool_input': tool_input,
+        'session_id': session_id,
+        'raw_data': data
+    }
+
+
 def read_hook_input():
     """
     从 stdin 读取 Claude Code hook 输入。
@@ -53,24 +90,8 @@ def read_hook_input():
             print(f"[{HOOK_NAME}] 警告：stdin 为空，未接收到数据", file=sys.stderr)
             return None
 
-        data = json.loads(raw_data)
-
-        # 提取工具信息
-        tool_input = data.get('tool_input', {})
-        tool_name = tool_input.get('___TOOL_NAME___') or data.get('tool_name', 'Unknown')
-
-        # 提取 session ID（如果没有则生成一个）
-        session_id = data.get('session_id') or str(int(time.time()))
-
-        print(f"[{HOOK_NAME}] 接收到工具调用：{tool_name}", file=sys.stderr)
-
-        return {
-            'tool_name': tool_name,
-            'tool_input': tool_input,
-            'session_id': session_id,
-            'raw_data': data
-        }
-    except json.JSONDecodeError as e:
+        return parse_hook_input(stats_codec.loads(raw_data))
+    except ValueError as e:
         print(f"[{HOOK_NAME}] 错误：解析 JSON 失败 - {e}", file=sys.stderr)
         return None
     except Exception as e:
@@ -101,65 +122,98 @@ def get_git_user_email():
     return "unknown"
 
 
-def count_lines(text):
-    """
-    统计文本字符串中的行数。
-    空字符串 = 0 行，无换行符的非空字符串 = 1 行。
-    """
-    if not text:
-        return 0
-    # 统计换行符数量 + 1（如果最后一行没有换行符）
-    return text.count('\n') + (1 if text and not text.endswith('\n') else 0)
-
-
 def calculate_stats_from_tool_input(tool_name, tool_input):
     """
     直接从工具参数计算统计信息。
+    行数之外还通过 content_metrics 计算字节、字符、空行和注释行的净变化。
 
-    返回：(additions, deletions, net_change)
+    返回：(additions, deletions, net_change, content)，content 为内容字段净变化的字典
+    （其他工具为空字典）
     """
     if tool_name == 'Write':
-        # Write 工具：统计新内容的行数
-        content = tool_input.get('content', '')
-        lines = count_lines(content)
-        return lines, 0, lines
+        # Write 工具：统计新内容
+        metrics = content_metrics.measure(tool_input.get('content', ''))
+        lines = metrics['lines']
+        return lines, 0, lines, content_metrics.content_delta(content_metrics.measure(''), metrics)
 
     elif tool_name == 'Edit':
         # Edit 工具：比较旧字符串和新字符串
-        old_str = tool_input.get('old_string', '')
-        new_str = tool_input.get('new_string', '')
+        old_metrics = content_metrics.measure(tool_input.get('old_string', ''))
+        new_metrics = content_metrics.measure(tool_input.get('new_string', ''))
 
-        old_lines = count_lines(old_str)
-        new_lines = count_lines(new_str)
+        old_lines = old_metrics['lines']
+        new_lines = new_metrics['lines']
 
         additions = max(0, new_lines - old_lines)
         deletions = max(0, old_lines - new_lines)
         net_change = new_lines - old_lines
 
-        return additions, deletions, net_change
+        return additions, deletions, net_change, content_metrics.content_delta(old_metrics, new_metrics)
 
-    return 0, 0, 0
+    return 0, 0, 0, {}
 
 
-def lock_file(file_obj):
+def measure_churn(tool_name, tool_input):
+    """
+    重复写入的行数：本次新增的行中此前在同一文件写入或删除过的行数（见 stats_churn）。
+    指纹库读写失败时输出警告并返回 0，不影响记录。
+    """
+    file_path = tool_input.get('file_path')
+    if not file_path:
+        return 0
+    if tool_name == 'Write':
+        old_text, new_text = '', tool_input.get('content', '')
+    elif tool_name == 'Edit':
+        old_text, new_text = tool_input.get('old_string', ''), tool_input.get('new_string', '')
+    else:
+        return 0
+    try:
+        return stats_churn.FingerprintStore(STATS_DIR).observe(file_path, old_text, new_text)
+    except OSError as e:
+        print(f"[{HOOK_NAME}] 警告：更新行指纹失败 - {e}", file=sys.stderr)
+        return 0
+
+
+def lock_file(file_obj, timeout=None):
     """
     跨平台文件锁定（排他锁）。
     Windows 使用 msvcrt，Unix-like 系统使用 fcntl。
+    timeout 为 None 时一直等待；否则以非阻塞方式重试（间隔逐步加长到 50ms），
+    超过 timeout 秒仍未获得锁时返回 False。
     """
-    if PLATFORM == 'Windows':
-        # Windows 平台：使用 msvcrt.locking
-        # 锁定从当前位置开始的 1 字节（对于追加模式足够）
-        # LK_LOCK 会阻塞直到获得锁
-        file_obj.seek(0, 2)  # 移动到文件末尾
+    if timeout is None:
+        if PLATFORM == 'Windows':
+            # Windows 平台：使用 msvcrt.locking
+            # 锁定从当前位置开始的 1 字节（对于追加模式足够）
+            # LK_LOCK 会阻塞直到获得锁
+            file_obj.seek(0, 2)  # 移动到文件末尾
+            try:
+                msvcrt.locking(file_obj.fileno(), msvcrt.LK_LOCK, 1)
+            except OSError:
+                # 如果锁定失败，等待一小段时间后重试
+                time.sleep(0.01)
+                msvcrt.locking(file_obj.fileno(), msvcrt.LK_LOCK, 1)
+        else:
+            # Unix-like 平台：使用 fcntl.flock
+            fcntl.flock(file_obj.fileno(), fcntl.LOCK_EX)
+        return True
+
+    deadline = time.monotonic() + timeout
+    delay = 0.001
+    while True:
         try:
-            msvcrt.locking(file_obj.fileno(), msvcrt.LK_LOCK, 1)
+            if PLATFORM == 'Windows':
+                file_obj.seek(0, 2)
+                msvcrt.locking(file_obj.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                fcntl.flock(file_obj.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
         except OSError:
-            # 如果锁定失败，等待一小段时间后重试
-            time.sleep(0.01)
-            msvcrt.locking(file_obj.fileno(), msvcrt.LK_LOCK, 1)
-    else:
-        # Unix-like 平台：使用 fcntl.flock
-        fcntl.flock(file_obj.fileno(), fcntl.LOCK_EX)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, 0.05)
 
 
 def unlock_file(file_obj):
@@ -181,11 +235,283 @@ def unlock_file(file_obj):
         fcntl.flock(file_obj.fileno(), fcntl.LOCK_UN)
 
 
-def append_to_stats(record):
+_config = None
+
+
+def load_config():
+    """读取 config.json（只读一次；文件不存在或格式错误时返回空字典）"""
+    global _config
+    if _config is None:
+        _config = {}
+        if CONFIG_FILE.exists():
+            try:
+                with open(CONFIG_FILE, 'rb') as f:
+                    config = stats_codec.loads(f.read())
+                if isinstance(config, dict):
+                    _config = config
+            except (OSError, ValueError) as e:
+                print(f"[{HOOK_NAME}] 警告：读取配置文件失败 - {e}", file=sys.stderr)
+    return _config
+
+
+def load_budgets():
+    """config.json 中的预算（未配置或格式错误时不启用预算）"""
+    try:
+        return stats_counters.parse_budgets(load_config().get('budgets', {}))
+    except ValueError as e:
+        print(f"[{HOOK_NAME}] 警告：预算配置无效 - {e}", file=sys.stderr)
+        return []
+
+
+def get_lock_timeout():
+    """等待文件锁的最长时间（秒）：config.json 的 lock_timeout，默认 DEFAULT_LOCK_TIMEOUT"""
+    timeout = load_config().get('lock_timeout', DEFAULT_LOCK_TIMEOUT)
+    if not isinstance(timeout, (int, float)) or isinstance(timeout, bool) or timeout < 0:
+        print(f"[{HOOK_NAME}] 警告：lock_timeout 无效，使用默认值 {DEFAULT_LOCK_TIMEOUT}", file=sys.stderr)
+        return DEFAULT_LOCK_TIMEOUT
+    return timeout
+
+
+def apply_sampling(record):
+    """
+    按 config.json 的 sampling 采样：保留时返回附加了权重的记录，丢弃时返回 None。
+    未配置时原样返回；配置无效时输出警告并照常记录。
+    """
+    config = load_config().get('sampling')
+    if not config:
+        return record
+    import stats_sampling
+    try:
+        sampling = stats_sampling.parse_sampling(config)
+    except ValueError as e:
+        print(f"[{HOOK_NAME}] 警告：采样配置无效，不采样 - {e}", file=sys.stderr)
+        return record
+    if sampling is None:
+        return record
+    return stats_sampling.sample_record(record, *sampling)
+
+
+def spill_record(record, stats_file):
+    """
+    等不到锁时把记录写入本进程独有的暂存文件 .spill/YYYY-MM-DD.<时间>.<pid>.jsonl，
+    之后由获得锁的 hook 回写到日期文件。先写临时文件再改名，回写方不会读到写了一半的文件。
+    """
+    spill_dir = stats_file.parent / SPILL_DIR_NAME
+    spill_dir.mkdir(exist_ok=True)
+    name = f"{stats_file.name.split('.', 1)[0]}.{time.time_ns()}.{os.getpid()}.jsonl"
+    tmp_path = spill_dir / f".{name}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(stats_codec.dumps(record) + '\n')
+    os.replace(tmp_path, spill_dir / name)
+    return spill_dir / name
+
+
+def fold_spills(stats_file, held_file):
+    """
+    把暂存的记录回写到日期文件（调用方持有 stats_file 的锁，held_file 为其文件对象）。
+    同一天的暂存记录直接写入 held_file；其他日期（跨午夜暂存的）只在能立即获得锁时回写，
+    该日期已归档时连同归档内容写回原始文件并删除归档（否则新建的原始文件会遮住归档中的记录）。
+    返回回写的记录数。
+    """
+    spill_dir = stats_file.parent / SPILL_DIR_NAME
+    if not spill_dir.exists():
+        return 0
+
+    by_date = {}
+    # 先处理上次回写中途退出时留下的已认领文件
+    for path in sorted(spill_dir.glob(f".*{CLAIMED_SUFFIX}")) + sorted(spill_dir.glob("*.jsonl")):
+        by_date.setdefault(path.name.lstrip('.').split('.', 1)[0], []).append(path)
+
+    folded = 0
+    for date_str, paths in by_date.items():
+        if date_str == stats_file.name.split('.', 1)[0]:
+            folded += _fold_into(held_file, paths)
+            continue
+        raw_path = stats_file.parent / f"{date_str}.jsonl"
+        if not raw_path.exists():
+            import stats_archive
+            archive_path = stats_archive.find_day_file(date_str, stats_file.parent)
+            if archive_path is not None:
+                folded += _fold_into_archived(raw_path, archive_path, paths)
+                continue
+        with open(raw_path, 'a', encoding='utf-8') as f:
+            if not lock_file(f, timeout=0):
+                continue
+            try:
+                # 加锁前文件已被替换（例如 retention_stats 汇总）时留到下次，不写入已脱离目录的旧文件
+                if os.stat(raw_path).st_ino == os.fstat(f.fileno()).st_ino:
+                    folded += _fold_into(f, paths)
+            finally:
+                unlock_file(f)
+    return folded
+
+
+def _fold_into_archived(raw_path, archive_path, paths):
+    """
+    已归档的日期：锁住归档文件，把归档内容和暂存记录写入临时文件，替换为原始文件后删除归档。
+    不能立即获得锁，或期间已有原始文件时留到下次。
+    """
+    import stats_archive
+
+    try:
+        lock_handle = open(archive_path, 'rb')
+    except FileNotFoundError:
+        return 0
+    with lock_handle:
+        if not lock_file(lock_handle, timeout=0):
+            return 0
+        try:
+            if raw_path.exists() or not archive_path.exists():
+                return 0
+            part_path = raw_path.with_name(f"{raw_path.name}.{os.getpid()}.part")
+            with open(part_path, 'w', encoding='utf-8', errors='surrogateescape') as f:
+                for line in stats_archive.iter_archive_lines(archive_path):
+                    f.write(line.decode('utf-8', errors='surrogateescape') + '\n')
+                count, claimed = _write_spills(f, paths)
+            os.replace(part_path, raw_path)
+        finally:
+            unlock_file(lock_handle)
+    # 原始文件已包含归档的全部内容（之后拿到归档锁的进程会看到原始文件而放弃）
+    archive_path.unlink(missing_ok=True)
+    stats_archive.index_path(archive_path).unlink(missing_ok=True)
+    _release_spills(claimed)
+    return count
+
+
+def _fold_into(file_obj, paths):
+    """按暂存时间顺序追加暂存文件的内容（调用方持有 file_obj 的锁），写入后删除暂存文件"""
+    count, claimed = _write_spills(file_obj, paths)
+    _release_spills(claimed)
+    return count
+
+
+def _write_spills(file_obj, paths):
+    """
+    把暂存文件的内容追加到 file_obj 并 fsync，返回 (记录数, 已认领的暂存文件)。
+    每个暂存文件先改名为带写入位置的已认领名称再写入，调用方在数据落盘后才删除；
+    中途退出时，下次回写按认领名称中的位置比对日期文件，已写入的只删除，未写入的重新写入，不会重复。
+    """
+    target = Path(file_obj.name)
+    count = 0
+    claimed = []
+    for path in paths:
+        try:
+            data = path.read_bytes().decode('utf-8')
+        except FileNotFoundError:
+            # 已被其他进程认领
+            continue
+        if data and not data.endswith('\n'):
+            data += '\n'
+
+        if path.name.endswith(CLAIMED_SUFFIX):
+            # 文本模式按平台换行符写入
+            expected = data.replace('\n', os.linesep).encode('utf-8')
+            written_at = int(path.name[:-len(CLAIMED_SUFFIX)].rsplit('.', 1)[1])
+            with open(target, 'rb') as f:
+                f.seek(written_at)
+                if f.read(len(expected)) == expected:
+                    claimed.append(path)
+                    continue
+            name = path.name[1:-len(CLAIMED_SUFFIX)].rsplit('.', 1)[0]
+        else:
+            name = path.name
+
+        file_obj.flush()
+        offset = os.fstat(file_obj.fileno()).st_size
+        claimed_path = path.with_name(f".{name}.{offset}{CLAIMED_SUFFIX}")
+        try:
+            os.rename(path, claimed_path)
+        except FileNotFoundError:
+            continue
+        file_obj.write(data)
+        claimed.append(claimed_path)
+        count += data.count('\n')
+
+    file_obj.flush()
+    os.fsync(file_obj.fileno())
+    return count, claimed
+
+
+def _release_spills(claimed):
+    """删除已写入日期文件的暂存文件"""
+    for path in claimed:
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def publish_metrics(record):
+    """把记录推送到 config.json 中配置的指标 sinks（未配置时不加载 stats_sinks）"""
+    sink_configs = load_config().get('sinks')
+    if not sink_configs:
+        return
+    import stats_sinks
+
+    if not isinstance(sink_configs, list):
+        sink_configs = [sink_configs]
+    for config, result in stats_sinks.publish([record], sink_configs):
+        if isinstance(result, Exception):
+            print(f"[{HOOK_NAME}] 警告：推送指标失败 - {result}", file=sys.stderr)
+
+
+def update_counters(stats_file, record, size_before):
+    """
+    更新当天的运行计数（调用方持有统计文件的锁）。
+    计数只是查询加速，出错时不影响记录写入，返回空字典。
+    """
+    try:
+        return stats_counters.sync(stats_file, record, size_before)
+    except Exception as e:
+        print(f"[{HOOK_NAME}] 警告：更新运行计数失败 - {e}", file=sys.stderr)
+        return {}
+
+
+def update_binary_store(stats_file, record, size_before):
+    """
+    config.json 的 binary_store 为 true 时同步当天的二进制记录存储（调用方持有统计文件的锁）。
+    二进制存储只是读取加速，出错时不影响记录写入（遇到无法编码的记录时存储停在它之前，
+    查看工具读取 JSONL；日期文件被替换前不再重试）。未启用时不加载 stats_binary。
+    """
+    if not load_config().get('binary_store'):
+        return
+    import stats_binary
+
+    try:
+        stats_binary.sync(stats_file, record, size_before)
+    except Exception as e:
+        print(f"[{HOOK_NAME}] 警告：更新二进制存储失败 - {e}", file=sys.stderr)
+
+
+def warn_budgets(counts):
+    """当天的计数超出配置的预算时向 stderr 输出警告"""
+    for kind, metric, value, limit in stats_counters.exceeded_budgets(counts, load_budgets()):
+        scope = "今天" if kind == 'day' else f"当前{stats_counters.KIND_LABELS[kind]}今天"
+        print(f"[{HOOK_NAME}] ⚠️ 预算警告：{scope}的{stats_counters.METRIC_LABELS[metric]}为 {value}，"
+              f"超出预算 {limit}", file=sys.stderr)
+
+
+def is_duplicate(stats_file, call_key):
+    """
+    检查本次调用是否已记录过（调用方持有统计文件的锁）。
+    config.json 的 dedup 为 false 时不检查；过滤器出错时按未重复处理，不影响记录写入。
+    """
+    if load_config().get('dedup', True) is False:
+        return False
+    try:
+        return stats_dedup.check_and_add(stats_file.parent, stats_file.name.split('.', 1)[0], call_key)
+    except Exception as e:
+        print(f"[{HOOK_NAME}] 警告：检查重复调用失败 - {e}", file=sys.stderr)
+        return False
+
+
+def append_to_stats(record, call_key=None):
     """
     追加记录到今天的统计文件，使用文件锁保证并发安全。
     支持 Windows 和 Unix-like 系统。
     统计文件按日期组织：stats/YYYY-MM-DD.jsonl
+    同一把锁内回写之前暂存的记录、按 call_key 检查重复调用并更新当天的运行计数（以及开启时的二进制存储），
+    返回记录所属各项更新后的计数（记录被暂存时返回空字典，不检查重复）；重复调用不写入，返回 None。
     """
     try:
         # 获取今天的统计文件路径
@@ -196,12 +522,25 @@ def append_to_stats(record):
         print(f"[{HOOK_NAME}] 正在写入统计文件：{stats_file}", file=sys.stderr)
 
         with open(stats_file, 'a', encoding='utf-8') as f:
-            # 获取排他锁以防止并发写入冲突
-            lock_file(f)
+            # 获取排他锁以防止并发写入冲突；持锁进程卡住时不无限等待，记录先暂存
+            timeout = get_lock_timeout()
+            if not lock_file(f, timeout=timeout):
+                spill_path = spill_record(record, stats_file)
+                print(f"[{HOOK_NAME}] 警告：{timeout} 秒内未获得文件锁，记录已暂存到 {spill_path}", file=sys.stderr)
+                return {}
             try:
-                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+                folded = fold_spills(stats_file, f)
+                if folded:
+                    print(f"[{HOOK_NAME}] 已回写 {folded} 条暂存记录", file=sys.stderr)
+                if call_key and is_duplicate(stats_file, call_key):
+                    return None
+                size_before = os.fstat(f.fileno()).st_size
+                f.write(stats_codec.dumps(record) + '\n')
                 f.flush()  # 确保数据写入磁盘
                 print(f"[{HOOK_NAME}] 统计记录写入成功", file=sys.stderr)
+                counts = update_counters(stats_file, record, size_before)
+                update_binary_store(stats_file, record, size_before)
+                return counts
             finally:
                 # 释放锁（文件关闭时会自动释放，但显式释放更清晰）
                 unlock_file(f)
@@ -210,17 +549,11 @@ def append_to_stats(record):
         raise
 
 
-def main():
-    """主执行函数。"""
-    print(f"[{HOOK_NAME}] ==================== 开始执行 ====================", file=sys.stderr)
-
-    # 从 stdin 读取 hook 输入
-    hook_input = read_hook_input()
-
-    if not hook_input:
-        print(f"[{HOOK_NAME}] 无有效 hook 输入，跳过统计", file=sys.stderr)
-        sys.exit(0)
-
+def process_hook_input(hook_input, email=None):
+    """
+    处理一次工具调用：计算统计、写入记录、检查预算并推送指标。
+    返回写入的记录；没有代码变更、未被采样或是重复调用时返回 None。
+    """
     tool_name = hook_input['tool_name']
     tool_input = hook_input['tool_input']
     session_id = hook_input['session_id']
@@ -228,12 +561,12 @@ def main():
     print(f"[{HOOK_NAME}] Session ID: {session_id}", file=sys.stderr)
 
     # 计算统计信息
-    additions, deletions, net_change = calculate_stats_from_tool_input(tool_name, tool_input)
+    additions, deletions, net_change, content = calculate_stats_from_tool_input(tool_name, tool_input)
 
     # 仅在有实际变更时记录
     if additions == 0 and deletions == 0:
         print(f"[{HOOK_NAME}] {tool_name} 工具：未检测到代码变更，跳过记录", file=sys.stderr)
-        sys.exit(0)
+        return None
 
     print(f"[{HOOK_NAME}] 检测到代码变更：+{additions} 行，-{deletions} 行，净变化 {net_change:+d} 行", file=sys.stderr)
 
@@ -242,21 +575,66 @@ def main():
     record = {
         "timestamp": datetime.now(beijing_tz).isoformat(),
         "session_id": session_id,
-        "email": get_git_user_email(),
+        "email": email or get_git_user_email(),
         "tool": tool_name,
         "additions": additions,
         "deletions": deletions,
         "net_change": net_change
     }
+    record.update(content)
+    record['churn'] = measure_churn(tool_name, tool_input)
+    if record['churn']:
+        print(f"[{HOOK_NAME}] 重复写入：{record['churn']} 行此前在该文件中写入或删除过", file=sys.stderr)
+
+    # 启用采样时只保留部分记录，保留的记录带有权重
+    record = apply_sampling(record)
+    if record is None:
+        print(f"[{HOOK_NAME}] 采样跳过：本次 {tool_name} 调用未被采样", file=sys.stderr)
+        return None
 
-    # 追加到统计文件
-    append_to_stats(record)
+    # 追加到统计文件（同一调用被重复触发时跳过），并检查当天的预算
+    # 没有 tool_use_id 的调用只在 dedup_content_hash 为 true 时按内容哈希检查
+    content = (session_id, tool_name, tool_input) if load_config().get('dedup_content_hash') else None
+    call_key = stats_dedup.call_id(hook_input.get('raw_data'), content)
+    counts = append_to_stats(record, call_key)
+    if counts is None:
+        print(f"[{HOOK_NAME}] 重复调用：本次 {tool_name} 调用已记录过，跳过", file=sys.stderr)
+        return None
+    warn_budgets(counts)
+
+    # 推送指标（非阻塞，失败只输出警告）
+    publish_metrics(record)
 
     print(f"[{HOOK_NAME}] ✓ {tool_name} 工具统计完成：+{additions}/-{deletions} (净变化：{net_change:+d})", file=sys.stderr)
+    return record
+
+
+def record(payload, email=None):
+    """
+    在进程内执行一次 hook：payload 为 hook 通过 stdin 传入的 JSON 对应的字典，
+    email 不为空时不再调用 git 获取邮箱。返回写入的记录，没有写入时返回 None。
+    测试和基准可以直接调用，不必为每次调用启动子进程；写入 STATS_DIR，与 hook 相同。
+    """
+    return process_hook_input(parse_hook_input(payload), email)
+
+
+def main():
+    """主执行函数。"""
+    print(f"[{HOOK_NAME}] ==================== 开始执行 ====================", file=sys.stderr)
+
+    # 从 stdin 读取 hook 输入
+    hook_input = read_hook_input()
+
+    if not hook_input:
+        print(f"[{HOOK_NAME}] 无有效 hook 输入，跳过统计", file=sys.stderr)
+        sys.exit(0)
+
+    process_hook_input(hook_input)
     print(f"[{HOOK_NAME}] ==================== 执行完成 ====================", file=sys.stderr)
 
 
-if __name__ == "__main__":
+def run_hook():
+    """hook 入口（直接运行本脚本或通过 hook_launcher.py 调用），任何错误都不阻塞工具执行。"""
     try:
         main()
     except Exception as e:
@@ -267,3 +645,7 @@ if __name__ == "__main__":
         traceback.print_exc(file=sys.stderr)
         print(f"[{HOOK_NAME}] 注意：错误不会阻塞工具执行", file=sys.stderr)
         sys.exit(0)  # 出错时不阻塞工具执行
+
+
+if __name__ == "__main__":
+    run_hook()
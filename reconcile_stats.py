@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+用 git 历史核对 hook 统计。
+hook 的行数是根据工具参数估算的，这里把它与真正提交的改动比较：
+先用一次 git log 列出日期范围内的提交（SHA、作者邮箱、时间），再把没有缓存的提交分批交给
+git log --no-walk --stdin --numstat（每批 BATCH_SIZE 个，而不是每条记录或每个提交调用一次），
+解析出的行数按 SHA 缓存在统计目录的 .git-numstat-cache.json 中，重复运行只需列出提交。
+
+提交按作者邮箱和时间匹配到会话：同一邮箱、提交时间落在会话第一条记录到最后一条记录之后
+--window 分钟内的会话（有多个时取开始最晚的）。按用户和日期比较匹配到提交的会话的 hook 行数
+与这些提交的 git 行数；没有匹配到会话的提交（例如手工提交）单独计数。
+hook 记录所有项目的改动而不区分仓库，因此没有匹配到提交的会话不参与比较。
+"""
+
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import stats_codec
+import view_stats
+
+CACHE_NAME = ".git-numstat-cache.json"
+
+# 会话最后一条记录之后多久内的提交仍算作该会话的提交（分钟）
+DEFAULT_WINDOW = 30
+
+# 每次 git log --stdin 读取的提交数
+BATCH_SIZE = 500
+
+BEIJING_TZ = timezone(timedelta(hours=8))
+
+# git log --format 中的字段 / 提交分隔符
+FIELD_SEP = '\x1f'
+COMMIT_SEP = '\x1e'
+
+ROW_FIELDS = ('date', 'user', 'sessions', 'matched_sessions', 'commits',
+              'hook_additions', 'hook_deletions', 'git_additions', 'git_deletions',
+              'diff_additions', 'diff_deletions', 'unmatched_commits')
+
+
+def run_git(repo, args, input_text=None):
+    """在仓库中执行 git 命令，返回标准输出；失败时抛出 RuntimeError"""
+    result = subprocess.run(['git', '-C', str(repo)] + args, input=input_text,
+                            capture_output=True, text=True, encoding='utf-8', errors='replace')
+    if result.returncode != 0:
+        raise RuntimeError(f"git {args[0]} 执行失败: {result.stderr.strip()}")
+    return result.stdout
+
+
+def list_commits(repo, since, until, all_branches=False):
+    """
+    一次 git log 列出 [since, until] 内的非合并提交：[(SHA, 作者邮箱, 作者时间), ...]
+    """
+    args = ['log', '--no-merges', f'--format=%H{FIELD_SEP}%ae{FIELD_SEP}%aI',
+            f'--since={since.isoformat()}', f'--until={until.isoformat()}']
+    if all_branches:
+        args.append('--all')
+    commits = []
+    for line in run_git(repo, args).splitlines():
+        parts = line.split(FIELD_SEP)
+        if len(parts) == 3:
+            commits.append((parts[0], parts[1], datetime.fromisoformat(parts[2])))
+    return commits
+
+
+def parse_numstat(output):
+    """解析 --format=<COMMIT_SEP>%H --numstat 的输出：SHA -> [新增行数, 删除行数, 文件数]（二进制文件计为 0 行）"""
+    stats = {}
+    for chunk in output.split(COMMIT_SEP)[1:]:
+        lines = chunk.splitlines()
+        if not lines:
+            continue
+        additions = deletions = files = 0
+        for line in lines[1:]:
+            parts = line.split('\t', 2)
+            if len(parts) != 3:
+                continue
+            files += 1
+            additions += int(parts[0]) if parts[0].isdigit() else 0
+            deletions += int(parts[1]) if parts[1].isdigit() else 0
+        stats[lines[0].strip()] = [additions, deletions, files]
+    return stats
+
+
+def load_cache(stats_dir):
+    """已解析的提交：SHA -> [新增行数, 删除行数, 文件数]"""
+    try:
+        with open(Path(stats_dir) / CACHE_NAME, 'rb') as f:
+            cache = stats_codec.loads(f.read())
+    except (OSError, ValueError):
+        return {}
+    return cache if isinstance(cache, dict) else {}
+
+
+def save_cache(stats_dir, cache):
+    cache_path = Path(stats_dir) / CACHE_NAME
+    tmp_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(stats_codec.dumps(cache))
+    os.replace(tmp_path, cache_path)
+
+
+def fetch_numstat(repo, shas, cache, batch_size=BATCH_SIZE):
+    """把缓存中没有的提交分批交给 git 解析并写入 cache，返回调用 git 的次数"""
+    missing = [sha for sha in dict.fromkeys(shas) if sha not in cache]
+    calls = 0
+    for start in range(0, len(missing), batch_size):
+        batch = missing[start:start + batch_size]
+        output = run_git(repo, ['log', '--no-walk=unsorted', '--stdin', '--no-renames', '--numstat',
+                                f'--format={COMMIT_SEP}%H'], '\n'.join(batch) + '\n')
+        calls += 1
+        cache.update(parse_numstat(output))
+    return calls
+
+
+def collect_sessions(records):
+    """
+    按 (邮箱, 会话) 汇总 hook 记录：开始 / 结束时间，以及每天的 [新增行数, 删除行数]
+    （采样记录按权重计入）。
+    """
+    sessions = {}
+    for record in records:
+        try:
+            moment = datetime.fromisoformat(record['timestamp'])
+        except (KeyError, TypeError, ValueError):
+            continue
+        key = (record.get('email', 'unknown').lower(), record.get('session_id', 'unknown'))
+        session = sessions.get(key)
+        if session is None:
+            session = sessions[key] = {'start': moment, 'end': moment, 'days': defaultdict(lambda: [0, 0])}
+        session['start'] = min(session['start'], moment)
+        session['end'] = max(session['end'], moment)
+        w = record.get('weight', 1)
+        day = session['days'][record['timestamp'][:10]]
+        day[0] += w * record.get('additions', 0)
+        day[1] += w * record.get('deletions', 0)
+    return sessions
+
+
+def match_commits(commits, sessions, window):
+    """提交 -> 会话键（没有匹配的会话时为 None）：同一邮箱、时间在 [开始, 结束 + window] 内、开始最晚的会话"""
+    by_email = defaultdict(list)
+    for key, session in sessions.items():
+        by_email[key[0]].append((session['start'], session['end'], key))
+
+    matches = {}
+    for sha, email, moment in commits:
+        best = None
+        for start, end, key in by_email.get(email.lower(), ()):
+            if start <= moment <= end + window and (best is None or start > best[0]):
+                best = (start, key)
+        matches[sha] = best[1] if best else None
+    return matches
+
+
+def reconcile(records, commits, numstat, window_minutes=DEFAULT_WINDOW):
+    """按 (日期, 用户) 比较 hook 与 git 的行数，返回按日期、用户排序的结果行"""
+    sessions = collect_sessions(records)
+    matches = match_commits(commits, sessions, timedelta(minutes=window_minutes))
+    matched = {key for key in matches.values() if key is not None}
+
+    rows = {}
+
+    def row_for(date_str, user):
+        row = rows.get((date_str, user))
+        if row is None:
+            row = rows[(date_str, user)] = dict.fromkeys(ROW_FIELDS[2:], 0)
+        return row
+
+    for key, session in sessions.items():
+        for date_str, (additions, deletions) in session['days'].items():
+            row = row_for(date_str, key[0])
+            row['sessions'] += 1
+            if key in matched:
+                row['matched_sessions'] += 1
+                row['hook_additions'] += additions
+                row['hook_deletions'] += deletions
+
+    for sha, email, moment in commits:
+        additions, deletions, _ = numstat.get(sha, (0, 0, 0))
+        row = row_for(moment.astimezone(BEIJING_TZ).strftime("%Y-%m-%d"), email.lower())
+        if matches[sha] is None:
+            row['unmatched_commits'] += 1
+            continue
+        row['commits'] += 1
+        row['git_additions'] += additions
+        row['git_deletions'] += deletions
+
+    result = []
+    for (date_str, user), row in sorted(rows.items()):
+        row['diff_additions'] = row['git_additions'] - row['hook_additions']
+        row['diff_deletions'] = row['git_deletions'] - row['hook_deletions']
+        result.append({'date': date_str, 'user': user, **row})
+    return result
+
+
+def run(repo, stats_dir, from_date=None, to_date=None, window_minutes=DEFAULT_WINDOW,
+        all_branches=False, batch_size=BATCH_SIZE):
+    """
+    核对日期范围内的 hook 统计与仓库的提交。
+    返回 (结果行, 提交数, 本次解析的提交数, 调用 git log --numstat 的次数)。
+    """
+    from stats_api import Stats
+
+    query = Stats(stats_dir).range(from_date, to_date)
+    dates = query.dates()
+    if not dates:
+        return [], 0, 0, 0
+    records = list(query.records())
+
+    since = datetime.strptime(dates[0], "%Y-%m-%d").replace(tzinfo=BEIJING_TZ)
+    until = (datetime.strptime(dates[-1], "%Y-%m-%d").replace(tzinfo=BEIJING_TZ)
+             + timedelta(days=1, minutes=window_minutes))
+    commits = list_commits(repo, since, until, all_branches)
+
+    cache = load_cache(stats_dir)
+    cached = len(cache)
+    calls = fetch_numstat(repo, [sha for sha, _, _ in commits], cache, batch_size)
+    if calls:
+        save_cache(stats_dir, cache)
+    rows = reconcile(records, commits, cache, window_minutes)
+    return rows, len(commits), len(cache) - cached, calls
+
+
+def format_diff(hook, git):
+    """git 相对 hook 的差异，如 +12（+8.0%）"""
+    diff = git - hook
+    if not hook:
+        return f"{diff:+d}"
+    return f"{diff:+d}（{diff / hook:+.1%}）"
+
+
+def main():
+    """主函数"""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='用 git 提交历史核对 hook 统计的行数',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=f"""
+示例：
+  %(prog)s --repo ~/work/project                     # 核对全部日期
+  %(prog)s --repo . --from 2026-01-01 --to 2026-01-31  # 核对一段日期
+  %(prog)s --repo . --window 60 --all                # 会话结束后 60 分钟内的提交也算，包含所有分支
+  %(prog)s --repo . --format csv > reconcile.csv     # 导出结果
+提交按作者邮箱和时间匹配到会话（默认会话结束后 {DEFAULT_WINDOW} 分钟内）；解析过的提交按 SHA 缓存，重复运行很快。
+        """
+    )
+
+    parser.add_argument('--repo', default='.', help='git 仓库路径（默认当前目录）')
+    parser.add_argument('--from', dest='from_date', metavar='DATE', help='日期范围起点（含，YYYY-MM-DD）')
+    parser.add_argument('--to', dest='to_date', metavar='DATE', help='日期范围终点（含，YYYY-MM-DD）')
+    parser.add_argument('--window', type=int, default=DEFAULT_WINDOW, metavar='MIN',
+                        help=f'会话最后一条记录之后仍算作该会话的提交时间（分钟，默认 {DEFAULT_WINDOW}）')
+    parser.add_argument('--all', dest='all_branches', action='store_true', help='包含所有分支（默认只看 HEAD）')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                        help=f'每次 git log --numstat 解析的提交数（默认 {BATCH_SIZE}）')
+    parser.add_argument('--dir', help='统计目录（默认 code-log）')
+    parser.add_argument('--format', '-f', choices=['text', 'json', 'jsonl', 'csv'], default='text',
+                        help='输出格式（默认 text）')
+
+    args = parser.parse_args()
+    if args.window < 0 or args.batch_size < 1:
+        parser.error("--window 不能为负数，--batch-size 必须是正整数")
+
+    stats_dir = Path(args.dir) if args.dir else view_stats.STATS_DIR
+    if not stats_dir.exists():
+        print(f"错误：统计目录不存在: {stats_dir}", file=sys.stderr)
+        sys.exit(1)
+    repo = Path(args.repo).expanduser()
+
+    rows, commits, parsed, calls = run(repo, stats_dir, args.from_date, args.to_date, args.window,
+                                       args.all_branches, args.batch_size)
+
+    if args.format != 'text':
+        view_stats.write_rows(rows, args.format, ROW_FIELDS)
+        return
+
+    print(f"仓库 {repo}：{commits} 个提交，新解析 {parsed} 个（git log --numstat 调用 {calls} 次），其余来自缓存\n")
+    compared = [row for row in rows if row['matched_sessions'] or row['commits'] or row['unmatched_commits']]
+    if not compared:
+        print("没有可以核对的提交")
+        return
+
+    for row in compared:
+        line = (f"{row['date']} {row['user']}: 会话 {row['matched_sessions']}/{row['sessions']} | "
+                f"提交 {row['commits']:3d} | "
+                f"新增 hook {row['hook_additions']:5d} / git {row['git_additions']:5d} "
+                f"{format_diff(row['hook_additions'], row['git_additions'])} | "
+                f"删除 hook {row['hook_deletions']:5d} / git {row['git_deletions']:5d} "
+                f"{format_diff(row['hook_deletions'], row['git_deletions'])}")
+        if row['unmatched_commits']:
+            line += f" | 未匹配提交 {row['unmatched_commits']}"
+        print(line)
+
+    hook_additions = sum(row['hook_additions'] for row in rows)
+    git_additions = sum(row['git_additions'] for row in rows)
+    hook_deletions = sum(row['hook_deletions'] for row in rows)
+    git_deletions = sum(row['git_deletions'] for row in rows)
+    print(f"\n合计：新增 hook {hook_additions} / git {git_additions} {format_diff(hook_additions, git_additions)}，"
+          f"删除 hook {hook_deletions} / git {git_deletions} {format_diff(hook_deletions, git_deletions)}，"
+          f"未匹配提交 {sum(row['unmatched_commits'] for row in rows)} 个")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\n\n已取消", file=sys.stderr)
+        sys.exit(130)
+    except Exception as e:
+        print(f"错误：{e}", file=sys.stderr)
+        import traceback
+        traceback.print_exc(file=sys.stderr)
+        sys.exit(1)
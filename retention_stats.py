@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+统计数据保留策略（降采样）。
+超过保留期的原始记录按小时、再按天汇总：同一时段内同一用户、工具和会话的记录合并为一行，
+行数、内容指标相加，operations 记录代表的原始记录数，rollup 记录汇总粒度。
+汇总行写回原来的日期文件（先写临时文件再替换），查看工具的历史、排行、会话等查询照常可用，
+只是旧日期的时间精度降为小时或天。
+
+默认策略：原始记录保留 30 天，按小时的汇总保留 365 天，之后按天汇总并永久保留；
+可在 config.json 的 retention 中修改，或用命令行参数覆盖。
+"""
+
+import os
+import sys
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import stats_archive
+import stats_codec
+import view_stats
+from merge_stats import remove_archives
+
+DEFAULT_RAW_DAYS = 30
+DEFAULT_HOURLY_DAYS = 365
+
+# 汇总粒度由细到粗；原始记录没有 rollup 字段
+LEVELS = ('raw', 'hour', 'day')
+
+# 相加的字段
+SUM_FIELDS = ('additions', 'deletions', 'net_change') + stats_codec.CONTENT_FIELDS
+
+
+def rollup_key(record, level):
+    """汇总分组：按小时时为 (小时, 用户, 工具, 会话)，按天时为 (用户, 工具, 会话)"""
+    key = (record.get('email', 'unknown'), record.get('tool', 'Unknown'), record.get('session_id', 'unknown'))
+    if level == 'hour':
+        return (record.get('timestamp', '')[:13],) + key
+    return key
+
+
+def rollup_records(records, level):
+    """
+    把记录汇总为指定粒度的汇总行，按时间排序返回。
+    每行的时间为组内最早的记录时间；采样记录按权重展开后汇总，已有的汇总行按其操作数合并。
+    """
+    groups = {}
+    for record in records:
+        w = record.get('weight', 1)
+        key = rollup_key(record, level)
+        row = groups.get(key)
+        if row is None:
+            row = groups[key] = {
+                'timestamp': record.get('timestamp', ''),
+                'session_id': key[-1],
+                'email': key[-3],
+                'tool': key[-2],
+                **dict.fromkeys(SUM_FIELDS, 0),
+                'operations': 0,
+                'rollup': level,
+            }
+        row['timestamp'] = min(row['timestamp'], record.get('timestamp', ''))
+        row['operations'] += record.get('operations', w)
+        for field in SUM_FIELDS:
+            row[field] += w * record.get(field, 0)
+
+    # 内容指标是可选字段，为 0 时省略以减小文件
+    for row in groups.values():
+        for field in stats_codec.CONTENT_FIELDS:
+            if not row[field]:
+                del row[field]
+    return sorted(groups.values(), key=lambda row: row['timestamp'])
+
+
+def day_level(date_str, stats_dir):
+    """日期文件当前的粒度（同一文件中的行粒度相同，读取第一行即可）；没有数据时返回 None"""
+    for record in view_stats.iter_stats_file(date_str, stats_dir=stats_dir):
+        return record.get('rollup', 'raw')
+    return None
+
+
+def day_files(date_str, stats_dir):
+    """某天的全部数据文件（原始文件、归档及其索引）"""
+    names = [f"{date_str}.jsonl"]
+    for suffix in stats_archive.ARCHIVE_SUFFIXES:
+        names += [f"{date_str}.jsonl{suffix}", f"{date_str}.jsonl{suffix}{stats_archive.INDEX_SUFFIX}"]
+    return [path for path in (Path(stats_dir) / name for name in names) if path.exists()]
+
+
+@contextmanager
+def locked_day(date_str, stats_dir):
+    """
+    持有 hook 使用的日期文件锁：有原始文件时锁原始文件，只有归档时锁归档文件（与暂存回写一致）。
+    获得锁时文件已被替换（inode 变化）则重新加锁。
+    """
+    import post_stat
+
+    while True:
+        path = stats_archive.find_day_file(date_str, stats_dir)
+        if path is None:
+            yield
+            return
+        with open(path, 'rb') as f:
+            post_stat.lock_file(f)
+            try:
+                if stats_archive.find_day_file(date_str, stats_dir) == path \
+                        and os.stat(path).st_ino == os.fstat(f.fileno()).st_ino:
+                    yield
+                    return
+            finally:
+                post_stat.unlock_file(f)
+
+
+def rollup_day(date_str, stats_dir, level, dry_run=False):
+    """
+    把某天的数据汇总为 level 粒度：先写完汇总文件再替换原始文件并删除归档。
+    读取、写入和替换都持有该日期的锁，回写暂存记录等并发写入不会在替换时丢失。
+    返回 (记录数, 汇总行数, 原大小, 新大小)。
+    """
+    stats_dir = Path(stats_dir)
+    with locked_day(date_str, stats_dir):
+        before = sum(path.stat().st_size for path in day_files(date_str, stats_dir))
+        records = list(view_stats.iter_stats_file(date_str, stats_dir=stats_dir))
+        rows = rollup_records(records, level)
+        data = ''.join(stats_codec.dumps(row) + '\n' for row in rows).encode('utf-8')
+        if dry_run:
+            return len(records), len(rows), before, len(data)
+
+        out_path = stats_dir / f"{date_str}.jsonl"
+        tmp_path = stats_dir / f"{date_str}.jsonl.part"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, out_path)
+        remove_archives(date_str, stats_dir)
+        return len(records), len(rows), before, len(data)
+
+
+def parse_policy(config):
+    """
+    解析 config.json 中的 retention：{"raw_days": 30, "hourly_days": 365}
+    返回 (raw_days, hourly_days)，格式错误时抛出 ValueError。
+    """
+    if config is None:
+        config = {}
+    if not isinstance(config, dict):
+        raise ValueError("retention 必须是对象")
+    raw_days = config.get('raw_days', DEFAULT_RAW_DAYS)
+    hourly_days = config.get('hourly_days', DEFAULT_HOURLY_DAYS)
+    for name, value in (('raw_days', raw_days), ('hourly_days', hourly_days)):
+        if not isinstance(value, int) or isinstance(value, bool) or value < 1:
+            raise ValueError(f"{name} 必须是正整数")
+    return raw_days, hourly_days
+
+
+def target_level(date_str, today, raw_days, hourly_days):
+    """按策略某天应有的粒度：早于 raw_days 天按小时，早于 hourly_days 天按天（hourly_days 不大于 raw_days 时直接按天）"""
+    age = (today - datetime.strptime(date_str, "%Y-%m-%d").date()).days
+    if age > max(raw_days, hourly_days):
+        return 'day'
+    if age > raw_days:
+        return 'hour'
+    return 'raw'
+
+
+def apply_policy(stats_dir, raw_days, hourly_days, today=None, dry_run=False, progress=None):
+    """
+    按策略汇总统计目录中的旧日期，返回 [(日期, 粒度, 记录数, 汇总行数, 原大小, 新大小), ...]。
+    已经达到（或粗于）目标粒度的日期跳过；今天的文件 hook 仍在追加，始终保留原始记录。
+    """
+    today = today or datetime.now(timezone(timedelta(hours=8))).date()
+    results = []
+    for date_str in view_stats.list_available_dates(stats_dir):
+        level = target_level(date_str, today, raw_days, hourly_days)
+        if level == 'raw':
+            continue
+        current = day_level(date_str, stats_dir)
+        if current is None or LEVELS.index(current) >= LEVELS.index(level):
+            continue
+        result = (date_str, level) + rollup_day(date_str, stats_dir, level, dry_run)
+        results.append(result)
+        if progress:
+            progress(result)
+    return results
+
+
+def main():
+    """主函数"""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='按保留策略把旧的原始记录汇总为按小时 / 按天的汇总行',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=f"""
+示例：
+  %(prog)s                                # 按 config.json 的 retention 执行（默认原始 {DEFAULT_RAW_DAYS} 天、按小时 {DEFAULT_HOURLY_DAYS} 天）
+  %(prog)s --dry-run                      # 只显示将要汇总的日期和可回收的空间
+  %(prog)s --raw-days 7 --hourly-days 90  # 原始记录保留 7 天，按小时汇总保留 90 天，之后按天
+汇总后历史、排行和会话查询照常可用；汇总不可逆，建议先用 --dry-run 确认。
+        """
+    )
+
+    parser.add_argument('--raw-days', type=int, help='原始记录保留的天数')
+    parser.add_argument('--hourly-days', type=int, help='按小时汇总保留的天数（之后按天汇总，永久保留）')
+    parser.add_argument('--dry-run', action='store_true', help='只统计，不修改文件')
+    parser.add_argument('--dir', help='统计目录（默认 code-log）')
+
+    args = parser.parse_args()
+
+    stats_dir = Path(args.dir) if args.dir else view_stats.STATS_DIR
+    if not stats_dir.exists():
+        print(f"错误：统计目录不存在: {stats_dir}", file=sys.stderr)
+        sys.exit(1)
+
+    import post_stat
+    raw_days, hourly_days = parse_policy(post_stat.load_config().get('retention'))
+    if args.raw_days is not None:
+        raw_days = args.raw_days
+    if args.hourly_days is not None:
+        hourly_days = args.hourly_days
+    raw_days, hourly_days = parse_policy({'raw_days': raw_days, 'hourly_days': hourly_days})
+
+    def progress(result):
+        date_str, level, records, rows, before, after = result
+        label = '按小时' if level == 'hour' else '按天'
+        print(f"{date_str}: {label}汇总 {records:6d} 行 -> {rows:5d} 行 | "
+              f"{stats_archive.format_size(before)} -> {stats_archive.format_size(after)}")
+
+    print(f"策略：原始记录 {raw_days} 天，按小时汇总 {hourly_days} 天，之后按天汇总"
+          + ("（试运行，不修改文件）" if args.dry_run else "") + "\n")
+    results = apply_policy(stats_dir, raw_days, hourly_days, dry_run=args.dry_run, progress=progress)
+    if not results:
+        print("没有需要汇总的日期")
+        return
+
+    before = sum(result[4] for result in results)
+    after = sum(result[5] for result in results)
+    ratio = (before - after) / before if before else 0
+    verb = '可回收' if args.dry_run else '回收'
+    print(f"\n共汇总 {len(results)} 天：{stats_archive.format_size(before)} -> {stats_archive.format_size(after)}，"
+          f"{verb} {stats_archive.format_size(before - after)}（{ratio:.1%}）")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\n\n已取消", file=sys.stderr)
+        sys.exit(130)
+    except Exception as e:
+        print(f"错误：{e}", file=sys.stderr)
+        import traceback
+        traceback.print_exc(file=sys.stderr)
+        sys.exit(1)
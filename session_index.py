@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+会话索引。
+在统计目录中维护一个 SQLite 索引，记录每个会话在每天的文件中出现的字节范围和汇总值，
+查询单个会话时直接定位到相关日期文件的对应区间，无需扫描所有日期；
+跨越午夜的会话可以把各天的数据合并为一份汇总。
+
+索引按文件增量维护：原始文件只解析上次位置之后新追加的完整行，
+文件被替换（inode 变化）或截断、转换为归档时重建该日期的条目。
+归档日期不记录字节范围，查询时读取该日期并按会话过滤。
+"""
+
+import sqlite3
+from pathlib import Path
+
+import stats_archive
+import view_stats
+
+INDEX_NAME = ".session-index.sqlite"
+# 2：汇总值按采样权重计入
+INDEX_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    date TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    ino INTEGER NOT NULL,
+    offset INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS spans (
+    session_id TEXT NOT NULL,
+    date TEXT NOT NULL,
+    start INTEGER,
+    end INTEGER,
+    operations INTEGER NOT NULL,
+    additions INTEGER NOT NULL,
+    deletions INTEGER NOT NULL,
+    net_change INTEGER NOT NULL,
+    first_time TEXT NOT NULL,
+    last_time TEXT NOT NULL,
+    PRIMARY KEY (session_id, date)
+);
+CREATE INDEX IF NOT EXISTS spans_by_date ON spans (date);
+"""
+
+# 新的区间与已有条目合并：范围取并集，汇总值累加
+UPSERT = """
+INSERT INTO spans VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (session_id, date) DO UPDATE SET
+    start = min(start, excluded.start),
+    end = max(end, excluded.end),
+    operations = operations + excluded.operations,
+    additions = additions + excluded.additions,
+    deletions = deletions + excluded.deletions,
+    net_change = net_change + excluded.net_change,
+    first_time = min(first_time, excluded.first_time),
+    last_time = max(last_time, excluded.last_time)
+"""
+
+SPAN_FIELDS = ('date', 'start', 'end', 'operations', 'additions', 'deletions',
+               'net_change', 'first_time', 'last_time')
+
+
+def _add(spans, record, start, end):
+    """把一条记录累加到 会话 -> 区间汇总 的字典（采样记录按权重计入，汇总行按其操作数计入）"""
+    session_id = record.get('session_id', 'unknown')
+    timestamp = record.get('timestamp', '')
+    w = record.get('weight', 1)
+    span = spans.get(session_id)
+    if span is None:
+        spans[session_id] = [start, end, record.get('operations', w), w * record['additions'], w * record['deletions'],
+                             w * record['net_change'], timestamp, timestamp]
+        return
+    span[1] = end
+    span[2] += record.get('operations', w)
+    span[3] += w * record['additions']
+    span[4] += w * record['deletions']
+    span[5] += w * record['net_change']
+    span[6] = min(span[6], timestamp)
+    span[7] = max(span[7], timestamp)
+
+
+class SessionIndex:
+    """统计目录的会话索引（可作为上下文管理器使用）"""
+
+    def __init__(self, stats_dir):
+        self.stats_dir = Path(stats_dir)
+        self.conn = sqlite3.connect(self.stats_dir / INDEX_NAME, timeout=10)
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if version != INDEX_VERSION:
+            self.conn.executescript("DROP TABLE IF EXISTS files; DROP TABLE IF EXISTS spans;")
+            self.conn.execute(f"PRAGMA user_version = {INDEX_VERSION}")
+        self.conn.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def _index_raw(self, date_str, path, entry):
+        """增量索引原始文件中新追加的完整行"""
+        with view_stats.MappedStatsFile(path) as mapped:
+            offset = 0
+            if entry is not None and entry[0] == path.name and entry[1] == mapped.ino \
+                    and entry[2] <= mapped.size:
+                offset = entry[2]
+            complete = mapped.complete_size()
+            if entry is not None and offset == entry[2] == complete:
+                return
+
+            spans = {}
+            for start, end in mapped.line_spans(offset, complete):
+                record = mapped.decode_line(start, end)
+                if record is None:
+                    record = view_stats.salvage_record(mapped.read_bytes(start, end))
+                if record is not None:
+                    _add(spans, record, start, end)
+            ino = mapped.ino
+
+        with self.conn:
+            if offset == 0:
+                self.conn.execute("DELETE FROM spans WHERE date = ?", (date_str,))
+            self.conn.executemany(UPSERT, [(session_id, date_str, *span) for session_id, span in spans.items()])
+            self.conn.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                              (date_str, path.name, ino, complete))
+
+    def _index_archive(self, date_str, path, entry):
+        """归档文件内容不变，只在首次遇到时完整读取一次（不记录字节范围）"""
+        ino = path.stat().st_ino
+        if entry is not None and entry[0] == path.name and entry[1] == ino:
+            return
+
+        spans = {}
+        for record in view_stats.iter_stats_file(date_str, stats_dir=self.stats_dir):
+            _add(spans, record, None, None)
+
+        with self.conn:
+            self.conn.execute("DELETE FROM spans WHERE date = ?", (date_str,))
+            self.conn.executemany(UPSERT, [(session_id, date_str, *span) for session_id, span in spans.items()])
+            self.conn.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                              (date_str, path.name, ino, -1))
+
+    def update(self):
+        """把索引同步到统计目录的当前状态"""
+        indexed = {row[0]: row[1:] for row in self.conn.execute("SELECT date, name, ino, offset FROM files")}
+        dates = view_stats.list_available_dates(self.stats_dir)
+
+        for date_str in dates:
+            path = stats_archive.find_day_file(date_str, self.stats_dir)
+            if path is None:
+                continue
+            if stats_archive.archive_codec(path):
+                self._index_archive(date_str, path, indexed.get(date_str))
+            else:
+                self._index_raw(date_str, path, indexed.get(date_str))
+
+        removed = set(indexed) - set(dates)
+        if removed:
+            with self.conn:
+                for date_str in removed:
+                    self.conn.execute("DELETE FROM spans WHERE date = ?", (date_str,))
+                    self.conn.execute("DELETE FROM files WHERE date = ?", (date_str,))
+
+    def lookup(self, session_id):
+        """会话出现过的各天：按日期排序的区间汇总字典列表"""
+        rows = self.conn.execute(
+            f"SELECT {', '.join(SPAN_FIELDS)} FROM spans WHERE session_id = ? ORDER BY date",
+            (session_id,)
+        )
+        return [dict(zip(SPAN_FIELDS, row)) for row in rows]
+
+    def summary(self, session_id):
+        """合并会话跨越的所有日期，返回汇总字典（会话不存在时返回 None）"""
+        days = self.lookup(session_id)
+        if not days:
+            return None
+        return {
+            'session_id': session_id,
+            'days': [d['date'] for d in days],
+            'operations': sum(d['operations'] for d in days),
+            'additions': sum(d['additions'] for d in days),
+            'deletions': sum(d['deletions'] for d in days),
+            'net_change': sum(d['net_change'] for d in days),
+            'first_time': min(d['first_time'] for d in days),
+            'last_time': max(d['last_time'] for d in days),
+        }
+
+    def iter_records(self, session_id):
+        """
+        按时间顺序产出会话的所有记录。
+        原始文件直接映射并只解析索引记录的字节区间，归档日期读取后按会话过滤。
+        """
+        for day in self.lookup(session_id):
+            yield from self.iter_day_records(session_id, day)
+
+    def iter_day_records(self, session_id, day):
+        """产出会话在某天（lookup 返回的一项）的记录"""
+        if day['start'] is None:
+            records = view_stats.iter_stats_file(day['date'], stats_dir=self.stats_dir)
+        else:
+            path = self.stats_dir / f"{day['date']}.jsonl"
+            records = _iter_span(path, day['start'], day['end'])
+        for record in records:
+            if record.get('session_id', 'unknown') == session_id:
+                yield record
+
+
+def _iter_span(path, start, end):
+    """解析原始文件 [start, end) 内的记录"""
+    with view_stats.MappedStatsFile(path) as mapped:
+        yield from view_stats.scan_spans(mapped, start, min(end, mapped.size))
+
+
+def open_index(stats_dir):
+    """打开并同步统计目录的会话索引"""
+    index = SessionIndex(stats_dir)
+    index.update()
+    return index
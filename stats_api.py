@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+统计查询 API。
+脚本需要数字时直接导入本模块，不必解析 view_stats.py 的输出：
+
+    from stats_api import Stats
+
+    query = (Stats.open('code-log')
+             .range('2026-01-01', '2026-01-31')
+             .filter(user='dev@example.com')
+             .group_by('tool', 'hour')
+             .agg('operations', 'additions'))
+    for row in query:
+        print(row['tool'], row['hour'], row['operations'], row['additions'])
+
+链式调用只记录查询条件，遍历结果时才执行。执行前为每个日期选择最便宜的数据来源：
+  counters  运行计数文件（.counters），只读几个槽位，不解析日期文件
+  index     会话索引：按会话过滤时只读该会话出现过的日期和字节区间，只需行数时直接用索引中的汇总
+  rollup    已被 retention_stats.py 汇总的日期，只读汇总行
+  binary    与日期文件一致的二进制存储（stats_binary.py），在定长元组上聚合，不解析 JSON
+  scan      逐行扫描日期文件（包括归档）
+explain() 返回执行计划。结果与 view_stats 的聚合一致（采样记录按权重、汇总行按操作数计入）。
+"""
+
+import copy
+from pathlib import Path
+
+import stats_binary
+import stats_codec
+import stats_counters
+import view_stats
+
+# 可过滤 / 分组的维度：维度名 -> (记录字段, 缺省值)
+KEY_FIELDS = dict(view_stats.GROUP_KEYS)
+
+# 按时间分组的维度：维度名 -> 取时间戳的前几个字符（date 为 YYYY-MM-DD，hour 为 YYYY-MM-DDTHH）
+TIME_KEYS = {'date': 10, 'hour': 13}
+
+GROUP_KEYS = tuple(TIME_KEYS) + tuple(KEY_FIELDS)
+
+# 相加的指标
+SUM_METRICS = ('operations', 'additions', 'deletions', 'net_change') + stats_codec.CONTENT_FIELDS
+
+# 取最早 / 最晚时间的指标
+TIME_METRICS = ('first_time', 'last_time')
+
+METRICS = SUM_METRICS + TIME_METRICS
+
+# 运行计数和会话索引能直接提供的指标
+COUNTER_METRICS = stats_counters.COUNT_FIELDS
+INDEX_METRICS = stats_counters.COUNT_FIELDS + TIME_METRICS
+
+
+class Stats:
+    """一个惰性查询：range / filter / group_by / agg 返回新的查询，遍历时执行"""
+
+    def __init__(self, stats_dir):
+        self.stats_dir = Path(stats_dir)
+        self.from_date = None
+        self.to_date = None
+        self.filters = {}
+        self.keys = ()
+        self.metrics = SUM_METRICS
+
+    @classmethod
+    def open(cls, stats_dir=None):
+        """打开统计目录（默认 code-log）"""
+        stats_dir = Path(stats_dir) if stats_dir else view_stats.STATS_DIR
+        if not stats_dir.is_dir():
+            raise FileNotFoundError(f"统计目录不存在: {stats_dir}")
+        return cls(stats_dir)
+
+    def _derive(self, **changes):
+        query = copy.copy(self)
+        query.__dict__.update(changes)
+        return query
+
+    def range(self, from_date=None, to_date=None):
+        """限定日期范围（含两端，YYYY-MM-DD）"""
+        return self._derive(from_date=from_date, to_date=to_date)
+
+    def filter(self, **conditions):
+        """按 user / tool / session 精确过滤，多个条件同时满足"""
+        filters = dict(self.filters)
+        for key, value in conditions.items():
+            value = str(value)
+            if key not in KEY_FIELDS:
+                raise ValueError(f"不能按 '{key}' 过滤（可用：{'、'.join(KEY_FIELDS)}）")
+            if filters.get(key, value) != value:
+                raise ValueError(f"'{key}' 已有不同的过滤条件")
+            filters[key] = value
+        return self._derive(filters=filters)
+
+    def group_by(self, *keys):
+        """按维度分组：date、hour、user、tool、session（不分组时只返回一行合计）"""
+        for key in keys:
+            if key not in GROUP_KEYS:
+                raise ValueError(f"不能按 '{key}' 分组（可用：{'、'.join(GROUP_KEYS)}）")
+        return self._derive(keys=tuple(dict.fromkeys(keys)))
+
+    def agg(self, *metrics):
+        """选择输出的指标（默认所有相加的指标）"""
+        for metric in metrics:
+            if metric not in METRICS:
+                raise ValueError(f"未知的指标 '{metric}'（可用：{'、'.join(METRICS)}）")
+        return self._derive(metrics=tuple(dict.fromkeys(metrics)) or SUM_METRICS)
+
+    # ---------- 执行计划 ----------
+
+    def dates(self):
+        """范围内有数据的日期"""
+        return [d for d in view_stats.list_available_dates(self.stats_dir)
+                if (self.from_date is None or d >= self.from_date) and (self.to_date is None or d <= self.to_date)]
+
+    def _counter_lookup(self):
+        """能由运行计数回答时返回 (类别, 键)，键为 None 表示该类别的全部条目；否则返回 None"""
+        kinds = [key for key in self.keys if key != 'date']
+        if not set(self.metrics) <= set(COUNTER_METRICS) or 'hour' in kinds or len(kinds) > 1 \
+                or len(self.filters) > 1:
+            return None
+        if self.filters:
+            (kind, value), = self.filters.items()
+            if kinds and kinds[0] != kind:
+                return None
+            return kind, value
+        if kinds:
+            return kinds[0], None
+        return 'day', ''
+
+    def _index_days(self):
+        """按会话过滤时，从会话索引取该会话出现过的日期：日期 -> 区间汇总；索引不可用时返回 None"""
+        import session_index
+        import sqlite3
+
+        try:
+            with session_index.open_index(self.stats_dir) as index:
+                days = index.lookup(self.filters['session'])
+        except (sqlite3.Error, OSError):
+            return None
+        return {day['date']: day for day in days}
+
+    def plan(self):
+        """执行计划：[(日期, 来源, 附加信息), ...]，来源为 counters / index / rollup / binary / scan"""
+        from retention_stats import day_level
+
+        counter_lookup = self._counter_lookup()
+        index_days = self._index_days() if 'session' in self.filters else None
+        index_only = (set(self.metrics) <= set(INDEX_METRICS) and set(self.keys) <= {'date', 'session'}
+                      and set(self.filters) == {'session'})
+
+        steps = []
+        for date_str in self.dates():
+            raw = (self.stats_dir / f"{date_str}.jsonl").exists()
+            if index_days is not None:
+                # 会话没有出现过的日期不需要读取
+                if date_str in index_days:
+                    steps.append((date_str, 'index', (index_days[date_str], index_only)))
+            elif counter_lookup and raw:
+                steps.append((date_str, 'counters', counter_lookup))
+            elif raw and stats_binary.fresh_store(self.stats_dir, date_str, strings=False):
+                steps.append((date_str, 'binary', None))
+            else:
+                level = day_level(date_str, self.stats_dir)
+                if level is not None:
+                    steps.append((date_str, 'rollup' if level != 'raw' else 'scan', level))
+        return steps
+
+    def explain(self):
+        """执行计划的文字说明"""
+        labels = {
+            'counters': lambda info: f"运行计数（{info[0]}{':' + info[1] if info[1] else ''}）",
+            'index': lambda info: "会话索引汇总" if info[1] else "会话索引定位的字节区间",
+            'rollup': lambda info: f"{'按小时' if info == 'hour' else '按天'}汇总行",
+            'binary': lambda info: "二进制存储",
+            'scan': lambda info: "扫描日期文件",
+        }
+        lines = [f"{date_str}: {labels[source](info)}" for date_str, source, info in self.plan()]
+        return '\n'.join(lines) or "（没有需要读取的日期）"
+
+    # ---------- 执行 ----------
+
+    def _matches(self, record):
+        for key, value in self.filters.items():
+            field, default = KEY_FIELDS[key]
+            if str(record.get(field, default)) != value:
+                return False
+        return True
+
+    def _record_key(self, record):
+        key = []
+        for name in self.keys:
+            if name in TIME_KEYS:
+                key.append(record.get('timestamp', '')[:TIME_KEYS[name]])
+            else:
+                field, default = KEY_FIELDS[name]
+                key.append(str(record.get(field, default)))
+        return tuple(key)
+
+    def _scan(self, records):
+        """产出 (分组键, 部分结果)：每条匹配的记录一项"""
+        for record in records:
+            if not self._matches(record):
+                continue
+            w = record.get('weight', 1)
+            values = {'operations': record.get('operations', w)}
+            for field in SUM_METRICS[1:]:
+                values[field] = w * record.get(field, 0)
+            values['first_time'] = values['last_time'] = record.get('timestamp', '')
+            yield self._record_key(record), values
+
+    def _from_counters(self, date_str, lookup):
+        view_stats.refresh_counters(date_str, self.stats_dir)
+        counters = stats_counters.open_counters(self.stats_dir, date_str)
+        if counters is None:
+            # 计数文件不可用（例如目录只读且尚未建立），退回扫描
+            yield from self._scan(view_stats.iter_stats_file(date_str, stats_dir=self.stats_dir))
+            return
+        kind, value = lookup
+        with counters:
+            if value is None:
+                entries = list(counters.entries(kind))
+            else:
+                counts = counters.get(kind, value)
+                entries = [(kind, value, counts)] if counts else []
+        for _, entry_key, counts in entries:
+            yield tuple(date_str if name == 'date' else entry_key for name in self.keys), counts
+
+    def _from_index(self, date_str, info):
+        day, index_only = info
+        session_id = self.filters['session']
+        if index_only:
+            yield tuple(date_str if name == 'date' else session_id for name in self.keys), day
+            return
+        import session_index
+        index = session_index.SessionIndex(self.stats_dir)
+        try:
+            yield from self._scan(index.iter_day_records(session_id, day))
+        finally:
+            index.close()
+
+    def _from_binary(self, date_str):
+        day = stats_binary.open_day(self.stats_dir, date_str)
+        if day is None:
+            # 计划之后 hook 又写入了记录，存储可能暂时落后，退回扫描
+            yield from self._scan(view_stats.iter_stats_file(date_str, stats_dir=self.stats_dir))
+            return
+        yield from stats_binary.aggregate(*day, self.keys, self.filters).items()
+
+    def __iter__(self):
+        groups = {}
+        for date_str, source, info in self.plan():
+            if source == 'counters':
+                partials = self._from_counters(date_str, info)
+            elif source == 'index':
+                partials = self._from_index(date_str, info)
+            elif source == 'binary':
+                partials = self._from_binary(date_str)
+            else:
+                partials = self._scan(view_stats.iter_stats_file(date_str, stats_dir=self.stats_dir))
+            for key, values in partials:
+                row = groups.get(key)
+                if row is None:
+                    groups[key] = {metric: values[metric] for metric in self.metrics}
+                    continue
+                for metric in self.metrics:
+                    if metric == 'first_time':
+                        row[metric] = min(row[metric], values[metric])
+                    elif metric == 'last_time':
+                        row[metric] = max(row[metric], values[metric])
+                    else:
+                        row[metric] += values[metric]
+
+        for key in sorted(groups):
+            row = dict(zip(self.keys, key))
+            row.update(groups[key])
+            yield row
+
+    def rows(self):
+        """执行查询，返回结果行列表（按分组键排序）"""
+        return list(self)
+
+    def total(self):
+        """不分组的合计（没有数据时各指标为 0）"""
+        for row in self.group_by():
+            return row
+        return {metric: (None if metric in TIME_METRICS else 0) for metric in self.metrics}
+
+    def records(self):
+        """按时间顺序产出范围内满足过滤条件的原始记录（按会话过滤时通过会话索引定位）"""
+        index_days = self._index_days() if 'session' in self.filters else None
+        for date_str in self.dates():
+            if index_days is None:
+                records = view_stats.iter_stats_file(date_str, stats_dir=self.stats_dir)
+            elif date_str in index_days:
+                import session_index
+                index = session_index.SessionIndex(self.stats_dir)
+                try:
+                    records = list(index.iter_day_records(self.filters['session'], index_days[date_str]))
+                finally:
+                    index.close()
+            else:
+                continue
+            for record in records:
+                if self._matches(record):
+                    yield record
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+历史统计文件归档工具。
+将已结束日期的 JSONL 文件转换为分块压缩格式（gzip 或 zstd），
+每个块独立压缩，并生成记录各块时间范围和偏移量的小索引，
+查看工具可以透明读取，并只解压时间范围内需要的块。
+
+归档文件布局：
+  YYYY-MM-DD.jsonl.gz       多个独立 gzip member 顺序拼接（可直接用 gzip -dc 解压）
+  YYYY-MM-DD.jsonl.gz.idx   JSON 索引：每个块的 [最小时间, 最大时间, 偏移, 长度, 记录数]
+"""
+
+import gzip
+import io
+import os
+import sys
+from pathlib import Path
+from datetime import datetime, timezone, timedelta
+
+import stats_codec
+
+# 路径配置
+SCRIPT_DIR = Path(__file__).resolve().parent
+STATS_DIR = SCRIPT_DIR / "code-log"
+
+# 归档后缀 -> 压缩算法
+ARCHIVE_SUFFIXES = {
+    '.gz': 'gzip',
+    '.zst': 'zstd',
+}
+CODEC_SUFFIXES = {codec: suffix for suffix, codec in ARCHIVE_SUFFIXES.items()}
+
+INDEX_SUFFIX = '.idx'
+INDEX_VERSION = 1
+
+# 默认块大小（未压缩字节数）
+DEFAULT_BLOCK_SIZE = 256 * 1024
+
+
+def _zstd():
+    """导入可选的 zstandard 库"""
+    try:
+        import zstandard
+    except ImportError:
+        raise RuntimeError("zstd 压缩需要安装 zstandard：pip install zstandard")
+    return zstandard
+
+
+def compress_block(codec, data):
+    """压缩一个独立块"""
+    if codec == 'gzip':
+        # mtime=0 保证相同输入得到相同输出
+        return gzip.compress(data, compresslevel=6, mtime=0)
+    if codec == 'zstd':
+        return _zstd().ZstdCompressor(level=9).compress(data)
+    raise ValueError(f"不支持的压缩算法：{codec}")
+
+
+def decompress_block(codec, data):
+    """解压一个独立块"""
+    if codec == 'gzip':
+        return gzip.decompress(data)
+    if codec == 'zstd':
+        return _zstd().ZstdDecompressor().decompress(data)
+    raise ValueError(f"不支持的压缩算法：{codec}")
+
+
+def archive_codec(path):
+    """根据文件名返回归档的压缩算法，非归档文件返回 None"""
+    return ARCHIVE_SUFFIXES.get(Path(path).suffix)
+
+
+def index_path(archive_path):
+    """归档文件对应的索引文件路径"""
+    archive_path = Path(archive_path)
+    return archive_path.with_name(archive_path.name + INDEX_SUFFIX)
+
+
+def find_day_file(date_str, stats_dir=None):
+    """
+    查找指定日期的数据文件。
+    优先返回原始 JSONL，其次是归档文件；都不存在时返回 None。
+    """
+    stats_dir = Path(stats_dir) if stats_dir else STATS_DIR
+    raw_path = stats_dir / f"{date_str}.jsonl"
+    if raw_path.exists():
+        return raw_path
+    for suffix in ARCHIVE_SUFFIXES:
+        archive_path = stats_dir / f"{date_str}.jsonl{suffix}"
+        if archive_path.exists():
+            return archive_path
+    return None
+
+
+def read_index(archive_path):
+    """读取归档索引，索引缺失或损坏时返回 None"""
+    try:
+        with open(index_path(archive_path), 'rb') as f:
+            index = stats_codec.loads(f.read())
+        if index.get('version') != INDEX_VERSION:
+            return None
+        return index
+    except (OSError, ValueError):
+        return None
+
+
+def _block_overlaps(block, start, end):
+    """判断块的时间范围是否与 [start, end) 相交"""
+    min_ts, max_ts = block[0], block[1]
+    if start is not None and max_ts < start:
+        return False
+    if end is not None and min_ts >= end:
+        return False
+    return True
+
+
+def iter_archive_blocks(archive_path, start=None, end=None, reverse=False):
+    """
+    逐块解压归档文件，产出每个块的原始字节。
+    提供 start / end（ISO 时间字符串）时，只解压时间范围相交的块。
+    索引缺失时退化为顺序解压整个文件。
+    """
+    codec = archive_codec(archive_path)
+    index = read_index(archive_path)
+
+    if index is None:
+        with open(archive_path, 'rb') as f:
+            data = f.read()
+        if codec == 'gzip':
+            yield gzip.decompress(data)
+        else:
+            reader = _zstd().ZstdDecompressor().stream_reader(io.BytesIO(data), read_across_frames=True)
+            with reader:
+                yield reader.read()
+        return
+
+    blocks = [b for b in index['blocks'] if _block_overlaps(b, start, end)]
+    if reverse:
+        blocks.reverse()
+
+    with open(archive_path, 'rb') as f:
+        for block in blocks:
+            offset, length = block[2], block[3]
+            f.seek(offset)
+            yield decompress_block(codec, f.read(length))
+
+
+def iter_archive_lines(archive_path, start=None, end=None):
+    """逐行产出归档中的记录（bytes，不含换行符），只解压需要的块"""
+    for data in iter_archive_blocks(archive_path, start, end):
+        for line in data.split(b'\n'):
+            if line:
+                yield line
+
+
+def archive_day(raw_path, codec='gzip', block_size=DEFAULT_BLOCK_SIZE, keep_raw=False):
+    """
+    将一个原始 JSONL 文件转换为分块压缩归档。
+    先写临时文件再原子替换，最后删除原始文件（keep_raw 时保留）。
+
+    返回：{'raw_bytes', 'archive_bytes', 'blocks', 'records', 'path'}
+    """
+    raw_path = Path(raw_path)
+    archive_path = raw_path.with_name(raw_path.name + CODEC_SUFFIXES[codec])
+    tmp_archive = archive_path.with_name(archive_path.name + '.part')
+    tmp_index = index_path(archive_path).with_name(index_path(archive_path).name + '.part')
+
+    blocks = []
+    total_records = 0
+    offset = 0
+
+    with open(raw_path, 'rb') as src, open(tmp_archive, 'wb') as dst:
+        pending = []
+        pending_bytes = 0
+        min_ts = max_ts = None
+
+        def flush():
+            nonlocal offset, pending, pending_bytes, min_ts, max_ts
+            if not pending:
+                return
+            data = compress_block(codec, b''.join(pending))
+            dst.write(data)
+            blocks.append([min_ts or '', max_ts or '', offset, len(data), len(pending)])
+            offset += len(data)
+            pending = []
+            pending_bytes = 0
+            min_ts = max_ts = None
+
+        for line in src:
+            if not line.strip():
+                continue
+            if not line.endswith(b'\n'):
+                line += b'\n'
+            try:
+                timestamp = stats_codec.loads(line).get('timestamp')
+            except (ValueError, AttributeError):
+                # 无法解析的行原样保留，不参与块的时间范围
+                timestamp = None
+            if isinstance(timestamp, str):
+                min_ts = timestamp if min_ts is None else min(min_ts, timestamp)
+                max_ts = timestamp if max_ts is None else max(max_ts, timestamp)
+            pending.append(line)
+            pending_bytes += len(line)
+            total_records += 1
+            if pending_bytes >= block_size:
+                flush()
+        flush()
+        dst.flush()
+        os.fsync(dst.fileno())
+
+    index = {
+        'version': INDEX_VERSION,
+        'codec': codec,
+        'records': total_records,
+        'raw_bytes': raw_path.stat().st_size,
+        'blocks': blocks,
+    }
+    with open(tmp_index, 'w', encoding='utf-8') as f:
+        f.write(stats_codec.dumps(index))
+
+    # 先发布索引再发布归档，读取方看到归档时索引已就绪
+    os.replace(tmp_index, index_path(archive_path))
+    os.replace(tmp_archive, archive_path)
+
+    raw_bytes = index['raw_bytes']
+    if not keep_raw:
+        raw_path.unlink()
+
+    return {
+        'path': archive_path,
+        'raw_bytes': raw_bytes,
+        'archive_bytes': archive_path.stat().st_size + index_path(archive_path).stat().st_size,
+        'blocks': len(blocks),
+        'records': total_records,
+    }
+
+
+def closed_day_files(stats_dir, before):
+    """列出早于 before 日期的原始 JSONL 文件（已结束写入的日期）"""
+    files = []
+    for path in sorted(Path(stats_dir).glob("*.jsonl")):
+        try:
+            day = datetime.strptime(path.stem, "%Y-%m-%d").date()
+        except ValueError:
+            continue
+        if day < before:
+            files.append(path)
+    return files
+
+
+def format_size(num_bytes):
+    """格式化字节数"""
+    if num_bytes < 1024:
+        return f"{num_bytes} B"
+    size = num_bytes / 1024
+    for unit in ('KB', 'MB'):
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+
+def main():
+    """主函数"""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='将已结束日期的统计文件转换为分块压缩归档',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+示例：
+  %(prog)s                          # 归档今天之前的所有日期（gzip）
+  %(prog)s --codec zstd             # 使用 zstd 压缩（需要 zstandard）
+  %(prog)s --before 2026-01-01      # 只归档 2026-01-01 之前的日期
+  %(prog)s --keep-raw               # 保留原始 JSONL 文件
+        """
+    )
+
+    parser.add_argument('--codec', choices=sorted(CODEC_SUFFIXES), default='gzip', help='压缩算法（默认 gzip）')
+    parser.add_argument('--before', help='只归档早于该日期的文件（YYYY-MM-DD，默认今天）')
+    parser.add_argument('--block-size', type=int, default=DEFAULT_BLOCK_SIZE // 1024, metavar='KB',
+                        help='每个压缩块的未压缩大小（KB，默认 256）')
+    parser.add_argument('--keep-raw', action='store_true', help='归档后保留原始 JSONL 文件')
+    parser.add_argument('--dir', help='统计目录（默认 code-log）')
+
+    args = parser.parse_args()
+
+    stats_dir = Path(args.dir) if args.dir else STATS_DIR
+    if not stats_dir.exists():
+        print(f"错误：统计目录不存在: {stats_dir}", file=sys.stderr)
+        sys.exit(1)
+
+    if args.before:
+        before = datetime.strptime(args.before, "%Y-%m-%d").date()
+    else:
+        before = datetime.now(timezone(timedelta(hours=8))).date()
+
+    files = closed_day_files(stats_dir, before)
+    if not files:
+        print("没有需要归档的文件")
+        return
+
+    if args.codec == 'zstd':
+        _zstd()
+
+    total_raw = 0
+    total_archived = 0
+    for path in files:
+        result = archive_day(path, codec=args.codec, block_size=args.block_size * 1024, keep_raw=args.keep_raw)
+        total_raw += result['raw_bytes']
+        total_archived += result['archive_bytes']
+        ratio = result['archive_bytes'] / result['raw_bytes'] if result['raw_bytes'] else 0
+        print(f"{path.stem}: {result['records']:6d} 条记录 | {result['blocks']:3d} 块 | "
+              f"{format_size(result['raw_bytes'])} -> {format_size(result['archive_bytes'])} ({ratio:.1%})")
+
+    saved = total_raw - total_archived
+    saved_ratio = saved / total_raw if total_raw else 0
+    print(f"\n共归档 {len(files)} 个文件：{format_size(total_raw)} -> {format_size(total_archived)}，"
+          f"节省 {format_size(saved)}（{saved_ratio:.1%}）")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\n\n已取消", file=sys.stderr)
+        sys.exit(130)
+    except Exception as e:
+        print(f"错误：{e}", file=sys.stderr)
+        import traceback
+        traceback.print_exc(file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,564 @@
+#!/usr/bin/env python3
+"""
+紧凑的二进制记录存储（可选，与 JSONL 并存）。
+JSONL 的每一行都重复完整的时间字符串、邮箱、会话 ID 和键名，查看工具的大部分时间花在解析上。
+二进制存储把一天的记录保存为 code-log/.binary/YYYY-MM-DD.rec 中的定长结构
+（微秒时间戳、int32 计数、字符串编码），邮箱、会话和工具字符串只在当天的字典文件 .str 中出现一次；
+查看工具用 struct.iter_unpack 在 memoryview 上解码，不解析 JSON；查询 API 直接在解码出的元组上聚合，
+不为每条记录构造字典。
+
+JSONL 仍是唯一的权威数据：.rec 文件头记录它对应的日期文件 inode 和已转换的字节位置，
+hook 在追加记录的同一把锁内同步（与运行计数相同，其他工具追加的行在下次同步时补齐，
+日期文件被替换时整体重建）；文件头与日期文件不一致时查看工具直接读取 JSONL。
+在 config.json 中设置 "binary_store": true 后 hook 开始写入，已有的日期可用本脚本转换。
+"""
+
+import os
+import struct
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import stats_codec
+
+BINARY_DIR_NAME = ".binary"
+
+MAGIC = b'CSBR'
+VERSION = 2
+
+# 文件头：魔数、版本、记录长度、日期文件 inode、已转换的字节位置、记录数、字典文件长度、
+# 遇到无法编码的记录时的日期文件大小（0 表示没有）
+HEADER = struct.Struct('<4sHHQQQQQ')
+
+# 记录：微秒时间戳、时区偏移（分钟）、邮箱编码、工具编码、标志位、会话编码、
+# 新增 / 删除 / 净变化、五个内容指标、权重、操作数
+RECORD = struct.Struct('<qhHHHIiiiiiiiiII')
+
+# 字典条目：类别、UTF-8 长度，之后是字符串
+STRING = struct.Struct('<BH')
+STRING_KINDS = ('email', 'tool', 'session_id')
+
+# 标志位：0-4 位为各内容指标是否存在（CONTENT_FIELDS 顺序），之后为可选字段
+FLAG_WEIGHT = 1 << 5
+FLAG_OPERATIONS = 1 << 6
+SAMPLING_SHIFT = 7      # 2 位：0 无、1 record、2 session
+ROLLUP_SHIFT = 9        # 2 位：0 无、1 hour、2 day
+SAMPLING_MODES = (None, 'record', 'session')
+ROLLUP_LEVELS = (None, 'hour', 'day')
+
+CONTENT_FIELDS = stats_codec.CONTENT_FIELDS
+BASE_FIELDS = ('timestamp', 'session_id', 'email', 'tool', 'additions', 'deletions', 'net_change')
+KNOWN_FIELDS = set(BASE_FIELDS + CONTENT_FIELDS + ('weight', 'sampling', 'operations', 'rollup'))
+
+INT32 = (-2 ** 31, 2 ** 31 - 1)
+UINT16_MAX = 2 ** 16 - 1
+UINT32_MAX = 2 ** 32 - 1
+
+_timezones = {}
+
+
+def store_paths(stats_dir, date_str):
+    """某天的 (记录文件, 字典文件)"""
+    base = Path(stats_dir) / BINARY_DIR_NAME / date_str
+    return base.with_suffix('.rec'), base.with_suffix('.str')
+
+
+def _tz(minutes):
+    tz = _timezones.get(minutes)
+    if tz is None:
+        tz = _timezones[minutes] = timezone(timedelta(minutes=minutes))
+    return tz
+
+
+def format_timestamp(micros, tz_minutes):
+    """微秒时间戳 -> 与 hook 相同格式的 ISO 时间"""
+    seconds, micro = divmod(micros, 1000000)
+    return datetime.fromtimestamp(seconds, _tz(tz_minutes)).replace(microsecond=micro).isoformat()
+
+
+def parse_timestamp(value):
+    """
+    ISO 时间 -> (微秒时间戳, 时区偏移分钟)；无法原样还原（没有时区、格式不同）时返回 None
+    """
+    try:
+        moment = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+    offset = moment.utcoffset()
+    if offset is None or offset % timedelta(minutes=1):
+        return None
+    epoch = datetime(1970, 1, 1, tzinfo=timezone.utc)
+    micros = (moment - epoch) // timedelta(microseconds=1)
+    tz_minutes = offset // timedelta(minutes=1)
+    if format_timestamp(micros, tz_minutes) != value:
+        return None
+    return micros, tz_minutes
+
+
+class StringTable:
+    """当天的字符串字典：每个类别按首次出现的顺序编码"""
+
+    def __init__(self):
+        self.values = {kind: [] for kind in STRING_KINDS}
+        self.codes = {kind: {} for kind in STRING_KINDS}
+        self.pending = []
+
+    @classmethod
+    def load(cls, data):
+        table = cls()
+        offset = 0
+        while offset + STRING.size <= len(data):
+            kind, length = STRING.unpack_from(data, offset)
+            end = offset + STRING.size + length
+            if kind >= len(STRING_KINDS) or end > len(data):
+                break
+            table._append(STRING_KINDS[kind], bytes(data[offset + STRING.size:end]).decode('utf-8', 'surrogatepass'))
+            offset = end
+        return table, offset
+
+    def _append(self, kind, value):
+        self.codes[kind][value] = len(self.values[kind])
+        self.values[kind].append(value)
+
+    def code(self, kind, value):
+        """字符串的编码；新字符串追加到字典并记入待写入的条目"""
+        code = self.codes[kind].get(value)
+        if code is None:
+            data = value.encode('utf-8', 'surrogatepass')
+            limit = UINT32_MAX if kind == 'session_id' else UINT16_MAX
+            if len(data) > UINT16_MAX or len(self.values[kind]) >= limit:
+                raise ValueError(f"{kind} 无法编码")
+            code = len(self.values[kind])
+            self._append(kind, value)
+            self.pending.append(STRING.pack(STRING_KINDS.index(kind), len(data)) + data)
+        return code
+
+    def take_pending(self):
+        data = b''.join(self.pending)
+        self.pending = []
+        return data
+
+
+def encode_record(record, strings):
+    """
+    记录 -> 定长二进制；含有无法原样还原的内容（未知字段、超出 int32 的计数、非字符串键等）时抛出 ValueError。
+    """
+    if not KNOWN_FIELDS.issuperset(record):
+        raise ValueError(f"未知字段: {sorted(set(record) - KNOWN_FIELDS)}")
+    parsed = parse_timestamp(record.get('timestamp'))
+    if parsed is None:
+        raise ValueError("时间格式无法原样还原")
+    for field in ('session_id', 'email', 'tool'):
+        if not isinstance(record.get(field), str):
+            raise ValueError(f"{field} 不是字符串")
+
+    flags = 0
+    counts = [record['additions'], record['deletions'], record['net_change']]
+    for i, field in enumerate(CONTENT_FIELDS):
+        if field in record:
+            flags |= 1 << i
+        counts.append(record.get(field, 0))
+    if 'weight' in record:
+        flags |= FLAG_WEIGHT
+    if 'operations' in record:
+        flags |= FLAG_OPERATIONS
+    sampling = record.get('sampling')
+    rollup = record.get('rollup')
+    if sampling not in SAMPLING_MODES or rollup not in ROLLUP_LEVELS:
+        raise ValueError("未知的采样模式或汇总粒度")
+    flags |= SAMPLING_MODES.index(sampling) << SAMPLING_SHIFT
+    flags |= ROLLUP_LEVELS.index(rollup) << ROLLUP_SHIFT
+
+    weight = record.get('weight', 1)
+    operations = record.get('operations', 0)
+    for value in counts:
+        if not isinstance(value, int) or isinstance(value, bool) or not INT32[0] <= value <= INT32[1]:
+            raise ValueError("计数超出 int32 范围")
+    for value in (weight, operations):
+        if not isinstance(value, int) or isinstance(value, bool) or not 0 <= value <= UINT32_MAX:
+            raise ValueError("权重或操作数超出范围")
+
+    return RECORD.pack(parsed[0], parsed[1], strings.code('email', record['email']),
+                       strings.code('tool', record['tool']), flags,
+                       strings.code('session_id', record['session_id']),
+                       *counts, weight, operations)
+
+
+def iter_decode(data, strings):
+    """在记录区（bytes / memoryview）上用 struct.iter_unpack 解码，产出与 JSONL 相同的记录字典"""
+    emails = strings.values['email']
+    tools = strings.values['tool']
+    sessions = strings.values['session_id']
+    # 记录按时间追加，相邻记录多在同一分钟内：每分钟只用 datetime 格式化一次，秒和微秒直接拼接
+    minute_key = None
+    prefix = offset = ''
+    for (micros, tz_minutes, email, tool, flags, session, additions, deletions, net_change,
+         *content, weight, operations) in RECORD.iter_unpack(data):
+        seconds, micro = divmod(micros, 1000000)
+        minute, second = divmod(seconds, 60)
+        if (minute, tz_minutes) != minute_key:
+            minute_key = (minute, tz_minutes)
+            text = datetime.fromtimestamp(minute * 60, _tz(tz_minutes)).isoformat()
+            prefix, offset = text[:16], text[19:]
+        if micro:
+            timestamp = f"{prefix}:{second:02d}.{micro:06d}{offset}"
+        else:
+            timestamp = f"{prefix}:{second:02d}{offset}"
+        record = {
+            'timestamp': timestamp,
+            'session_id': sessions[session],
+            'email': emails[email],
+            'tool': tools[tool],
+            'additions': additions,
+            'deletions': deletions,
+            'net_change': net_change,
+        }
+        if flags & 0x1f:
+            for i, field in enumerate(CONTENT_FIELDS):
+                if flags & (1 << i):
+                    record[field] = content[i]
+        if flags & FLAG_WEIGHT:
+            record['weight'] = weight
+        sampling = (flags >> SAMPLING_SHIFT) & 3
+        if sampling:
+            record['sampling'] = SAMPLING_MODES[sampling]
+        if flags & FLAG_OPERATIONS:
+            record['operations'] = operations
+        rollup = (flags >> ROLLUP_SHIFT) & 3
+        if rollup:
+            record['rollup'] = ROLLUP_LEVELS[rollup]
+        yield record
+
+
+# 分组 / 过滤维度 -> (字典类别, 元组中的位置)；date / hour 由时间戳计算
+KEY_KINDS = {'user': ('email', 2), 'tool': ('tool', 3), 'session': ('session_id', 5)}
+# 时间维度 -> (ISO 时间的前几位, 时间序号的单位（秒）, 元组末尾追加的位置)
+TIME_KEYS = {'date': (10, 86400, 16), 'hour': (13, 3600, 17)}
+
+# aggregate 返回的相加指标（顺序与 stats_api.SUM_METRICS 相同）
+SUM_FIELDS = ('operations', 'additions', 'deletions', 'net_change') + CONTENT_FIELDS
+
+
+def aggregate(data, strings, keys=(), filters=None):
+    """
+    直接在 iter_unpack 解码出的元组上按 keys（date、hour、user、tool、session）分组聚合，
+    filters 为 {user / tool / session: 值}。不为每条记录构造字典，字符串只在最后按编码查一次。
+    返回 {分组键: {SUM_FIELDS..., first_time, last_time}}，与逐条累加记录字典的结果相同
+    （采样记录按权重、汇总行按操作数计入）。
+    """
+    conditions = []
+    for key, value in (filters or {}).items():
+        kind, position = KEY_KINDS[key]
+        code = strings.codes[kind].get(value)
+        if code is None:
+            return {}
+        conditions.append((position, code))
+
+    # 分组先按编码进行：时间维度用本地时间的天 / 小时序号（追加在元组末尾），其余维度用字符串编码
+    positions = [TIME_KEYS[key][2] if key in TIME_KEYS else KEY_KINDS[key][1] for key in keys]
+    with_time = any(key in TIME_KEYS for key in keys)
+
+    groups = {}
+    for row in RECORD.iter_unpack(data):
+        if conditions and any(row[position] != code for position, code in conditions):
+            continue
+        if with_time:
+            local = row[0] + row[1] * 60000000
+            row += (local // 86400000000, local // 3600000000)
+        raw = tuple([row[position] for position in positions])
+        if with_time:
+            raw += (row[1],)
+        weight = row[14]
+        group = groups.get(raw)
+        if group is None:
+            group = groups[raw] = [0] * len(SUM_FIELDS) + [row[:2], row[:2]]
+        group[0] += row[15] if row[4] & FLAG_OPERATIONS else weight
+        group[1] += weight * row[6]
+        group[2] += weight * row[7]
+        group[3] += weight * row[8]
+        group[4] += weight * row[9]
+        group[5] += weight * row[10]
+        group[6] += weight * row[11]
+        group[7] += weight * row[12]
+        group[8] += weight * row[13]
+        if row[0] < group[9][0]:
+            group[9] = row[:2]
+        elif row[0] > group[10][0]:
+            group[10] = row[:2]
+
+    result = {}
+    labels = {}
+    for raw, group in groups.items():
+        key = []
+        for name, value in zip(keys, raw):
+            if name in TIME_KEYS:
+                length, unit, _ = TIME_KEYS[name]
+                label = labels.get((name, value, raw[-1]))
+                if label is None:
+                    label = labels[(name, value, raw[-1])] = datetime.fromtimestamp(
+                        value * unit - raw[-1] * 60, _tz(raw[-1])).isoformat()[:length]
+                key.append(label)
+            else:
+                key.append(strings.values[KEY_KINDS[name][0]][value])
+        key = tuple(key)
+        first, last = format_timestamp(*group[9]), format_timestamp(*group[10])
+        values = result.get(key)
+        if values is None:
+            values = result[key] = dict(zip(SUM_FIELDS, group), first_time=first, last_time=last)
+            continue
+        # 时区不同的记录可能落在同一个日期 / 小时
+        for i, field in enumerate(SUM_FIELDS):
+            values[field] += group[i]
+        values['first_time'] = min(values['first_time'], first)
+        values['last_time'] = max(values['last_time'], last)
+    return result
+
+
+class BinaryStore:
+    """一天的二进制存储（写入方需持有日期文件的锁）"""
+
+    def __init__(self, stats_dir, date_str):
+        self.rec_path, self.str_path = store_paths(stats_dir, date_str)
+        self.ino = self.synced = self.count = self.strings_size = self.blocked = 0
+        self.strings = StringTable()
+        self.valid = False
+
+    def load(self, strings=True):
+        """读取文件头和字典（strings 为 False 时只读文件头）；文件不存在或损坏时返回 False"""
+        try:
+            with open(self.rec_path, 'rb') as f:
+                header = f.read(HEADER.size)
+            strings_data = self.str_path.read_bytes() if strings else b''
+        except OSError:
+            return False
+        if len(header) != HEADER.size:
+            return False
+        magic, version, size, self.ino, self.synced, self.count, self.strings_size, self.blocked = \
+            HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION or size != RECORD.size:
+            return False
+        if not strings:
+            return True
+        if len(strings_data) < self.strings_size:
+            return False
+        self.strings, parsed = StringTable.load(memoryview(strings_data)[:self.strings_size])
+        self.valid = parsed == self.strings_size
+        return self.valid
+
+    def reset(self, ino):
+        """清空存储，重新对应 inode 为 ino 的日期文件"""
+        self.rec_path.parent.mkdir(parents=True, exist_ok=True)
+        self.ino, self.synced, self.count, self.strings_size, self.blocked = ino, 0, 0, 0, 0
+        self.strings = StringTable()
+        with open(self.str_path, 'wb'):
+            pass
+        with open(self.rec_path, 'wb') as f:
+            f.write(self._header())
+        self.valid = True
+
+    def _header(self):
+        return HEADER.pack(MAGIC, VERSION, RECORD.size, self.ino, self.synced, self.count, self.strings_size,
+                           self.blocked)
+
+    def block(self, size):
+        """记录日期文件在 size 之前有无法编码的记录：inode 不变时不再重试，查看工具读取 JSONL"""
+        self.blocked = size
+        with open(self.rec_path, 'r+b') as f:
+            f.write(self._header())
+
+    def append(self, records, synced):
+        """
+        追加记录并把已转换位置更新为 synced。先写字典和记录，最后写文件头：
+        中途中断时文件头仍指向旧的末尾，下次写入前截断多余的部分。
+        """
+        data = b''.join(encode_record(record, self.strings) for record in records)
+        strings_data = self.strings.take_pending()
+        with open(self.str_path, 'r+b') as f:
+            f.truncate(self.strings_size)
+            f.seek(self.strings_size)
+            f.write(strings_data)
+        with open(self.rec_path, 'r+b') as f:
+            end = HEADER.size + self.count * RECORD.size
+            f.truncate(end)
+            f.seek(end)
+            f.write(data)
+            self.count += len(data) // RECORD.size
+            self.strings_size += len(strings_data)
+            self.synced = synced
+            self.blocked = 0
+            f.seek(0)
+            f.write(self._header())
+
+
+def sync(stats_file, record=None, size_before=None, retry=False):
+    """
+    把二进制存储同步到日期文件的当前状态（调用方持有日期文件的锁），与运行计数的同步方式相同：
+    已同步到 size_before 时只追加 record，否则从已转换位置补齐，inode 变化或文件变短时重建。
+    有无法编码的记录时在文件头记下当时的日期文件大小并抛出 ValueError，存储停在这条记录之前
+    （查看工具改为读取 JSONL）；之后的调用直接返回，不再重新扫描，直到日期文件被替换或 retry 为 True。
+    """
+    from stats_counters import _complete_size, _scan
+
+    stats_file = Path(stats_file)
+    date_str = stats_file.name.split('.', 1)[0]
+    stat = os.stat(stats_file)
+    complete = _complete_size(stats_file, stat.st_size)
+
+    store = BinaryStore(stats_file.parent, date_str)
+    if not store.load() or store.ino != stat.st_ino or store.synced > complete or store.blocked > complete:
+        store.reset(stat.st_ino)
+    if store.synced == complete or (store.blocked and not retry):
+        return store
+
+    if record is not None and store.synced == size_before:
+        records = [record]
+    else:
+        records = list(_scan(stats_file, store.synced, complete))
+    try:
+        store.append(records, complete)
+    except ValueError:
+        store.block(complete)
+        raise
+    return store
+
+
+def remove_store(stats_dir, date_str):
+    """删除某天的二进制存储"""
+    for path in store_paths(stats_dir, date_str):
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def fresh_store(stats_dir, date_str, strings=True):
+    """
+    某天与日期文件一致的二进制存储（已载入文件头，strings 为 True 时同时载入字典）；
+    存储不存在或不一致（其他工具修改过日期文件、hook 尚未同步）时返回 None，由调用方读取 JSONL。
+    """
+    store = BinaryStore(stats_dir, date_str)
+    try:
+        stat = os.stat(Path(stats_dir) / f"{date_str}.jsonl")
+    except OSError:
+        return None
+    if not store.load(strings) or store.ino != stat.st_ino or store.synced != stat.st_size:
+        return None
+    return store
+
+
+def open_day(stats_dir, date_str):
+    """某天的 (记录区 memoryview, 字典)；没有一致的存储时返回 None"""
+    store = fresh_store(stats_dir, date_str)
+    if store is None:
+        return None
+    size = store.count * RECORD.size
+    with open(store.rec_path, 'rb') as f:
+        f.seek(HEADER.size)
+        data = f.read(size)
+    if len(data) != size:
+        return None
+    return memoryview(data), store.strings
+
+
+def read_day(stats_dir, date_str):
+    """用二进制存储读取某天的记录列表（与 JSONL 中的记录相同）；没有一致的存储时返回 None"""
+    day = open_day(stats_dir, date_str)
+    if day is None:
+        return None
+    return list(iter_decode(*day))
+
+
+def record_count(stats_dir, date_str):
+    """某天的记录数（只读文件头）；没有一致的存储时返回 None"""
+    store = fresh_store(stats_dir, date_str, strings=False)
+    return None if store is None else store.count
+
+
+def convert_day(stats_dir, date_str):
+    """把某天的 JSONL 转换为二进制存储（加与 hook 相同的锁），返回 (记录数, JSONL 大小, 二进制大小)"""
+    import post_stat
+
+    stats_file = Path(stats_dir) / f"{date_str}.jsonl"
+    with open(stats_file, 'a', encoding='utf-8') as f:
+        post_stat.lock_file(f)
+        try:
+            store = sync(stats_file, retry=True)
+        finally:
+            post_stat.unlock_file(f)
+    size = store.rec_path.stat().st_size + store.str_path.stat().st_size
+    return store.count, stats_file.stat().st_size, size
+
+
+def main():
+    """主函数"""
+    import argparse
+    import stats_archive
+    import view_stats
+
+    parser = argparse.ArgumentParser(
+        description='把 JSONL 日期文件转换为紧凑的二进制存储（查看工具优先读取）',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+示例：
+  %(prog)s                         # 转换全部未归档的日期
+  %(prog)s --from 2026-01-01       # 转换一段日期
+  %(prog)s --remove                # 删除二进制存储（只保留 JSONL）
+在 config.json 中设置 "binary_store": true 后，hook 写入记录时同步更新当天的二进制存储。
+        """
+    )
+
+    parser.add_argument('--from', dest='from_date', metavar='DATE', help='日期范围起点（含，YYYY-MM-DD）')
+    parser.add_argument('--to', dest='to_date', metavar='DATE', help='日期范围终点（含，YYYY-MM-DD）')
+    parser.add_argument('--remove', action='store_true', help='删除日期范围内的二进制存储')
+    parser.add_argument('--dir', help='统计目录（默认 code-log）')
+
+    args = parser.parse_args()
+
+    stats_dir = Path(args.dir) if args.dir else view_stats.STATS_DIR
+    if not stats_dir.exists():
+        print(f"错误：统计目录不存在: {stats_dir}", file=sys.stderr)
+        sys.exit(1)
+
+    dates = [d for d in view_stats.list_available_dates(stats_dir)
+             if (args.from_date is None or d >= args.from_date) and (args.to_date is None or d <= args.to_date)]
+
+    if args.remove:
+        for date_str in dates:
+            remove_store(stats_dir, date_str)
+        print(f"已删除 {len(dates)} 天的二进制存储")
+        return
+
+    total_json = total_binary = converted = 0
+    for date_str in dates:
+        if not (stats_dir / f"{date_str}.jsonl").exists():
+            print(f"{date_str}: 已归档，跳过")
+            continue
+        try:
+            count, json_size, binary_size = convert_day(stats_dir, date_str)
+        except ValueError as e:
+            print(f"{date_str}: 含有无法编码的记录，保留 JSONL - {e}")
+            continue
+        converted += 1
+        total_json += json_size
+        total_binary += binary_size
+        print(f"{date_str}: {count:7d} 条记录 | {stats_archive.format_size(json_size)} -> "
+              f"{stats_archive.format_size(binary_size)}")
+
+    if converted:
+        print(f"\n共转换 {converted} 天：{stats_archive.format_size(total_json)} -> "
+              f"{stats_archive.format_size(total_binary)}（{total_binary / total_json:.1%}）")
+    else:
+        print("没有可以转换的日期")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\n\n已取消", file=sys.stderr)
+        sys.exit(130)
+    except Exception as e:
+        print(f"错误：{e}", file=sys.stderr)
+        import traceback
+        traceback.print_exc(file=sys.stderr)
+        sys.exit(1)
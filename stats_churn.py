@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+重复写入（churn）检测。
+hook 为每个被修改的文件保存一份有界的行指纹库 code-log/.fingerprints/<路径哈希>.fp：
+新增的行若此前已在同一文件中写入或删除过，就计为重复写入，记录到统计的 churn 字段，
+用于发现 agent 反复改写同一段代码。
+
+指纹是去掉首尾空白后每行的 CRC32（4 字节），每个文件最多保留 MAX_LINES_PER_FILE 个，
+按最近出现的顺序淘汰最旧的；指纹库最多 MAX_FILES 个文件，超出时删除最久未修改的。
+每次最多计算文本前 MAX_HASHED_LINES 行的指纹，因此内存和耗时与文件大小无关。
+多个 hook 同时修改同一文件的指纹库时以最后写入的为准（只影响估计，不影响统计记录）。
+"""
+
+import os
+import zlib
+from array import array
+from collections import Counter
+from hashlib import blake2b
+from pathlib import Path
+
+FINGERPRINTS_DIR_NAME = ".fingerprints"
+
+MAX_FILES = 1024
+MAX_LINES_PER_FILE = 4096
+MAX_HASHED_LINES = 4096
+
+# 过短的行（空行、单独的括号、end 等）在任何代码中都会反复出现，不计指纹
+MIN_LINE_CHARS = 4
+
+# 文件数超出上限时一次删到上限的 90%，避免之后每次新建文件都要扫描目录
+EVICT_RATIO = 0.9
+
+
+def line_hashes(text, limit=MAX_HASHED_LINES):
+    """文本前 limit 行中有效行的指纹列表"""
+    if not text:
+        return []
+    lines = text.split('\n', limit)[:limit]
+    hashes = []
+    for line in lines:
+        line = line.strip()
+        if len(line) >= MIN_LINE_CHARS:
+            hashes.append(zlib.crc32(line.encode('utf-8', errors='surrogatepass')))
+    return hashes
+
+
+def diff_hashes(old_hashes, new_hashes):
+    """
+    按多重集合比较两段文本的指纹：返回 (新增的行, 删除的行)。
+    两边都有的行（Edit 中未改动的上下文）不计入任何一边。
+    """
+    remaining = Counter(old_hashes)
+    added = []
+    for h in new_hashes:
+        if remaining[h] > 0:
+            remaining[h] -= 1
+        else:
+            added.append(h)
+    return added, list(remaining.elements())
+
+
+class FingerprintStore:
+    """统计目录中的行指纹库"""
+
+    def __init__(self, stats_dir, max_files=MAX_FILES, max_lines=MAX_LINES_PER_FILE):
+        self.dir = Path(stats_dir) / FINGERPRINTS_DIR_NAME
+        self.max_files = max_files
+        self.max_lines = max_lines
+
+    def path_for(self, file_path):
+        """文件对应的指纹文件（文件名为路径的哈希）"""
+        digest = blake2b(os.path.abspath(file_path).encode('utf-8', errors='surrogatepass'), digest_size=8)
+        return self.dir / f"{digest.hexdigest()}.fp"
+
+    def load(self, file_path):
+        """读取文件的指纹：有序字典（指纹 -> None），从最旧到最新"""
+        try:
+            data = self.path_for(file_path).read_bytes()
+        except FileNotFoundError:
+            return {}
+        fingerprints = array('I')
+        fingerprints.frombytes(data[:len(data) - len(data) % fingerprints.itemsize])
+        return dict.fromkeys(fingerprints)
+
+    def save(self, file_path, fingerprints):
+        """写入文件的指纹（先写临时文件再改名）；新建文件时按需淘汰最旧的指纹文件"""
+        path = self.path_for(file_path)
+        created = not path.exists()
+        self.dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, 'wb') as f:
+            f.write(array('I', fingerprints).tobytes())
+        os.replace(tmp_path, path)
+        if created:
+            self.evict()
+
+    def evict(self):
+        """指纹文件超过 max_files 个时，删除最久未修改的文件直到上限的 EVICT_RATIO"""
+        entries = [entry for entry in os.scandir(self.dir) if entry.name.endswith('.fp')]
+        if len(entries) <= self.max_files:
+            return 0
+        entries.sort(key=lambda entry: entry.stat().st_mtime_ns)
+        evicted = entries[:len(entries) - int(self.max_files * EVICT_RATIO)]
+        for entry in evicted:
+            try:
+                os.unlink(entry.path)
+            except FileNotFoundError:
+                pass
+        return len(evicted)
+
+    def observe(self, file_path, old_text, new_text):
+        """
+        记录一次修改（Write 的 old_text 为空），返回重复写入的行数：
+        新增的行中此前在该文件写入或删除过的行数。之后把本次新增和删除的行都记为最近出现。
+        """
+        added, removed = diff_hashes(line_hashes(old_text), line_hashes(new_text))
+        if not added and not removed:
+            return 0
+        fingerprints = self.load(file_path)
+        churn = sum(1 for h in added if h in fingerprints)
+
+        for h in removed + added:
+            fingerprints.pop(h, None)
+            fingerprints[h] = None
+        excess = len(fingerprints) - self.max_lines
+        if excess > 0:
+            fingerprints = dict.fromkeys(list(fingerprints)[excess:])
+
+        self.save(file_path, fingerprints)
+        return churn
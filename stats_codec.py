@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+统计记录的 JSON 编解码层。
+优先使用已安装的高性能库（orjson / msgspec / ujson），否则回退到标准库 json。
+hook 写入和 view_stats 读取共用这一层，保证两端格式一致。
+"""
+
+import hashlib
+import json
+
+# 按优先级排列的后端
+BACKEND_ORDER = ('orjson', 'msgspec', 'ujson', 'json')
+
+# 固定的记录结构：字段名 -> 类型
+RECORD_SCHEMA = {
+    'timestamp': str,
+    'session_id': str,
+    'email': str,
+    'tool': str,
+    'additions': int,
+    'deletions': int,
+    'net_change': int,
+}
+
+RECORD_FIELDS = tuple(RECORD_SCHEMA)
+
+# 可选的内容指标字段（content_metrics 计算的净变化和 stats_churn 检测的重复写入行数，旧记录没有这些字段）
+CONTENT_SCHEMA = {
+    'bytes': int,
+    'chars': int,
+    'blank_lines': int,
+    'comment_lines': int,
+    'churn': int,
+}
+
+CONTENT_FIELDS = tuple(CONTENT_SCHEMA)
+
+# 可选的采样字段（stats_sampling 写入）：记录代表的原始记录数（>= 1）和采样模式
+SAMPLING_SCHEMA = {
+    'weight': int,
+    'sampling': str,
+}
+
+SAMPLING_FIELDS = tuple(SAMPLING_SCHEMA)
+
+# 汇总行（retention_stats 写入）的字段：代表的原始记录数和汇总粒度（hour / day）
+ROLLUP_SCHEMA = {
+    'operations': int,
+    'rollup': str,
+}
+
+ROLLUP_FIELDS = tuple(ROLLUP_SCHEMA)
+
+
+class Backend:
+    """
+    一个编解码后端：dumps 返回 str，loads 接受 str / bytes / memoryview。
+    zero_copy 为 True 的后端直接解析 memoryview（例如 mmap 切片），否则先复制为 bytes。
+    """
+
+    def __init__(self, name, dumps, loads, decode_record=None, zero_copy=False):
+        self.name = name
+        self.dumps = dumps
+        self.zero_copy = zero_copy
+        if not zero_copy:
+            loads = _copying(loads)
+            if decode_record is not None:
+                decode_record = _copying(decode_record)
+        self.loads = loads
+        self.decode_record = decode_record or (lambda data: validate_record(loads(data)))
+
+    def __repr__(self):
+        return f"<Backend {self.name}>"
+
+
+def _copying(func):
+    """包装不支持缓冲区协议的解析函数：memoryview 先转换为 bytes"""
+    def wrapper(data):
+        if isinstance(data, memoryview):
+            data = data.tobytes()
+        return func(data)
+    return wrapper
+
+
+def validate_record(obj):
+    """
+    校验记录是否符合固定结构。
+    缺少字段或类型不符时抛出 ValueError，返回原字典。
+    """
+    if not isinstance(obj, dict):
+        raise ValueError("记录不是 JSON 对象")
+    for key, expected in RECORD_SCHEMA.items():
+        value = obj.get(key)
+        # bool 是 int 的子类，需要单独排除
+        if not isinstance(value, expected) or isinstance(value, bool):
+            raise ValueError(f"字段 '{key}' 缺失或类型错误")
+    for schema in (CONTENT_SCHEMA, SAMPLING_SCHEMA, ROLLUP_SCHEMA):
+        for key, expected in schema.items():
+            # 可选字段可以省略，但出现时不能为 null（与 msgspec 后端一致）
+            if key in obj and (not isinstance(obj[key], expected) or isinstance(obj[key], bool)):
+                raise ValueError(f"字段 '{key}' 类型错误")
+    if obj.get('weight', 1) < 1:
+        raise ValueError("字段 'weight' 必须 >= 1")
+    return obj
+
+
+def _load_orjson():
+    import orjson
+
+    def dumps(obj):
+        return orjson.dumps(obj).decode('utf-8')
+
+    return Backend('orjson', dumps, orjson.loads, zero_copy=True)
+
+
+def _load_msgspec():
+    import msgspec
+    from typing import Annotated, TypedDict
+
+    class OptionalFields(TypedDict, total=False):
+        bytes: int
+        chars: int
+        blank_lines: int
+        comment_lines: int
+        churn: int
+        weight: Annotated[int, msgspec.Meta(ge=1)]
+        sampling: str
+        operations: int
+        rollup: str
+
+    class StatsRecord(OptionalFields):
+        timestamp: str
+        session_id: str
+        email: str
+        tool: str
+        additions: int
+        deletions: int
+        net_change: int
+
+    encoder = msgspec.json.Encoder()
+    decoder = msgspec.json.Decoder()
+
+    def dumps(obj):
+        return encoder.encode(obj).decode('utf-8')
+
+    def loads(data):
+        try:
+            return decoder.decode(data)
+        except msgspec.DecodeError as e:
+            raise ValueError(str(e))
+
+    def decode_record(data):
+        # TypedDict 转换会丢弃未声明的字段，因此只用它做类型校验，返回原始字典
+        obj = loads(data)
+        try:
+            msgspec.convert(obj, StatsRecord)
+        except msgspec.ValidationError as e:
+            raise ValueError(str(e))
+        return obj
+
+    return Backend('msgspec', dumps, loads, decode_record, zero_copy=True)
+
+
+def _load_ujson():
+    import ujson
+
+    def dumps(obj):
+        return ujson.dumps(obj, ensure_ascii=False)
+
+    return Backend('ujson', dumps, ujson.loads)
+
+
+def _load_json():
+    def dumps(obj):
+        return json.dumps(obj, ensure_ascii=False)
+
+    return Backend('json', dumps, json.loads)
+
+
+_LOADERS = {
+    'orjson': _load_orjson,
+    'msgspec': _load_msgspec,
+    'ujson': _load_ujson,
+    'json': _load_json,
+}
+
+
+def get_backend(name):
+    """加载指定名称的后端，未安装时返回 None。"""
+    try:
+        return _LOADERS[name]()
+    except ImportError:
+        return None
+
+
+def available_backends():
+    """返回当前环境中所有可用的后端（按优先级）。"""
+    backends = []
+    for name in BACKEND_ORDER:
+        backend = get_backend(name)
+        if backend is not None:
+            backends.append(backend)
+    return backends
+
+
+def select_backend(preferred=None):
+    """选择后端：优先使用 preferred，否则按 BACKEND_ORDER 选择第一个可用的。"""
+    names = ((preferred,) if preferred else ()) + BACKEND_ORDER
+    for name in names:
+        backend = get_backend(name)
+        if backend is not None:
+            return backend
+    raise RuntimeError("没有可用的 JSON 后端")
+
+
+# 模块级默认后端
+BACKEND = select_backend()
+BACKEND_NAME = BACKEND.name
+
+
+def dumps(obj):
+    """序列化为单行 JSON 字符串（非 ASCII 字符原样输出）。"""
+    return BACKEND.dumps(obj)
+
+
+def loads(data):
+    """反序列化任意 JSON 文本。"""
+    return BACKEND.loads(data)
+
+
+def decode_record(data):
+    """按固定记录结构解码一行，不符合结构时抛出 ValueError。"""
+    return BACKEND.decode_record(data)
+
+
+def record_id(record):
+    """
+    记录的稳定 ID：按键排序的规范 JSON 的哈希。
+    与使用的后端无关，同一条记录被复制多次时 ID 相同，可用于去重。
+    """
+    canonical = json.dumps(record, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.blake2b(canonical.encode('utf-8'), digest_size=16).hexdigest()
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+每日运行计数。
+hook 在追加记录的同一把文件锁内更新 code-log/.counters/YYYY-MM-DD.cnt：
+一个固定布局的开放寻址哈希表，每个槽位保存一个（类别, 键）的操作数、新增、删除和净变化，
+按键查询只需读取几个槽位，不必解析当天的 JSONL。
+
+文件头记录日期文件的 inode 和已计入的字节位置：其他工具（例如 backfill_stats.py）追加的行
+在下次更新时从该位置补齐，日期文件被替换时整体重建，因此计数始终与日期文件一致。
+"""
+
+import mmap
+import os
+import struct
+import zlib
+from hashlib import blake2b
+from pathlib import Path
+
+
+COUNTERS_DIR_NAME = ".counters"
+
+MAGIC = b'CSTC'
+VERSION = 1
+
+# 文件头：魔数、版本、槽位数、已用槽位数、日期文件 inode、已计入的字节位置
+HEADER = struct.Struct('<4sHxxIIQQ')
+
+# 槽位：类别（0 为空）、键长度、键（UTF-8，过长时截断并附加哈希）、四个计数
+KEY_BYTES = 56
+SLOT = struct.Struct(f'<BB6x{KEY_BYTES}sqqqq')
+
+KINDS = {'day': 1, 'user': 2, 'session': 3, 'tool': 4}
+KIND_NAMES = {code: name for name, code in KINDS.items()}
+
+# 记录中对应各类别的字段
+KIND_FIELDS = {'user': ('email', 'unknown'), 'session': ('session_id', 'unknown'), 'tool': ('tool', 'Unknown')}
+
+COUNT_FIELDS = ('operations', 'additions', 'deletions', 'net_change')
+
+# 预算可以限制的指标：lines 为新增与删除行数之和（代码变动量）
+BUDGET_METRICS = ('lines', 'operations', 'additions', 'deletions')
+
+KIND_LABELS = {'day': '今天', 'user': '用户', 'session': '会话', 'tool': '工具'}
+METRIC_LABELS = {'lines': '变动行数', 'operations': '操作数', 'additions': '新增行数', 'deletions': '删除行数'}
+
+INITIAL_SLOTS = 1024
+
+# 装载率超过该比例时扩容一倍
+MAX_LOAD = 0.7
+
+
+def counters_path(stats_file):
+    """日期文件对应的计数文件"""
+    stats_file = Path(stats_file)
+    return stats_file.parent / COUNTERS_DIR_NAME / f"{stats_file.name.split('.', 1)[0]}.cnt"
+
+
+def _encode_key(key):
+    data = key.encode('utf-8', errors='surrogatepass')
+    if len(data) > KEY_BYTES:
+        data = data[:KEY_BYTES - 16] + blake2b(data, digest_size=8).hexdigest().encode()
+    return data
+
+
+def _record_keys(record):
+    """一条记录计入的 (类别, 键)：当天总计、用户、会话和工具"""
+    keys = [('day', '')]
+    for kind, (field, default) in KIND_FIELDS.items():
+        keys.append((kind, str(record.get(field, default))))
+    return keys
+
+
+class Counters:
+    """一个计数文件（映射到内存读写；写入方需持有日期文件的锁）"""
+
+    def __init__(self, path, writable=False):
+        self.path = Path(path)
+        self._file = open(self.path, 'r+b' if writable else 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ)
+        magic, version, self.slots, self.used, self.ino, self.synced = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION or len(self._map) != HEADER.size + self.slots * SLOT.size:
+            self.close()
+            raise ValueError(f"计数文件格式不正确: {path}")
+
+    @staticmethod
+    def create(path, slots=INITIAL_SLOTS, ino=0, synced=0):
+        """创建空的计数文件（先写临时文件再改名）"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, slots, 0, ino, synced))
+            f.write(bytes(slots * SLOT.size))
+        os.replace(tmp_path, path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def _write_header(self):
+        HEADER.pack_into(self._map, 0, MAGIC, VERSION, self.slots, self.used, self.ino, self.synced)
+
+    def _find(self, kind, key):
+        """返回 (槽位偏移, 编码后的键, 是否已存在)；线性探测直到找到该键或空槽位"""
+        code = KINDS[kind]
+        data = _encode_key(key)
+        index = zlib.crc32(bytes([code]) + data) % self.slots
+        while True:
+            offset = HEADER.size + index * SLOT.size
+            slot_kind, length = self._map[offset], self._map[offset + 1]
+            if slot_kind == 0:
+                return offset, data, False
+            if slot_kind == code and length == len(data) and self._map[offset + 8:offset + 8 + length] == data:
+                return offset, data, True
+            index = (index + 1) % self.slots
+
+    def get(self, kind, key=''):
+        """某个（类别, 键）的计数字典，不存在时返回 None"""
+        offset, _, found = self._find(kind, key)
+        if not found:
+            return None
+        return dict(zip(COUNT_FIELDS, SLOT.unpack_from(self._map, offset)[3:]))
+
+    def entries(self, kind=None):
+        """产出 (类别, 键, 计数字典)，可只列出某个类别"""
+        for index in range(self.slots):
+            code, length, data, *counts = SLOT.unpack_from(self._map, HEADER.size + index * SLOT.size)
+            if code and (kind is None or KIND_NAMES[code] == kind):
+                key = data[:length].decode('utf-8', errors='replace')
+                yield KIND_NAMES[code], key, dict(zip(COUNT_FIELDS, counts))
+
+    def add(self, record):
+        """把一条记录计入各个（类别, 键）；采样记录按权重计入，汇总行按其操作数计入"""
+        w = record.get('weight', 1)
+        values = (record.get('operations', w), w * record['additions'], w * record['deletions'], w * record['net_change'])
+        for kind, key in _record_keys(record):
+            offset, data, found = self._find(kind, key)
+            if found:
+                counts = [a + b for a, b in zip(SLOT.unpack_from(self._map, offset)[3:], values)]
+            else:
+                counts = values
+                self.used += 1
+            SLOT.pack_into(self._map, offset, KINDS[kind], len(data), data, *counts)
+
+
+def _scan(stats_file, start, end):
+    """
+    解析日期文件 [start, end) 内的完整行。
+    与查看工具使用同一套容错解析（view_stats.scan_spans）：损坏的行跳过，拼接在残行后面的记录被找回，
+    计数和二进制存储与直接读取 JSONL 的结果一致。只在补齐时用到，hook 的常规路径不导入 view_stats。
+    """
+    import view_stats
+
+    with view_stats.MappedStatsFile(stats_file) as mapped:
+        yield from view_stats.scan_spans(mapped, start, end)
+
+
+def sync(stats_file, record=None, size_before=None):
+    """
+    把计数文件同步到日期文件的当前状态（调用方持有日期文件的锁）。
+    record 为刚追加的记录、size_before 为追加前的文件大小：计数已同步到 size_before 时直接累加这一条；
+    否则从已计入位置补齐新追加的行，inode 变化或文件变短时从头重建。
+    返回 record 各（类别, 键）更新后的计数：类别 -> 计数字典（没有 record 时为空字典）。
+    """
+    stats_file = Path(stats_file)
+    path = counters_path(stats_file)
+    stat = os.stat(stats_file)
+    complete = _complete_size(stats_file, stat.st_size)
+
+    if not path.exists():
+        Counters.create(path, ino=stat.st_ino)
+    counters = Counters(path, writable=True)
+    try:
+        if counters.ino != stat.st_ino or counters.synced > complete:
+            slots = counters.slots
+            counters.close()
+            Counters.create(path, slots=slots, ino=stat.st_ino)
+            counters = Counters(path, writable=True)
+
+        if record is not None and counters.synced == size_before:
+            records = (record,)
+        else:
+            records = _scan(stats_file, counters.synced, complete)
+
+        for line_record in records:
+            # 每条记录最多新增 len(KINDS) 个槽位
+            if counters.used + len(KINDS) > counters.slots * MAX_LOAD:
+                counters = _grow(path, counters)
+            counters.add(line_record)
+
+        counters.synced = complete
+        counters._write_header()
+        if record is None:
+            return {}
+        return {kind: counters.get(kind, key) for kind, key in _record_keys(record)}
+    finally:
+        counters.close()
+
+
+def _complete_size(stats_file, size):
+    """最后一个换行符之后的位置（不计入未写完的残行）"""
+    with open(stats_file, 'rb') as f:
+        end = size
+        while end > 0:
+            start = max(0, end - 4096)
+            f.seek(start)
+            pos = f.read(end - start).rfind(b'\n')
+            if pos >= 0:
+                return start + pos + 1
+            end = start
+    return 0
+
+
+def _grow(path, counters):
+    """扩容一倍：把已有条目搬到新文件，保留 inode 和已计入位置"""
+    entries = list(counters.entries())
+    slots, ino, synced = counters.slots * 2, counters.ino, counters.synced
+    counters.close()
+    Counters.create(path, slots=slots, ino=ino, synced=synced)
+    counters = Counters(path, writable=True)
+    for kind, key, counts in entries:
+        offset, data, _ = counters._find(kind, key)
+        SLOT.pack_into(counters._map, offset, KINDS[kind], len(data), data, *(counts[f] for f in COUNT_FIELDS))
+        counters.used += 1
+    return counters
+
+
+def open_counters(stats_dir, date_str):
+    """只读打开某天的计数文件，不存在时返回 None"""
+    path = Path(stats_dir) / COUNTERS_DIR_NAME / f"{date_str}.cnt"
+    if not path.exists():
+        return None
+    return Counters(path)
+
+
+def parse_budgets(budgets):
+    """
+    解析配置中的预算：{"session_lines": 2000, "day_operations": 500, ...}
+    键为 <类别>_<指标>，返回 [(类别, 指标, 上限), ...]，格式错误时抛出 ValueError。
+    """
+    if not isinstance(budgets, dict):
+        raise ValueError("budgets 必须是对象")
+    parsed = []
+    for name, limit in budgets.items():
+        kind, _, metric = name.partition('_')
+        if kind not in KINDS or metric not in BUDGET_METRICS:
+            raise ValueError(f"未知的预算项 '{name}'（格式为 <{'|'.join(KINDS)}>_<{'|'.join(BUDGET_METRICS)}>）")
+        if not isinstance(limit, int) or isinstance(limit, bool) or limit < 0:
+            raise ValueError(f"预算项 '{name}' 的上限必须是非负整数")
+        parsed.append((kind, metric, limit))
+    return parsed
+
+
+def metric_value(counts, metric):
+    """计数字典中某个预算指标的值"""
+    if metric == 'lines':
+        return counts['additions'] + counts['deletions']
+    return counts[metric]
+
+
+def exceeded_budgets(counts, budgets):
+    """sync 返回的计数中超出预算的项：[(类别, 指标, 当前值, 上限), ...]"""
+    exceeded = []
+    for kind, metric, limit in budgets:
+        value = metric_value(counts[kind], metric) if counts.get(kind) else 0
+        if value > limit:
+            exceeded.append((kind, metric, value, limit))
+    return exceeded
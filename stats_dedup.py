@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+重复工具调用的抑制。
+hook 被重试或在 settings 中被注册了两次时，同一次工具调用会被记录两遍。
+hook 以 payload 中的 tool_use_id 作为调用 ID，追加记录前在 code-log/.bloom/ 中的布隆过滤器里检查：
+已出现过的调用不再记录。没有 tool_use_id 的调用默认不检查——同一会话中完全相同的 Write / Edit
+（例如撤销后重新应用的修改）是合法的重复操作，无法与重试区分；config.json 中设置
+"dedup_content_hash": true 后改用会话、工具和参数的内容哈希作为 ID，这类合法的重复操作也会被跳过。
+检查和写入只是在内存映射的文件上读写几个位，不需要扫描日期文件。
+
+过滤器按代轮换：每天第一次调用、或当前过滤器已写入 capacity 个 ID 时新建一代，
+只保留最近 KEEP_GENERATIONS 代（跨午夜重试的调用仍能在前一代中查到），占用的空间固定。
+布隆过滤器没有漏判，误判率在写满时约为 1.5e-4（每天几千次调用时远小于此）；
+误判会让一次新调用被当作重复跳过。写入方需持有当天日期文件的锁。
+"""
+
+import json
+import mmap
+import os
+import struct
+from hashlib import blake2b
+from pathlib import Path
+
+BLOOM_DIR_NAME = ".bloom"
+
+MAGIC = b'CSBF'
+VERSION = 1
+
+# 文件头：魔数、版本、哈希函数个数、位数、已写入的 ID 数
+HEADER = struct.Struct('<4sHHQQ')
+
+# 每代 2^20 位（128 KiB）、7 个哈希函数；写入 50000 个 ID 时误判率约 1.5e-4
+DEFAULT_BITS = 1 << 20
+DEFAULT_HASHES = 7
+DEFAULT_CAPACITY = 50000
+
+# 检查时查询的代数（当前一代和上一代）
+KEEP_GENERATIONS = 2
+
+
+def call_id(payload, content=None):
+    """
+    工具调用的稳定 ID：有 tool_use_id 时为 id:<tool_use_id>；
+    否则提供 content（会话, 工具, 参数）时为其规范 JSON 的哈希，不提供时返回 None（不检查重复）。
+    """
+    tool_use_id = payload.get('tool_use_id') if isinstance(payload, dict) else None
+    if tool_use_id:
+        return f"id:{tool_use_id}"
+    if content is None:
+        return None
+    data = json.dumps(list(content), sort_keys=True, ensure_ascii=False, default=str)
+    return "sha:" + blake2b(data.encode('utf-8', errors='surrogatepass'), digest_size=16).hexdigest()
+
+
+class BloomFilter:
+    """一个映射到内存的布隆过滤器文件（写入方需持有日期文件的锁）"""
+
+    def __init__(self, path, writable=False):
+        self.path = Path(path)
+        self._file = open(self.path, 'r+b' if writable else 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ)
+        if len(self._map) < HEADER.size:
+            self.close()
+            raise ValueError(f"布隆过滤器文件格式不正确: {path}")
+        magic, version, self.hashes, self.bits, self.count = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION or len(self._map) != HEADER.size + self.bits // 8:
+            self.close()
+            raise ValueError(f"布隆过滤器文件格式不正确: {path}")
+
+    @staticmethod
+    def create(path, bits=DEFAULT_BITS, hashes=DEFAULT_HASHES):
+        """创建空的过滤器文件（先写临时文件再改名）；bits 向上取整到 8 的倍数"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        bits = (bits + 7) // 8 * 8
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, hashes, bits, 0))
+            f.write(bytes(bits // 8))
+        os.replace(tmp_path, path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def _positions(self, key):
+        """双重哈希（h1 + i·h2）得到 hashes 个位的位置"""
+        digest = blake2b(key.encode('utf-8', errors='surrogatepass'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def __contains__(self, key):
+        return all(self._map[HEADER.size + pos // 8] & (1 << (pos % 8)) for pos in self._positions(key))
+
+    def add(self, key):
+        """写入 key 的各个位，返回写入前是否已存在"""
+        present = True
+        for pos in self._positions(key):
+            offset = HEADER.size + pos // 8
+            mask = 1 << (pos % 8)
+            if not self._map[offset] & mask:
+                self._map[offset] |= mask
+                present = False
+        if not present:
+            self.count += 1
+            HEADER.pack_into(self._map, 0, MAGIC, VERSION, self.hashes, self.bits, self.count)
+        return present
+
+
+def generations(stats_dir):
+    """已有的过滤器文件，从旧到新（文件名为 YYYY-MM-DD.<代号>.bloom）"""
+    bloom_dir = Path(stats_dir) / BLOOM_DIR_NAME
+    if not bloom_dir.exists():
+        return []
+
+    def order(path):
+        date_str, _, number = path.name[:-len('.bloom')].partition('.')
+        return date_str, int(number) if number.isdigit() else 0
+
+    return sorted(bloom_dir.glob("*.bloom"), key=order)
+
+
+def _rotate(stats_dir, date_str, paths, bits, hashes):
+    """新建一代过滤器并删除超出 KEEP_GENERATIONS 的旧代，返回新的文件列表"""
+    number = 0
+    if paths and paths[-1].name.startswith(date_str + '.'):
+        number = int(paths[-1].name.split('.')[1]) + 1
+    path = Path(stats_dir) / BLOOM_DIR_NAME / f"{date_str}.{number}.bloom"
+    BloomFilter.create(path, bits, hashes)
+    paths = paths + [path]
+    for old in paths[:-KEEP_GENERATIONS]:
+        try:
+            old.unlink()
+        except FileNotFoundError:
+            pass
+    return paths[-KEEP_GENERATIONS:]
+
+
+def check_and_add(stats_dir, date_str, key, bits=DEFAULT_BITS, hashes=DEFAULT_HASHES, capacity=DEFAULT_CAPACITY):
+    """
+    检查调用 ID 是否已出现过（查询最近 KEEP_GENERATIONS 代），未出现时写入当前一代。
+    返回 True 表示重复。调用方需持有 date_str 日期文件的锁。
+    """
+    paths = generations(stats_dir)
+    current = None
+    if paths and paths[-1].name.startswith(date_str + '.'):
+        try:
+            current = BloomFilter(paths[-1], writable=True)
+        except (OSError, ValueError):
+            paths[-1].unlink()
+            paths = paths[:-1]
+
+    try:
+        for path in paths[-KEEP_GENERATIONS:]:
+            if current is not None and path == current.path:
+                if key in current:
+                    return True
+                continue
+            try:
+                with BloomFilter(path) as bloom:
+                    if key in bloom:
+                        return True
+            except (OSError, ValueError):
+                continue
+
+        if current is None or current.count >= capacity:
+            if current is not None:
+                current.close()
+            paths = _rotate(stats_dir, date_str, paths, bits, hashes)
+            current = BloomFilter(paths[-1], writable=True)
+        current.add(key)
+        return False
+    finally:
+        if current is not None:
+            current.close()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+加权采样。
+记录量极大时 hook 可以只保存一部分记录：每 N 条保留 1 条（随机），或按会话 ID 的哈希确定性地
+保留 1/N 的会话（保留的会话记录完整）。保留的记录带有 weight = N 和 sampling 字段，
+查看工具聚合时按权重放大（Horvitz-Thompson 估计，期望等于全量统计），并据此给出 95% 误差范围。
+采样率以 1/N 表示，权重为整数，聚合结果仍是整数。
+"""
+
+import math
+import random
+from hashlib import blake2b
+
+SAMPLING_MODES = ('record', 'session')
+
+# 95% 置信区间的 z 值
+Z_95 = 1.96
+
+# 估计误差的指标
+ERROR_FIELDS = ('operations', 'additions', 'deletions', 'net_change')
+
+
+def parse_sampling(config):
+    """
+    解析 config.json 中的 sampling：{"mode": "record" | "session", "one_in": N}
+    返回 (mode, N)；未启用（缺省或 N 为 1）时返回 None，格式错误时抛出 ValueError。
+    """
+    if not config:
+        return None
+    if not isinstance(config, dict):
+        raise ValueError("sampling 必须是对象")
+    mode = config.get('mode', 'record')
+    one_in = config.get('one_in', 1)
+    if mode not in SAMPLING_MODES:
+        raise ValueError(f"未知的采样模式 '{mode}'（可选 {'、'.join(SAMPLING_MODES)}）")
+    if not isinstance(one_in, int) or isinstance(one_in, bool) or one_in < 1:
+        raise ValueError("one_in 必须是正整数")
+    return None if one_in == 1 else (mode, one_in)
+
+
+def session_kept(session_id, one_in):
+    """会话是否被保留：会话 ID 哈希到 [0, 2^64) 后落在前 1/N 区间（同一会话结果总是相同）"""
+    digest = blake2b(str(session_id).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') < (1 << 64) // one_in
+
+
+def sample_record(record, mode, one_in):
+    """按采样设置决定是否保留记录：保留时附加 weight / sampling 并返回，丢弃时返回 None"""
+    if mode == 'session':
+        kept = session_kept(record.get('session_id', 'unknown'), one_in)
+    else:
+        kept = random.randrange(one_in) == 0
+    if not kept:
+        return None
+    record['weight'] = one_in
+    record['sampling'] = mode
+    return record
+
+
+def weight(record):
+    """记录代表的原始记录数（未采样的记录为 1）"""
+    return record.get('weight', 1)
+
+
+class ErrorEstimate:
+    """
+    加权总数的 95% 误差范围。
+    每条记录（按记录采样）或每个会话（按会话采样，整组保留或丢弃）是一个独立的抽样单元，
+    总数估计的方差为 Σ w(w-1)·Y²（Y 为抽样单元内的合计），未采样的记录（w = 1）不贡献误差。
+    """
+
+    def __init__(self):
+        self.variance = dict.fromkeys(ERROR_FIELDS, 0)
+        self.sessions = {}
+        self.sampled = 0
+
+    def add(self, record):
+        w = weight(record)
+        if w == 1:
+            return
+        self.sampled += 1
+        values = (1, record['additions'], record['deletions'], record['net_change'])
+        if record.get('sampling') == 'session':
+            key = (record.get('session_id', 'unknown'), w)
+            totals = self.sessions.setdefault(key, [0] * len(ERROR_FIELDS))
+            for i, value in enumerate(values):
+                totals[i] += value
+        else:
+            for field, value in zip(ERROR_FIELDS, values):
+                self.variance[field] += w * (w - 1) * value * value
+
+    def bounds(self):
+        """各指标估计值的 95% 误差范围（向上取整）；没有采样记录时返回 None"""
+        if not self.sampled:
+            return None
+        variance = dict(self.variance)
+        for (_, w), totals in self.sessions.items():
+            for field, total in zip(ERROR_FIELDS, totals):
+                variance[field] += w * (w - 1) * total * total
+        return {field: math.ceil(Z_95 * math.sqrt(value)) for field, value in variance.items()}
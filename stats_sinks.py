@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+指标推送（StatsD 格式）。
+hook 写入记录后把计数推送到 config.json 中配置的 sinks：StatsD（UDP）、Unix 数据报套接字或本地文件。
+同名计数先在内存中合并，再把多行指标拼成不超过 MTU 的数据包批量发送；
+套接字均为非阻塞、发后不管（fire-and-forget），没有接收方或发送缓冲区满时直接丢弃，
+不会拖慢工具调用。StatsD 的 host 必须是 IP 地址（或 localhost），不做可能阻塞的 DNS 解析。
+
+合并和分包只作用于一次 publish() 调用中的记录：hook 每次工具调用是独立的进程，只推送自己这一条记录，
+不同调用之间不合并（跨调用的聚合交给 StatsD 服务端按 flush 间隔完成）。
+
+配置示例：
+  "sinks": [
+    {"type": "statsd", "host": "127.0.0.1", "port": 8125},
+    {"type": "unix", "path": "/tmp/statsd.sock", "tags": true},
+    {"type": "file", "path": "/tmp/claude-stats.metrics"}
+  ]
+"""
+
+import os
+import re
+import socket
+
+import stats_codec
+
+DEFAULT_PREFIX = "claude_code_stats"
+DEFAULT_STATSD_PORT = 8125
+
+# 单个 UDP 数据包的最大字节数（以太网 MTU 减去 IP / UDP 头，避免分片）
+DEFAULT_MAX_PACKET = 1432
+
+# 推送的计数：operations 为记录数，其余为记录中的同名字段（采样记录乘以权重）
+COUNTER_FIELDS = ('operations', 'additions', 'deletions', 'net_change') + stats_codec.CONTENT_FIELDS
+
+_UNSAFE_NAME = re.compile(r'[^A-Za-z0-9_.-]')
+_UNSAFE_TAG = re.compile(r'[^A-Za-z0-9_.@/-]')
+
+
+class MetricBatch:
+    """
+    按指标名（和标签）预先合并计数，再打包为 StatsD 数据包。
+    tags 为 False 时按工具拆分指标名（prefix.tool.Edit.additions）；
+    为 True 时使用 DogStatsD 标签（prefix.additions|#tool:Edit,user:...）。
+    """
+
+    def __init__(self, prefix=DEFAULT_PREFIX, tags=False):
+        self.prefix = _UNSAFE_NAME.sub('_', prefix)
+        self.tags = tags
+        self.counters = {}
+
+    def _add(self, name, tag, value):
+        key = (name, tag)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def add(self, record):
+        """累加一条记录（采样记录按权重计入）"""
+        tool = record.get('tool', 'Unknown')
+        w = record.get('weight', 1)
+        values = {field: w * (1 if field == 'operations' else record.get(field, 0)) for field in COUNTER_FIELDS}
+        if self.tags:
+            tag = (f"tool:{_UNSAFE_TAG.sub('_', tool)},"
+                   f"user:{_UNSAFE_TAG.sub('_', record.get('email', 'unknown'))}")
+            for field, value in values.items():
+                self._add(f"{self.prefix}.{field}", tag, value)
+        else:
+            tool_prefix = f"{self.prefix}.tool.{_UNSAFE_NAME.sub('_', tool)}"
+            for field, value in values.items():
+                self._add(f"{self.prefix}.{field}", None, value)
+                self._add(f"{tool_prefix}.{field}", None, value)
+
+    def lines(self):
+        """StatsD 计数行（值为 0 的计数不发送）"""
+        for (name, tag), value in sorted(self.counters.items()):
+            if value:
+                yield f"{name}:{value}|c" + (f"|#{tag}" if tag else "")
+
+    def packets(self, max_bytes=DEFAULT_MAX_PACKET):
+        """把计数行按换行拼接为不超过 max_bytes 的数据包（单行超长时单独成包）"""
+        packet = b''
+        for line in self.lines():
+            data = line.encode('utf-8')
+            if packet and len(packet) + 1 + len(data) > max_bytes:
+                yield packet
+                packet = b''
+            packet = packet + b'\n' + data if packet else data
+        if packet:
+            yield packet
+
+
+class StatsdSink:
+    """StatsD over UDP：非阻塞 sendto，发送失败直接丢弃"""
+
+    def __init__(self, host='127.0.0.1', port=DEFAULT_STATSD_PORT, max_packet=DEFAULT_MAX_PACKET):
+        # 只接受数字地址：hook 每次调用都会创建 sink，解析主机名可能在 DNS 上阻塞
+        if host == 'localhost':
+            host = '127.0.0.1'
+        try:
+            family, _, _, _, address = socket.getaddrinfo(host, port, type=socket.SOCK_DGRAM,
+                                                          flags=socket.AI_NUMERICHOST)[0]
+        except socket.gaierror:
+            raise ValueError(f"StatsD 的 host 必须是 IP 地址: {host}")
+        self.address = address
+        self.max_packet = max_packet
+        self.sock = socket.socket(family, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+
+    def send(self, packets):
+        sent = 0
+        for packet in packets:
+            try:
+                self.sock.sendto(packet, self.address)
+                sent += 1
+            except OSError:
+                pass
+        return sent
+
+    def close(self):
+        self.sock.close()
+
+
+class UnixSink(StatsdSink):
+    """Unix 数据报套接字（例如本机 statsd / agent 的 socket），没有监听方时丢弃"""
+
+    def __init__(self, path, max_packet=8192):
+        self.address = str(path)
+        self.max_packet = max_packet
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+
+
+class FileSink:
+    """追加写入本地文件（每批一次 write，便于其他进程 tail）"""
+
+    def __init__(self, path, max_packet=65536):
+        self.path = os.path.expanduser(path)
+        self.max_packet = max_packet
+
+    def send(self, packets):
+        data = b''.join(packet + b'\n' for packet in packets)
+        if not data:
+            return 0
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+        return data.count(b'\n')
+
+    def close(self):
+        pass
+
+
+SINK_TYPES = {'statsd': StatsdSink, 'unix': UnixSink, 'file': FileSink}
+
+
+def create_sink(config):
+    """根据一项 sink 配置创建 sink，配置错误时抛出 ValueError"""
+    if not isinstance(config, dict) or config.get('type') not in SINK_TYPES:
+        raise ValueError(f"未知的 sink 配置: {config}（type 可选 {'、'.join(SINK_TYPES)}）")
+    if config['type'] == 'statsd':
+        return StatsdSink(config.get('host', '127.0.0.1'), config.get('port', DEFAULT_STATSD_PORT),
+                          config.get('max_packet', DEFAULT_MAX_PACKET))
+    if 'path' not in config:
+        raise ValueError(f"{config['type']} sink 缺少 path")
+    sink_class = SINK_TYPES[config['type']]
+    if 'max_packet' in config:
+        return sink_class(config['path'], config['max_packet'])
+    return sink_class(config['path'])
+
+
+def publish(records, sink_configs):
+    """
+    把记录的计数推送到各个 sink，返回 [(sink 配置, 发送的数据包数或异常), ...]。
+    单个 sink 出错不影响其他 sink。
+    """
+    results = []
+    for config in sink_configs:
+        try:
+            sink = create_sink(config)
+        except (OSError, TypeError, ValueError) as e:
+            results.append((config, e))
+            continue
+        try:
+            batch = MetricBatch(config.get('prefix', DEFAULT_PREFIX), bool(config.get('tags')))
+            for record in records:
+                batch.add(record)
+            results.append((config, sink.send(batch.packets(sink.max_packet))))
+        except OSError as e:
+            results.append((config, e))
+        finally:
+            sink.close()
+    return results
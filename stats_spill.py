@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+分组聚合的溢出到磁盘模式。
+分组数超过内存预算时，把内存中的部分聚合结果按键的 crc32 哈希分区追加到临时文件并清空；
+结束时逐个分区合并（每个分区只包含约 1/N 的键），排序后写回，再按键对各分区做 k 路归并输出。
+输出与内存中的 aggregate_by_user / aggregate_by_session 按键排序后的结果完全一致。
+"""
+
+import heapq
+import tempfile
+import zlib
+from pathlib import Path
+
+import stats_codec
+
+DEFAULT_PARTITIONS = 64
+
+# 估算的每个分组在内存中占用的字节数（字典项、计数列表和工具集合）
+BYTES_PER_KEY = 600
+
+# 内存预算对应的分组数下限，避免预算过小时频繁溢出
+MIN_KEYS = 1000
+
+# 内部计数列表的各项，最后一项为工具集合（不收集时为 None）
+COUNT_FIELDS = ('additions', 'deletions', 'net_change', 'operations') + stats_codec.CONTENT_FIELDS
+TOOLS = len(COUNT_FIELDS)
+
+
+def keys_for_budget(megabytes):
+    """把内存预算（MB）换算为内存中最多保留的分组数"""
+    return max(MIN_KEYS, int(megabytes * 1024 * 1024 / BYTES_PER_KEY))
+
+
+def _new_entry(with_tools):
+    return [0] * TOOLS + [set() if with_tools else None]
+
+
+def _to_stats(entry):
+    """内部计数列表 -> 与 aggregate_by_* 相同结构的字典"""
+    stats = dict(zip(COUNT_FIELDS, entry))
+    if entry[TOOLS] is not None:
+        stats['tools'] = sorted(entry[TOOLS])
+    return stats
+
+
+class SpillingAggregator:
+    """
+    按记录的某个字段分组累加统计，内存中的分组数超过 max_keys 时溢出到磁盘。
+    with_tools 为 True 时同时收集每组使用过的工具（会话聚合）。
+    """
+
+    def __init__(self, field, default, with_tools=False, max_keys=None, partitions=DEFAULT_PARTITIONS):
+        self.field = field
+        self.default = default
+        self.with_tools = with_tools
+        self.max_keys = max_keys
+        self.partitions = partitions
+        self.groups = {}
+        self.spills = 0
+        self._tmp = None
+        self._files = None
+
+    def add(self, record):
+        """累加一条记录（采样记录按权重计入，汇总行按其操作数计入）"""
+        key = record.get(self.field, self.default)
+        entry = self.groups.get(key)
+        if entry is None:
+            if self.max_keys is not None and len(self.groups) >= self.max_keys:
+                self._spill()
+            entry = self.groups[key] = _new_entry(self.with_tools)
+        w = record.get('weight', 1)
+        entry[0] += w * record['additions']
+        entry[1] += w * record['deletions']
+        entry[2] += w * record['net_change']
+        entry[3] += record.get('operations', w)
+        for i, field in enumerate(stats_codec.CONTENT_FIELDS, 4):
+            entry[i] += w * record.get(field, 0)
+        if entry[TOOLS] is not None:
+            entry[TOOLS].add(record.get('tool', 'Unknown'))
+
+    def _spill(self):
+        """把内存中的部分结果按键哈希追加到各分区文件并清空"""
+        if self._tmp is None:
+            self._tmp = tempfile.TemporaryDirectory(prefix="claude-stats-spill-")
+            self._files = [open(Path(self._tmp.name) / f"part-{i:03d}.jsonl", 'w', encoding='utf-8')
+                           for i in range(self.partitions)]
+        for key, entry in self.groups.items():
+            tools = sorted(entry[TOOLS]) if entry[TOOLS] is not None else None
+            f = self._files[zlib.crc32(key.encode('utf-8')) % self.partitions]
+            f.write(stats_codec.dumps([key] + entry[:TOOLS] + [tools]) + '\n')
+        self.groups.clear()
+        self.spills += 1
+
+    def _sort_partition(self, path):
+        """合并一个分区中同一键的部分结果，按键排序写回"""
+        groups = {}
+        with open(path, 'rb') as f:
+            for line in f:
+                key, *counts, tools = stats_codec.loads(line)
+                entry = groups.get(key)
+                if entry is None:
+                    entry = groups[key] = _new_entry(tools is not None)
+                for i, value in enumerate(counts):
+                    entry[i] += value
+                if tools is not None:
+                    entry[TOOLS].update(tools)
+
+        with open(path, 'w', encoding='utf-8') as f:
+            for key in sorted(groups):
+                f.write(stats_codec.dumps([key, _to_stats(groups[key])]) + '\n')
+
+    @staticmethod
+    def _iter_partition(path):
+        with open(path, 'rb') as f:
+            for line in f:
+                key, stats = stats_codec.loads(line)
+                yield key, stats
+
+    def results(self):
+        """按键排序产出 (键, 统计)；未溢出时直接排序内存中的结果"""
+        if self._tmp is None:
+            for key in sorted(self.groups):
+                yield key, _to_stats(self.groups[key])
+            self.groups.clear()
+            return
+
+        try:
+            self._spill()
+            for f in self._files:
+                f.close()
+            paths = [f.name for f in self._files]
+            for path in paths:
+                self._sort_partition(path)
+            yield from heapq.merge(*(self._iter_partition(p) for p in paths), key=lambda item: item[0])
+        finally:
+            self.close()
+
+    def close(self):
+        """删除临时分区文件"""
+        if self._tmp is not None:
+            for f in self._files:
+                f.close()
+            self._tmp.cleanup()
+            self._tmp = None
@@ -10,7 +10,7 @@ echo.
 
 REM 获取脚本所在目录
 set "SCRIPT_DIR=%~dp0"
-set "TEST_SCRIPT=%SCRIPT_DIR%test_post_stat.py"
+set "TEST_SCRIPTS=test_post_stat.py test_view_stats.py"
 
 REM 检查 Python 是否安装
 where python >nul 2>nul
@@ -29,18 +29,23 @@ echo Python 版本: %PYTHON_VERSION%
 echo.
 
 REM 检查测试脚本是否存在
-if not exist "%TEST_SCRIPT%" (
-    echo 错误：找不到测试脚本: %TEST_SCRIPT%
-    pause
-    exit /b 1
+for %%t in (%TEST_SCRIPTS%) do (
+    if not exist "%SCRIPT_DIR%%%t" (
+        echo 错误：找不到测试脚本: %SCRIPT_DIR%%%t
+        pause
+        exit /b 1
+    )
 )
 
 REM 运行测试
 echo 正在运行测试...
 echo.
 
-python "%TEST_SCRIPT%"
-set EXIT_CODE=%errorlevel%
+set EXIT_CODE=0
+for %%t in (%TEST_SCRIPTS%) do (
+    python "%SCRIPT_DIR%%%t"
+    if !errorlevel! neq 0 set EXIT_CODE=!errorlevel!
+)
 
 echo.
 
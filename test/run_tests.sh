@@ -3,7 +3,7 @@
 
 # 获取脚本所在目录
 SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
-TEST_SCRIPT="$SCRIPT_DIR/test_post_stat.py"
+TEST_SCRIPTS=("$SCRIPT_DIR/test_post_stat.py" "$SCRIPT_DIR/test_view_stats.py")
 
 # 颜色定义
 GREEN='\033[0;32m'
@@ -30,17 +30,21 @@ echo -e "${BLUE}Python 版本: ${NC}$PYTHON_VERSION"
 echo ""
 
 # 检查测试脚本是否存在
-if [ ! -f "$TEST_SCRIPT" ]; then
-    echo -e "${RED}错误：找不到测试脚本: $TEST_SCRIPT${NC}"
-    exit 1
-fi
+for TEST_SCRIPT in "${TEST_SCRIPTS[@]}"; do
+    if [ ! -f "$TEST_SCRIPT" ]; then
+        echo -e "${RED}错误：找不到测试脚本: $TEST_SCRIPT${NC}"
+        exit 1
+    fi
+done
 
 # 运行测试
 echo -e "${BLUE}正在运行测试...${NC}"
 echo ""
 
-python3 "$TEST_SCRIPT"
-EXIT_CODE=$?
+EXIT_CODE=0
+for TEST_SCRIPT in "${TEST_SCRIPTS[@]}"; do
+    python3 "$TEST_SCRIPT" || EXIT_CODE=$?
+done
 
 echo ""
 
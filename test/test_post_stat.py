@@ -7,6 +7,7 @@ post_stat.py 的测试脚本（跨平台兼容）
 import json
 import subprocess
 import sys
+import time
 from pathlib import Path
 from datetime import datetime
 
@@ -14,7 +15,8 @@ from datetime import datetime
 TEST_DIR = Path(__file__).resolve().parent
 HOOKS_DIR = TEST_DIR.parent
 POST_STAT_SCRIPT = HOOKS_DIR / "post_stat.py"
-STATS_DIR = HOOKS_DIR / "stats"  # 统计数据目录
+LAUNCHER_SCRIPT = HOOKS_DIR / "hook_launcher.py"
+STATS_DIR = HOOKS_DIR / "code-log"  # 统计数据目录（与 post_stat.py 一致）
 
 
 def get_today_stats_file():
@@ -72,13 +74,14 @@ def print_error(message):
     print(f"{Color.RED}✗ {message}{Color.RESET}")
 
 
-def run_hook_test(test_data, description):
+def run_hook_test(test_data, description, script=POST_STAT_SCRIPT):
     """
     运行单个 hook 测试。
 
     参数：
         test_data: 要发送给 hook 的 JSON 数据
         description: 测试描述
+        script: 要运行的 hook 脚本（默认 post_stat.py）
 
     返回：
         (success, stdout, stderr)
@@ -89,7 +92,7 @@ def run_hook_test(test_data, description):
 
         # 调用 post_stat.py，通过 stdin 传递数据
         result = subprocess.run(
-            [sys.executable, str(POST_STAT_SCRIPT)],
+            [sys.executable, str(script)],
             input=json_input,
             capture_output=True,
             text=True,
@@ -290,7 +293,50 @@ def main():
         print_error(f"执行失败: {stderr}")
         tests_failed += 1
 
-    # ========== 测试 4: 无变更 - 应该跳过记录 ==========
+    # ========== 测试 4: Edit 工具 - 内容指标 ==========
+    print_test(4, "Edit 工具 - 内容指标（字节、字符、空行、注释行）")
+
+    test_data = {
+        "session_id": test_session_id,
+        "tool_input": {
+            "___TOOL_NAME___": "Edit",
+            "old_string": "x = 1\n",
+            "new_string": "# 初始化\nx = 1\n\ny = 2\n"
+        }
+    }
+
+    success, stdout, stderr = run_hook_test(test_data, "Edit 内容指标测试")
+
+    if success:
+        print(f"  标准错误输出:\n{stderr}")
+
+        records = read_last_stats_records(1)
+        if records:
+            expected = {
+                "tool": "Edit",
+                "additions": 3,
+                "net_change": 3,
+                "bytes": 19,
+                "chars": 13,
+                "blank_lines": 1,
+                "comment_lines": 1,
+                "session_id": test_session_id
+            }
+            verify_success, verify_msg = verify_stats_record(records[0], expected)
+            if verify_success:
+                print_success(f"Edit 内容指标测试通过: {verify_msg}")
+                tests_passed += 1
+            else:
+                print_error(f"Edit 内容指标测试失败: {verify_msg}")
+                tests_failed += 1
+        else:
+            print_error("未找到统计记录")
+            tests_failed += 1
+    else:
+        print_error(f"执行失败: {stderr}")
+        tests_failed += 1
+
+    # ========== 测试 5: 无变更 - 应该跳过记录 ==========
     print_test(5, "无变更场景 - 应该跳过记录")
 
     test_data = {
@@ -325,6 +371,301 @@ def main():
         print_error(f"执行失败: {stderr}")
         tests_failed += 1
 
+    # ========== 测试 6: 通过启动器运行 ==========
+    print_test(6, "hook_launcher.py 启动器 - Write 工具")
+
+    test_data = {
+        "session_id": test_session_id,
+        "tool_input": {
+            "___TOOL_NAME___": "Write",
+            "content": "a\nb\n"
+        }
+    }
+
+    success, stdout, stderr = run_hook_test(test_data, "启动器测试", script=LAUNCHER_SCRIPT)
+
+    if success:
+        print(f"  标准错误输出:\n{stderr}")
+
+        records = read_last_stats_records(1)
+        if records:
+            expected = {
+                "tool": "Write",
+                "additions": 2,
+                "deletions": 0,
+                "session_id": test_session_id
+            }
+            verify_success, verify_msg = verify_stats_record(records[0], expected)
+            if verify_success:
+                print_success(f"启动器测试通过: {verify_msg}")
+                tests_passed += 1
+            else:
+                print_error(f"启动器测试失败: {verify_msg}")
+                tests_failed += 1
+        else:
+            print_error("未找到统计记录")
+            tests_failed += 1
+    else:
+        print_error(f"执行失败: {stderr}")
+        tests_failed += 1
+
+    # ========== 测试 7: 持锁进程卡住 - 超时后暂存，之后回写 ==========
+    print_test(7, "锁等待超时 - 记录暂存到 .spill/ 并在下次写入时回写")
+
+    if platform.system() == 'Windows':
+        print_success("Windows 下跳过（需要 fcntl 模拟持锁进程）")
+        tests_passed += 1
+    else:
+        sys.path.insert(0, str(HOOKS_DIR))
+        import post_stat
+
+        stats_file = get_today_stats_file()
+        stats_file.parent.mkdir(parents=True, exist_ok=True)
+        holder = subprocess.Popen(
+            [sys.executable, "-c",
+             "import fcntl, sys, time\n"
+             f"f = open({str(stats_file)!r}, 'a')\n"
+             "fcntl.flock(f.fileno(), fcntl.LOCK_EX)\n"
+             "print('locked', flush=True)\n"
+             "time.sleep(30)\n"],
+            stdout=subprocess.PIPE, text=True
+        )
+        try:
+            holder.stdout.readline()
+            spilled_data = {
+                "session_id": test_session_id,
+                "tool_input": {"___TOOL_NAME___": "Write", "content": "spilled\n"}
+            }
+            start = time.perf_counter()
+            success, stdout, stderr = run_hook_test(spilled_data, "锁超时测试")
+            elapsed = time.perf_counter() - start
+        finally:
+            holder.kill()
+            holder.wait()
+
+        spill_dir = stats_file.parent / post_stat.SPILL_DIR_NAME
+        spilled = sorted(spill_dir.glob("*.jsonl")) if spill_dir.exists() else []
+        deadline = post_stat.DEFAULT_LOCK_TIMEOUT + 1.0
+
+        # 锁释放后的下一次调用先回写暂存记录，再追加自己的记录
+        after_data = {
+            "session_id": test_session_id,
+            "tool_input": {"___TOOL_NAME___": "Write", "content": "after\nlock\n"}
+        }
+        run_hook_test(after_data, "回写测试")
+        records = read_last_stats_records(2)
+        remaining = sorted(spill_dir.glob("*.jsonl")) if spill_dir.exists() else []
+
+        if not success or elapsed > deadline:
+            print_error(f"锁超时测试失败: 耗时 {elapsed:.2f}s，应小于 {deadline:.1f}s")
+            tests_failed += 1
+        elif len(spilled) != 1:
+            print_error(f"锁超时测试失败: 应暂存 1 个文件，实际 {len(spilled)} 个")
+            tests_failed += 1
+        elif [r.get('additions') for r in records] != [1, 2] or remaining:
+            print_error(f"回写测试失败: 最后两条记录 {records}，剩余暂存文件 {remaining}")
+            tests_failed += 1
+        else:
+            print_success(f"锁超时测试通过: 持锁进程卡住时 hook 耗时 {elapsed:.2f}s，暂存记录已按顺序回写")
+            tests_passed += 1
+
+    # ========== 测试 8: 重复写入检测 ==========
+    print_test(8, "重复写入检测 - Edit 写回此前写过的行")
+
+    churn_file = f"/tmp/churn-{test_session_id}.py"
+    write_data = {
+        "session_id": test_session_id,
+        "tool_input": {"___TOOL_NAME___": "Write", "file_path": churn_file,
+                       "content": "alpha = 1\nbeta = 2\n"}
+    }
+    edit_data = {
+        "session_id": test_session_id,
+        "tool_input": {"___TOOL_NAME___": "Edit", "file_path": churn_file,
+                       "old_string": "beta = 2\n", "new_string": "gamma = 3\nbeta = 2\nalpha = 1\n"}
+    }
+    run_hook_test(write_data, "重复写入测试（写入）")
+    success, stdout, stderr = run_hook_test(edit_data, "重复写入测试（编辑）")
+    records = read_last_stats_records(2)
+
+    if not success:
+        print_error(f"执行失败: {stderr}")
+        tests_failed += 1
+    elif [r.get('churn') for r in records] != [0, 1]:
+        print_error(f"重复写入测试失败: 最后两条记录 {records}")
+        tests_failed += 1
+    else:
+        print_success("重复写入测试通过: 写回的 alpha = 1 计为 1 行重复写入，新增的 gamma = 3 不计")
+        tests_passed += 1
+
+    # ========== 测试 9: 进程内调用 ==========
+    print_test(9, "进程内调用 post_stat.record() - 不为每次调用启动子进程")
+
+    import contextlib
+    import io
+    import tempfile
+    sys.path.insert(0, str(HOOKS_DIR))
+    import post_stat
+
+    calls = 200
+    original_dir = post_stat.STATS_DIR
+    with tempfile.TemporaryDirectory() as tmp:
+        post_stat.STATS_DIR = Path(tmp)
+        try:
+            with contextlib.redirect_stderr(io.StringIO()):
+                start = time.perf_counter()
+                written = [post_stat.record({
+                    "session_id": test_session_id,
+                    "tool_input": {"___TOOL_NAME___": "Write", "content": "x = 1\n" * (i % 3)}
+                }, email="bench@example.com") for i in range(calls)]
+                elapsed = time.perf_counter() - start
+            lines = sum(len(path.read_text(encoding='utf-8').splitlines()) for path in Path(tmp).glob("*.jsonl"))
+        finally:
+            post_stat.STATS_DIR = original_dir
+
+    kept = [r for r in written if r is not None]
+    if len(kept) != sum(1 for i in range(calls) if i % 3) or lines != len(kept):
+        print_error(f"进程内调用测试失败: 返回 {len(kept)} 条记录，文件中 {lines} 行")
+        tests_failed += 1
+    elif any(r['email'] != "bench@example.com" for r in kept):
+        print_error("进程内调用测试失败: 未使用传入的邮箱")
+        tests_failed += 1
+    else:
+        print_success(f"进程内调用测试通过: {calls} 次调用 {elapsed * 1000:.0f}ms"
+                      f"（{elapsed / calls * 1e6:.0f}µs/次），无变更的调用返回 None")
+        tests_passed += 1
+
+    # ========== 测试 10: 重复调用抑制 ==========
+    print_test(10, "重复调用抑制 - 同一次调用被触发两次只记录一次")
+
+    duplicate_data = {
+        "session_id": test_session_id,
+        "tool_use_id": f"toolu_{time.time_ns()}",
+        "tool_input": {"___TOOL_NAME___": "Write", "content": "once\nonly\n"}
+    }
+    # 没有 tool_use_id 时不检查：相同内容的重复调用是合法的重复操作
+    untagged_data = {
+        "session_id": test_session_id,
+        "tool_input": {"___TOOL_NAME___": "Write", "content": f"untagged {time.time_ns()}\n"}
+    }
+    before = len(read_last_stats_records(100000))
+    run_hook_test(duplicate_data, "重复调用测试（第一次）")
+    success, stdout, stderr = run_hook_test(duplicate_data, "重复调用测试（重试）")
+    retried = dict(duplicate_data, tool_use_id=duplicate_data["tool_use_id"] + "b")
+    run_hook_test(retried, "重复调用测试（不同调用）")
+    run_hook_test(untagged_data, "重复调用测试（无 tool_use_id）")
+    run_hook_test(untagged_data, "重复调用测试（无 tool_use_id 再次调用）")
+    records = read_last_stats_records(100000)[before:]
+
+    # 开启 dedup_content_hash 后没有 tool_use_id 的相同调用按内容哈希只记录一次
+    original_config = post_stat.load_config()
+    with tempfile.TemporaryDirectory() as tmp:
+        post_stat.STATS_DIR = Path(tmp)
+        try:
+            written = []
+            for content_hash in (True, False):
+                post_stat._config = dict(original_config, dedup_content_hash=content_hash)
+                untagged = {
+                    "session_id": test_session_id,
+                    "tool_input": {"___TOOL_NAME___": "Write", "content": f"hashed {content_hash}\n"}
+                }
+                with contextlib.redirect_stderr(io.StringIO()):
+                    written.append([post_stat.record(untagged, email="dedup@example.com") is not None
+                                    for _ in range(2)])
+        finally:
+            post_stat.STATS_DIR = original_dir
+            post_stat._config = original_config
+
+    if not success or "重复调用" not in stderr:
+        print_error(f"重复调用测试失败: 重试没有被识别为重复调用\n{stderr}")
+        tests_failed += 1
+    elif [r.get('additions') for r in records] != [2, 2, 1, 1]:
+        print_error(f"重复调用测试失败: 新增记录 {records}")
+        tests_failed += 1
+    elif written != [[True, False], [True, True]]:
+        print_error(f"重复调用测试失败: 开启 / 关闭 dedup_content_hash 时的写入结果 {written}")
+        tests_failed += 1
+    else:
+        print_success("重复调用测试通过: 相同 tool_use_id 的重试只记录一次，不同调用和没有 tool_use_id 的相同调用照常记录，"
+                      "开启 dedup_content_hash 后按内容只记录一次")
+        tests_passed += 1
+
+    # ========== 测试 11: 二进制记录存储 ==========
+    print_test(11, "二进制记录存储 - 开启 binary_store 后 hook 在同一把锁内同步")
+
+    import stats_binary
+
+    original_config = post_stat.load_config()
+    with tempfile.TemporaryDirectory() as tmp:
+        post_stat.STATS_DIR = Path(tmp)
+        post_stat._config = dict(original_config, binary_store=True)
+        try:
+            with contextlib.redirect_stderr(io.StringIO()):
+                for i in range(1, 21):
+                    post_stat.record({
+                        "session_id": test_session_id,
+                        "tool_input": {"___TOOL_NAME___": "Write", "content": f"line {i}\n" * i}
+                    }, email="binary@example.com")
+            stats_file = post_stat.get_today_stats_file()
+            date_str = stats_file.name.split('.', 1)[0]
+            with open(stats_file, 'rb') as f:
+                expected = [json.loads(line) for line in f]
+            actual = stats_binary.read_day(tmp, date_str)
+        finally:
+            post_stat.STATS_DIR = original_dir
+            post_stat._config = original_config
+
+    if actual is None or actual != expected:
+        print_error(f"二进制存储测试失败: 存储中 {None if actual is None else len(actual)} 条，JSONL 中 {len(expected)} 条")
+        tests_failed += 1
+    else:
+        print_success(f"二进制存储测试通过: {len(actual)} 条记录与 JSONL 一致")
+        tests_passed += 1
+
+    # ========== 测试 12: 回写到已归档日期与中途退出恢复 ==========
+    print_test(12, "暂存回写 - 已归档日期并入归档内容，回写中途退出后不重复写入")
+
+    import stats_archive
+
+    def spill_line(i):
+        return json.dumps({"timestamp": f"2026-01-10T10:{i:02d}:00+08:00", "session_id": "spill",
+                           "email": "spill@example.com", "tool": "Write",
+                           "additions": i, "deletions": 0, "net_change": i}) + "\n"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        spill_dir = tmp / post_stat.SPILL_DIR_NAME
+        spill_dir.mkdir()
+        archived_day = tmp / "2026-01-10.jsonl"
+        archived_day.write_text("".join(spill_line(i) for i in range(1, 6)), encoding='utf-8')
+        stats_archive.archive_day(archived_day)
+        (spill_dir / "2026-01-10.1.100.jsonl").write_text(spill_line(6), encoding='utf-8')
+
+        # 当天：一个暂存文件已写入但未删除，一个已认领但未写入
+        today_file = tmp / "2026-01-11.jsonl"
+        today_file.write_text(spill_line(7), encoding='utf-8')
+        (spill_dir / f".2026-01-11.2.100.jsonl.0{post_stat.CLAIMED_SUFFIX}").write_text(spill_line(7), encoding='utf-8')
+        written_at = today_file.stat().st_size
+        (spill_dir / f".2026-01-11.3.100.jsonl.{written_at}{post_stat.CLAIMED_SUFFIX}").write_text(
+            spill_line(8), encoding='utf-8')
+
+        with contextlib.redirect_stderr(io.StringIO()):
+            with open(today_file, 'a', encoding='utf-8') as held:
+                folded = post_stat.fold_spills(today_file, held)
+        day_path = stats_archive.find_day_file("2026-01-10", tmp)
+        archived_lines = day_path.read_text(encoding='utf-8').splitlines() if day_path else []
+        today_lines = today_file.read_text(encoding='utf-8').splitlines()
+        leftover = list(spill_dir.iterdir())
+
+    if day_path is None or stats_archive.archive_codec(day_path) or len(archived_lines) != 6:
+        print_error(f"暂存回写测试失败: 已归档日期应并入归档内容，实际 {day_path} 中 {len(archived_lines)} 行")
+        tests_failed += 1
+    elif [json.loads(line)['additions'] for line in today_lines] != [7, 8] or folded != 2 or leftover:
+        print_error(f"暂存回写测试失败: 当天 {today_lines}，回写 {folded} 条，剩余 {leftover}")
+        tests_failed += 1
+    else:
+        print_success("暂存回写测试通过: 归档日期的记录未被遮住，已写入的暂存文件不再重复写入")
+        tests_passed += 1
+
     # ========== 测试总结 ==========
     print_header("测试总结")
 
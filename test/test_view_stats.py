@@ -0,0 +1,1142 @@
+#!/usr/bin/env python3
+"""
+view_stats.py 及相关数据工具的测试脚本（跨平台兼容）
+在临时统计目录中构造数据，验证读取、归档等功能。
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from datetime import datetime
+
+# 路径配置
+TEST_DIR = Path(__file__).resolve().parent
+HOOKS_DIR = TEST_DIR.parent
+sys.path.insert(0, str(HOOKS_DIR))
+
+import stats_archive
+import stats_codec
+import stats_spill
+import view_stats
+from test_post_stat import Color, print_header, print_test, print_success, print_error
+
+DATE = "2026-01-15"
+
+
+def make_record(i, date_str=DATE):
+    """构造第 i 条样例记录（时间每条递增 1 分钟）"""
+    additions = i % 7
+    deletions = i % 3
+    return {
+        "timestamp": f"{date_str}T{i // 60 % 24:02d}:{i % 60:02d}:00+08:00",
+        "session_id": f"session-{i % 4}",
+        "email": f"user{i % 2}@example.com",
+        "tool": "Edit" if i % 2 else "Write",
+        "additions": additions,
+        "deletions": deletions,
+        "net_change": additions - deletions,
+    }
+
+
+def write_records(stats_dir, records, date_str=DATE):
+    """写入一天的记录并返回文件路径"""
+    path = Path(stats_dir) / f"{date_str}.jsonl"
+    with open(path, 'w', encoding='utf-8') as f:
+        for record in records:
+            f.write(stats_codec.dumps(record) + '\n')
+    return path
+
+
+def check_archive_roundtrip(stats_dir):
+    """归档后读取结果与原始文件一致，且日期列表包含归档日期"""
+    records = [make_record(i) for i in range(600)]
+    raw_path = write_records(stats_dir, records)
+    expected = view_stats.read_stats_file(DATE)
+
+    info = stats_archive.archive_day(raw_path, block_size=4096)
+    if raw_path.exists():
+        return False, "归档后原始文件仍然存在"
+    if info['blocks'] < 2:
+        return False, f"块数过少: {info['blocks']}"
+
+    actual = view_stats.read_stats_file(DATE)
+    if actual != expected:
+        return False, f"归档读取结果不一致: {len(actual)} != {len(expected)}"
+    if view_stats.list_available_dates() != [DATE]:
+        return False, f"日期列表错误: {view_stats.list_available_dates()}"
+    return True, f"{len(actual)} 条记录，{info['blocks']} 个块"
+
+
+def check_archive_range_query(stats_dir):
+    """范围查询只返回时间范围内的记录，且只解压相交的块"""
+    start = f"{DATE}T02:00:00+08:00"
+    end = f"{DATE}T03:00:00+08:00"
+    archive_path = stats_archive.find_day_file(DATE, stats_dir)
+
+    records = view_stats.read_stats_file(DATE, start, end)
+    if len(records) != 60:
+        return False, f"期望 60 条记录，实际 {len(records)}"
+    if not all(start <= r['timestamp'] < end for r in records):
+        return False, "返回了范围外的记录"
+
+    total_blocks = len(stats_archive.read_index(archive_path)['blocks'])
+    used_blocks = sum(1 for _ in stats_archive.iter_archive_blocks(archive_path, start, end))
+    if used_blocks >= total_blocks:
+        return False, f"解压了全部 {total_blocks} 个块"
+    return True, f"解压 {used_blocks}/{total_blocks} 个块"
+
+
+def check_mapped_scanning(stats_dir):
+    """内存映射计数、取尾部记录和切块并行解析的结果与逐行读取一致"""
+    date_str = "2026-01-16"
+    records = [make_record(i, date_str) for i in range(1000)]
+    path = write_records(stats_dir, records, date_str)
+
+    if view_stats.count_records(date_str) != len(records):
+        return False, f"记录数错误: {view_stats.count_records(date_str)}"
+    if view_stats.read_recent_records(date_str, 5) != records[-5:]:
+        return False, "最近记录不一致"
+
+    # 末尾的损坏行不占用 n 条的名额
+    with open(path, 'ab') as f:
+        f.write(b'{"broken\n' * 3 + (stats_codec.dumps(records[0]) + '\n').encode('utf-8') + b'not json\n')
+    if view_stats.read_recent_records(date_str, 5) != records[-4:] + records[:1]:
+        return False, "末尾有损坏行时最近记录不足 n 条"
+    if len(view_stats.read_recent_records(date_str, 5000)) != len(records) + 1:
+        return False, "n 超过记录数时应返回全部记录"
+    write_records(stats_dir, records, date_str)
+
+    with view_stats.MappedStatsFile(path) as mapped:
+        chunks = mapped.split(7)
+        parsed = []
+        for start, end in chunks:
+            parsed.extend(mapped.decode_spans(mapped.line_spans(start, end)))
+    if parsed != records:
+        return False, f"切块解析结果不一致: {len(parsed)} 条"
+
+    if view_stats.read_mapped_parallel(path, workers=2) != records:
+        return False, "并行解析结果不一致"
+    return True, f"{len(chunks)} 个块"
+
+
+def check_metrics_exporter(stats_dir):
+    """导出服务只读取新增的完整行，检查点恢复后不重复计数，文件被重写时重建，输出 Prometheus 文本"""
+    import metrics_exporter
+
+    exporter_dir = Path(stats_dir) / "exporter"
+    exporter_dir.mkdir()
+    date_str = "2026-02-20"
+    records = [make_record(i, date_str) for i in range(100)]
+    path = write_records(exporter_dir, records[:60], date_str)
+    archived = write_records(exporter_dir, [make_record(i, "2026-02-19") for i in range(40)], "2026-02-19")
+    stats_archive.archive_day(archived, block_size=4096)
+    checkpoint = exporter_dir / metrics_exporter.CHECKPOINT_NAME
+
+    def totals(state):
+        return {key: dict(stats) for key, stats in state.counters.items()}
+
+    def expected(items):
+        state = metrics_exporter.MetricsState()
+        for record in items:
+            state.apply(record)
+        return totals(state)
+
+    all_archived = [make_record(i, "2026-02-19") for i in range(40)]
+    state = metrics_exporter.MetricsState()
+    tailer = metrics_exporter.DayFileTailer(exporter_dir, state, checkpoint)
+    tailer.poll()
+    if totals(state) != expected(all_archived + records[:60]):
+        return False, "首次读取的计数不正确"
+    if view_stats.STATS_DIR == exporter_dir:
+        return False, "读取时不应修改 view_stats.STATS_DIR"
+
+    # 末尾未写完的行留到下次
+    tail = stats_codec.dumps(records[60]) + '\n'
+    with open(path, 'a', encoding='utf-8') as f:
+        for record in records[61:80]:
+            f.write(stats_codec.dumps(record) + '\n')
+        f.write(tail[:10])
+    tailer.poll()
+    if totals(state) != expected(all_archived + records[:60] + records[61:80]):
+        return False, "未写完的行不应计入"
+    tailer.save()
+
+    # 从检查点恢复后只读取之后新增的行
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(tail[10:])
+        for record in records[80:]:
+            f.write(stats_codec.dumps(record) + '\n')
+    resumed = metrics_exporter.MetricsState()
+    tailer = metrics_exporter.DayFileTailer(exporter_dir, resumed, checkpoint)
+    tailer.load()
+    tailer.poll()
+    if totals(resumed) != expected(all_archived + records[:80] + records[80:]):
+        return False, "从检查点恢复后计数不正确"
+
+    # 文件被重写（截断）后整体重建
+    write_records(exporter_dir, records[:30], date_str)
+    tailer.poll()
+    if totals(resumed) != expected(all_archived + records[:30]):
+        return False, "文件被重写后应重建计数器"
+
+    # 残行后拼接的记录与查看工具一样被找回
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(stats_codec.dumps(records[30])[:40])
+        f.write(stats_codec.dumps(records[31]) + '\n')
+    tailer.poll()
+    day_records = list(view_stats.iter_day_records(path, persist=False))
+    if day_records != records[:30] + [records[31]] or totals(resumed) != expected(all_archived + day_records):
+        return False, "残行后拼接的记录应计入"
+
+    text = resumed.render()
+    sample = 'claude_code_stats_additions_total{user="user1@example.com",tool="Edit"} '
+    additions = sum(r['additions'] for r in all_archived + day_records
+                    if r['email'] == 'user1@example.com' and r['tool'] == 'Edit')
+    if "# TYPE claude_code_stats_additions_total counter" not in text or f"{sample}{additions}\n" not in text:
+        return False, "Prometheus 文本格式不正确"
+    if metrics_exporter.escape_label('a"b\\c\nd') != 'a\\"b\\\\c\\nd':
+        return False, "标签值转义不正确"
+    return True, f"{len(text.splitlines())} 行指标，检查点恢复与重写重建正确"
+
+
+def check_merge_dedup(stats_dir):
+    """合并两个来源时按时间归并并去掉重复拷贝，重复合并结果不变"""
+    import merge_stats
+
+    date_str = "2026-01-17"
+    records = [make_record(i, date_str) for i in range(200)]
+    machine_a = stats_dir / "machine-a"
+    machine_b = stats_dir / "machine-b"
+    merged = stats_dir / "merged"
+    machine_a.mkdir()
+    machine_b.mkdir()
+    # A 拥有偶数记录，B 拥有奇数记录，且 B 额外复制了 A 的前 50 条
+    write_records(machine_a, records[0::2], date_str)
+    write_records(machine_b, sorted(records[1::2] + records[0:100:2], key=lambda r: r['timestamp']), date_str)
+
+    for _ in range(2):
+        results = merge_stats.merge_dirs([machine_a, machine_b], merged, workers=1)
+    merged_records = list(view_stats.iter_stats_file(date_str, stats_dir=merged))
+    if merged_records != records:
+        return False, f"合并结果不一致: {len(merged_records)} 条"
+    return True, f"{len(merged_records)} 条记录，第二次合并去重 {results[0][2][1]} 条"
+
+
+def check_corrupt_lines(stats_dir):
+    """损坏的行被跳过并隔离，其后的记录不丢失，已校验位置在再次读取时生效"""
+    date_str = "2026-01-20"
+    records = [make_record(i, date_str) for i in range(40)]
+    path = Path(stats_dir) / f"{date_str}.jsonl"
+    with open(path, 'w', encoding='utf-8') as f:
+        for i, record in enumerate(records):
+            line = stats_codec.dumps(record)
+            if i == 10:
+                # 写入中途崩溃留下的残行，下一条记录紧接其后
+                f.write(line[:25])
+            if i == 20:
+                f.write('not json\n')
+            f.write(line + '\n')
+
+    if view_stats.read_stats_file(date_str) != records:
+        return False, "损坏行之后的记录丢失"
+
+    quarantine_path = Path(stats_dir) / view_stats.QUARANTINE_DIR_NAME / path.name
+    quarantined = quarantine_path.read_text(encoding='utf-8').splitlines()
+    if len(quarantined) != 2:
+        return False, f"隔离行数应为 2，实际 {len(quarantined)}"
+
+    state = stats_codec.loads(view_stats.validation_state_path(path).read_bytes())
+    if state['offset'] != path.stat().st_size or len(state['bad']) != 2:
+        return False, f"已校验位置不正确: {state}"
+
+    # 再次读取：已校验部分不重复隔离；末尾未写完的行跳过但不算损坏
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(stats_codec.dumps(make_record(40, date_str))[:30])
+    if view_stats.read_stats_file(date_str) != records:
+        return False, "再次读取结果不一致"
+    if list(view_stats.iter_stats_file(date_str)) != records:
+        return False, "流式读取结果不一致"
+    if len(quarantine_path.read_text(encoding='utf-8').splitlines()) != 2:
+        return False, "已隔离的行被重复隔离"
+
+    parallel = view_stats.read_mapped_parallel(path, workers=2)
+    if parallel != records:
+        return False, f"并行解析结果不一致: {len(parallel)} 条"
+
+    # 只读的来源目录：结果相同，但不写入校验位置和隔离文件
+    source_dir = Path(stats_dir) / "corrupt-source"
+    source_dir.mkdir()
+    shutil.copy2(path, source_dir / path.name)
+    if list(view_stats.iter_stats_file(date_str, stats_dir=source_dir, persist=False)) != records:
+        return False, "只读来源的读取结果不一致"
+    if [p.name for p in source_dir.iterdir()] != [path.name]:
+        return False, f"不应写入只读来源目录: {sorted(p.name for p in source_dir.iterdir())}"
+    return True, f"{len(records)} 条记录完整，隔离 2 行"
+
+
+def check_session_index(stats_dir):
+    """跨越午夜的会话通过索引合并各天，追加记录后增量更新"""
+    import session_index
+
+    first, second = "2026-01-21", "2026-01-22"
+    # 使用独立的会话 ID，避免与其他测试写入的日期混在一起
+    late = [dict(make_record(i, first), timestamp=f"{first}T23:{i:02d}:00+08:00", session_id=f"night-{i % 3}")
+            for i in range(30)]
+    early = [dict(make_record(i, second), session_id=f"night-{i % 3}") for i in range(30)]
+    write_records(stats_dir, late, first)
+    path = write_records(stats_dir, early, second)
+
+    expected = [r for r in late + early if r['session_id'] == "night-1"]
+    if list(view_stats.iter_session_records("night-1")) != expected:
+        return False, "会话记录不一致"
+
+    extra = dict(make_record(45, second), session_id="night-2")
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(stats_codec.dumps(extra) + '\n')
+
+    with session_index.open_index(stats_dir) as index:
+        summary = index.summary(extra['session_id'])
+    expected = [r for r in late + early + [extra] if r['session_id'] == extra['session_id']]
+    if summary['days'] != [first, second] or summary['operations'] != len(expected):
+        return False, f"合并汇总不正确: {summary}"
+    if summary['additions'] != sum(r['additions'] for r in expected):
+        return False, "合并后的新增行数不正确"
+    return True, f"会话跨 {len(summary['days'])} 天，共 {summary['operations']} 条记录"
+
+
+def check_top_k(stats_dir):
+    """堆选出的排行与完整排序一致，Space-Saving 的估计值满足误差界"""
+    import random
+
+    rng = random.Random(7)
+    records = []
+    for i in range(5000):
+        record = make_record(i)
+        # 少数会话占大部分记录，其余为长尾
+        record['session_id'] = f"hot-{rng.randrange(5)}" if rng.random() < 0.5 else f"tail-{rng.randrange(2000)}"
+        records.append(record)
+
+    stats = view_stats.aggregate_by_session(records)
+    expected = sorted(stats.items(), key=lambda item: item[1]['additions'], reverse=True)[:5]
+    actual = view_stats.top_k('session', records, 5, 'additions')
+    if [v['additions'] for _, v in actual] != [v['additions'] for _, v in expected]:
+        return False, "精确排行与完整排序不一致"
+
+    approx = view_stats.approx_top_k('session', records, 5, 'operations', capacity=100)
+    if {key for key, _, _ in approx} != {f"hot-{i}" for i in range(5)}:
+        return False, f"近似排行未找到高频会话: {approx}"
+    for key, count, error in approx:
+        true_count = stats[key]['operations']
+        if not count - error <= true_count <= count:
+            return False, f"{key} 的真实值 {true_count} 不在 [{count - error}, {count}] 内"
+    return True, f"{len(stats)} 个会话，近似模式仅保留 100 个计数器"
+
+
+def check_spill_aggregate(stats_dir):
+    """分组数超出预算时溢出到磁盘，合并结果与内存聚合完全一致"""
+    records = []
+    for i in range(3000):
+        record = make_record(i)
+        record['session_id'] = f"agent-{(i * 7919) % 900}"
+        record['email'] = f"user{i % 130}@example.com"
+        records.append(record)
+
+    spilled = list(view_stats.iter_aggregate('session', records, max_keys=50))
+    if spilled != sorted(view_stats.aggregate_by_session(records).items()):
+        return False, "会话聚合结果不一致"
+    if list(view_stats.iter_aggregate('user', records, max_keys=20)) != sorted(view_stats.aggregate_by_user(records).items()):
+        return False, "用户聚合结果不一致"
+
+    aggregator = stats_spill.SpillingAggregator('session_id', 'unknown', with_tools=True, max_keys=50)
+    for record in records:
+        aggregator.add(record)
+    spills = aggregator.spills
+    list(aggregator.results())
+    if spills == 0:
+        return False, "未触发溢出"
+    return True, f"{len(spilled)} 个会话，溢出 {spills} 次"
+
+
+def check_backfill(stats_dir):
+    """从会话记录回填：只统计成功的 Write / Edit，跳过 hook 已记录的调用，重复运行不产生重复记录"""
+    import backfill_stats
+
+    projects = stats_dir / "projects" / "-home-demo"
+    out_dir = stats_dir / "backfill"
+    projects.mkdir(parents=True)
+
+    def tool_use(tool_id, name, tool_input, ts):
+        return {"type": "assistant", "sessionId": "past-1", "timestamp": ts,
+                "message": {"content": [{"type": "tool_use", "id": tool_id, "name": name, "input": tool_input}]}}
+
+    def tool_result(tool_id, ts, is_error=False):
+        return {"type": "user", "sessionId": "past-1", "timestamp": ts,
+                "message": {"content": [{"type": "tool_result", "tool_use_id": tool_id, "is_error": is_error}]}}
+
+    lines = [
+        tool_use("t1", "Write", {"content": "a\nb\nc\n"}, "2026-01-23T01:00:00.000Z"),
+        tool_result("t1", "2026-01-23T01:00:01.000Z"),
+        tool_use("t2", "Edit", {"old_string": "a\n", "new_string": "a\nb\n"}, "2026-01-23T02:00:00.000Z"),
+        tool_result("t2", "2026-01-23T02:00:01.000Z", is_error=True),
+        tool_use("t3", "Bash", {"command": "ls"}, "2026-01-23T03:00:00.000Z"),
+        tool_result("t3", "2026-01-23T03:00:01.000Z"),
+        tool_use("t4", "Edit", {"old_string": "x\n", "new_string": "x\ny\n"}, "2026-01-23T04:00:00.000Z"),
+        tool_result("t4", "2026-01-23T04:00:02.000Z"),
+    ]
+    with open(projects / "past-1.jsonl", 'w', encoding='utf-8') as f:
+        f.write("".join(stats_codec.dumps(line) + "\n" for line in lines))
+
+    # hook 已经记录了 t4（时间比工具结果晚半秒）
+    out_dir.mkdir()
+    logged = {"timestamp": "2026-01-23T12:00:02.500000+08:00", "session_id": "past-1", "email": "me@example.com",
+              "tool": "Edit", "additions": 1, "deletions": 0, "net_change": 1}
+    write_records(out_dir, [logged], "2026-01-23")
+
+    first = backfill_stats.backfill(stats_dir / "projects", out_dir, "me@example.com", workers=1)
+    # 会话文件有变化（重新处理），但已写入的记录不会重复
+    with open(projects / "past-1.jsonl", 'a', encoding='utf-8') as f:
+        f.write("\n")
+    second = backfill_stats.backfill(stats_dir / "projects", out_dir, "me@example.com", workers=1)
+    third = backfill_stats.backfill(stats_dir / "projects", out_dir, "me@example.com", workers=1)
+
+    records = list(view_stats.iter_stats_file("2026-01-23", stats_dir=out_dir))
+    if first != (1, 1, 1) or second != (1, 0, 2) or third != (0, 0, 0):
+        return False, f"回填结果异常: {first} {second} {third}"
+    if [(r['tool'], r['additions']) for r in records] != [("Write", 3), ("Edit", 1)]:
+        return False, f"回填后的记录不正确: {records}"
+    if records[0]['timestamp'] != "2026-01-23T09:00:01+08:00" or records[0]['session_id'] != "past-1":
+        return False, f"时间或会话 ID 不正确: {records[0]}"
+    if backfill_stats._to_local_timestamp("2026-01-23T01:00:00.250Z") != "2026-01-23T09:00:00.250000+08:00":
+        return False, "末尾为 Z 的 UTC 时间应转换为东八区时间"
+
+    # 时间全部无法解析时报错，而不是静默丢弃
+    bad_projects = stats_dir / "bad-projects" / "-home-demo"
+    bad_projects.mkdir(parents=True)
+    with open(bad_projects / "past-2.jsonl", 'w', encoding='utf-8') as f:
+        f.write(stats_codec.dumps(tool_use("t9", "Write", {"content": "a\n"}, "yesterday")) + "\n")
+        f.write(stats_codec.dumps(tool_result("t9", "yesterday")) + "\n")
+    try:
+        backfill_stats.backfill(stats_dir / "bad-projects", out_dir, "me@example.com", workers=1)
+        return False, "时间全部无法解析时应抛出 ValueError"
+    except ValueError:
+        pass
+    return True, f"写入 {first[1]} 条，跳过已记录 {first[2]} 条，重复运行无新增"
+
+
+def check_running_counters(stats_dir):
+    """hook 式更新的运行计数与扫描记录的聚合一致，其他工具追加的行和文件替换后自动补齐，预算判断正确"""
+    import stats_counters
+
+    date_str = "2026-01-24"
+    path = Path(stats_dir) / f"{date_str}.jsonl"
+    records = []
+    for i in range(400):
+        record = make_record(i, date_str)
+        record['session_id'] = f"counter-{i % 37}"
+        records.append(record)
+
+    for i, record in enumerate(records):
+        size_before = path.stat().st_size if path.exists() else 0
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(stats_codec.dumps(record) + '\n')
+        # 中间一段由不更新计数的工具追加
+        if not 100 <= i < 200:
+            counts = stats_counters.sync(path, record, size_before)
+
+    expected = view_stats.aggregate_by_session(records)
+    rows = list(view_stats.iter_counter_rows('session', date_str))
+    if {r['key']: (r['operations'], r['additions'], r['deletions']) for r in rows} != \
+            {k: (v['operations'], v['additions'], v['deletions']) for k, v in expected.items()}:
+        return False, "会话计数与聚合结果不一致"
+
+    day = next(view_stats.iter_counter_rows('day', date_str))
+    if day['operations'] != len(records):
+        return False, f"全天操作数应为 {len(records)}，实际 {day['operations']}"
+
+    budgets = stats_counters.parse_budgets({"session_lines": 10, "day_operations": 10000})
+    exceeded = stats_counters.exceeded_budgets(counts, budgets)
+    if [(kind, metric) for kind, metric, _, _ in exceeded] != [('session', 'lines')]:
+        return False, f"预算判断不正确: {exceeded}"
+
+    # 文件被替换（例如合并或回填）后重建
+    write_records(stats_dir, records[:5], date_str)
+    day = next(view_stats.iter_counter_rows('day', date_str))
+    if day['operations'] != 5:
+        return False, f"文件替换后未重建计数: {day['operations']}"
+
+    # 残行后拼接的记录与读取 JSONL 一样被找回
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(stats_codec.dumps(records[5])[:40])
+        f.write(stats_codec.dumps(records[6]) + '\n')
+    day = next(view_stats.iter_counter_rows('day', date_str))
+    if day['operations'] != len(view_stats.read_stats_file(date_str)) or day['operations'] != 6:
+        return False, f"残行后的记录应计入计数: {day['operations']}"
+    return True, f"{len(rows)} 个会话计数一致，替换后重建正确"
+
+
+def check_metric_sinks(stats_dir):
+    """计数预先合并后按包大小分批，经 UDP、Unix 数据报套接字和文件送达；没有接收方时不报错也不阻塞"""
+    import socket
+    import stats_sinks
+
+    records = [make_record(i) for i in range(1, 41)]
+    batch = stats_sinks.MetricBatch()
+    for record in records:
+        batch.add(record)
+    lines = list(batch.lines())
+    expected_additions = sum(r['additions'] for r in records)
+    if f"claude_code_stats.additions:{expected_additions}|c" not in lines:
+        return False, f"合并后的计数不正确: {lines[:4]}"
+    if "claude_code_stats.tool.Edit.operations:20|c" not in lines:
+        return False, "按工具拆分的计数不正确"
+
+    packets = list(batch.packets(200))
+    if len(packets) < 2 or any(len(p) > 200 for p in packets) or \
+            b'\n'.join(packets).decode().splitlines() != lines:
+        return False, "分包结果不正确"
+
+    listener = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    listener.bind(('127.0.0.1', 0))
+    listener.settimeout(2)
+    sink_configs = [
+        {"type": "statsd", "host": "127.0.0.1", "port": listener.getsockname()[1], "max_packet": 200},
+        {"type": "file", "path": str(stats_dir / "metrics.out")},
+    ]
+    unix_listener = None
+    if hasattr(socket, 'AF_UNIX'):
+        unix_listener = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        unix_listener.bind(str(stats_dir / "statsd.sock"))
+        unix_listener.settimeout(2)
+        sink_configs.append({"type": "unix", "path": str(stats_dir / "statsd.sock"), "tags": True})
+
+    try:
+        results = stats_sinks.publish(records, sink_configs)
+        received = []
+        for _ in range(len(packets)):
+            received.extend(listener.recv(65536).decode().splitlines())
+        if sorted(received) != sorted(lines):
+            return False, "UDP 接收到的指标与发送的不一致"
+        if unix_listener is not None and "claude_code_stats.operations:20|c|#tool:Edit,user:user1@example.com" \
+                not in unix_listener.recv(65536).decode().splitlines():
+            return False, "Unix 套接字未收到带标签的指标"
+        if (stats_dir / "metrics.out").read_text().splitlines() != lines:
+            return False, "文件 sink 内容不正确"
+    finally:
+        listener.close()
+        if unix_listener is not None:
+            unix_listener.close()
+
+    # 没有接收方：Unix 套接字不存在、UDP 端口无人监听
+    start = time.perf_counter()
+    missing = stats_sinks.publish(records, [{"type": "unix", "path": str(stats_dir / "missing.sock")},
+                                            {"type": "statsd", "host": "127.0.0.1", "port": 9}])
+    elapsed = time.perf_counter() - start
+    if any(isinstance(result, Exception) and not isinstance(result, OSError) for _, result in missing) \
+            or elapsed > 0.5:
+        return False, f"没有接收方时应直接丢弃: {missing}，耗时 {elapsed:.3f}s"
+
+    # 主机名不解析（避免每次调用阻塞在 DNS 上），报告配置错误
+    (_, named), = stats_sinks.publish(records, [{"type": "statsd", "host": "statsd.invalid", "port": 8125}])
+    if not isinstance(named, ValueError):
+        return False, f"StatsD 的 host 为主机名时应报告配置错误: {named}"
+    return True, f"{len(lines)} 个计数，{len(packets)} 个数据包，{len(results)} 个 sink 均送达"
+
+
+def check_weighted_sampling(stats_dir):
+    """按会话采样是确定性的且整组保留，加权聚合与运行计数按权重放大，估计值落在报告的误差范围内"""
+    import random
+    import stats_counters
+    import stats_sampling
+
+    date_str = "2026-01-25"
+    records = []
+    for i in range(4000):
+        record = make_record(i, date_str)
+        record['session_id'] = f"sampled-{i % 300}"
+        record['additions'] = i % 11 + i % 300 // 30
+        record['net_change'] = record['additions'] - record['deletions']
+        records.append(record)
+    truth = view_stats.aggregate_by_date(date_str, records)
+    if 'errors' in truth:
+        return False, "未采样的数据不应有误差范围"
+
+    sampling = stats_sampling.parse_sampling({"mode": "session", "one_in": 4})
+    sampled = [r for r in (stats_sampling.sample_record(dict(r), *sampling) for r in records) if r]
+    kept = {r['session_id'] for r in sampled}
+    if any((r['session_id'] in kept) != stats_sampling.session_kept(r['session_id'], 4) for r in records):
+        return False, "同一会话的采样结果不一致"
+    if len(sampled) != sum(1 for r in records if r['session_id'] in kept):
+        return False, "保留的会话记录不完整"
+
+    path = write_records(stats_dir, sampled, date_str)
+    summary = view_stats.aggregate_by_date(date_str, view_stats.read_stats_file(date_str))
+    if summary['total_operations'] != 4 * len(sampled) or summary['sampled'] != len(sampled):
+        return False, f"加权操作数不正确: {summary['total_operations']}"
+    for field, key in (('operations', 'total_operations'), ('additions', 'total_additions')):
+        if abs(summary[key] - truth[key]) > summary['errors'][field]:
+            return False, f"{field} 估计 {summary[key]} 超出误差范围 ±{summary['errors'][field]}（实际 {truth[key]}）"
+
+    stats_counters.sync(path)
+    day = next(view_stats.iter_counter_rows('day', date_str))
+    if (day['operations'], day['additions']) != (summary['total_operations'], summary['total_additions']):
+        return False, "运行计数未按权重计入"
+
+    random.seed(44)
+    sampled = [r for r in (stats_sampling.sample_record(dict(r), 'record', 10) for r in records) if r]
+    estimate = view_stats.aggregate_by_date(date_str, sampled)
+    if abs(estimate['total_additions'] - truth['total_additions']) > estimate['errors']['additions']:
+        return False, "按记录采样的估计超出误差范围"
+
+    # CSV 导出保留权重和采样模式，可据此重新加权
+    import csv
+    import io
+    out = io.StringIO()
+    view_stats.write_rows(sampled, 'csv', view_stats.RECORD_ROW_FIELDS, out)
+    exported = list(csv.DictReader(io.StringIO(out.getvalue())))
+    if [int(r['weight']) for r in exported] != [r['weight'] for r in sampled] \
+            or {r['sampling'] for r in exported} != {'record'}:
+        return False, "CSV 导出丢失了权重或采样模式"
+
+    # 各解析后端对非法的 weight 一致抛出 ValueError（读取工具据此跳过该行）
+    for weight in (0, None, "3", True, 1.5):
+        line = stats_codec.dumps({**records[0], 'weight': weight}).encode('utf-8')
+        for backend in stats_codec.available_backends():
+            try:
+                backend.decode_record(line)
+            except ValueError:
+                continue
+            return False, f"weight 为 {weight!r} 的记录应校验失败（{backend.name}）"
+    return True, (f"会话采样 {len(kept)}/300，新增行估计 {summary['total_additions']} ±{summary['errors']['additions']}"
+                  f"（实际 {truth['total_additions']}）")
+
+
+def check_churn_fingerprints(stats_dir):
+    """删除后又写回的行计为重复写入，未改动的上下文和短行不计；指纹数和文件数按最久未用淘汰"""
+    import stats_churn
+
+    store = stats_churn.FingerprintStore(stats_dir, max_files=4, max_lines=64)
+    source = "/project/app.py"
+    body = "".join(f"    value_{i} = compute({i})\n" for i in range(10))
+    if store.observe(source, "", "def main():\n" + body + "}\n") != 0:
+        return False, "首次写入不应计为重复写入"
+
+    # 删除两行，其余行作为上下文保留
+    kept = "".join(f"    value_{i} = compute({i})\n" for i in range(2, 10))
+    if store.observe(source, body, kept) != 0:
+        return False, "只删除行不应计为重复写入"
+    # 把删掉的行写回来，并新增一行；未改动的上下文和短行（"}"）不计
+    rewritten = "    value_0 = compute(0)\n    value_1 = compute(1)\n    extra = 1\n"
+    churn = store.observe(source, kept + "}\n", rewritten + kept + "}\n")
+    if churn != 2:
+        return False, f"写回的两行应计为重复写入，实际 {churn}"
+    if store.observe("/project/other.py", "", body) != 0:
+        return False, "不同文件的指纹应相互独立"
+
+    # 每个文件最多保留 max_lines 个指纹，最旧的先淘汰
+    store.observe(source, "", "".join(f"line number {i}\n" for i in range(100)))
+    fingerprints = store.load(source)
+    if len(fingerprints) != 64 or stats_churn.line_hashes("line number 99")[0] not in fingerprints \
+            or stats_churn.line_hashes("line number 0")[0] in fingerprints:
+        return False, "单个文件的指纹未按最久未用淘汰"
+
+    for i in range(6):
+        path = store.path_for(f"/project/module_{i}.py")
+        store.observe(f"/project/module_{i}.py", "", body)
+        os.utime(path, ns=(i * 10**9, i * 10**9))
+    remaining = sorted(p.name for p in store.dir.glob("*.fp"))
+    if len(remaining) > 4 or store.path_for("/project/module_5.py").name not in remaining:
+        return False, f"指纹文件数超出上限或淘汰了最新的文件: {len(remaining)}"
+
+    records = [make_record(i) for i in range(1, 5)]
+    records[0]['churn'] = 3
+    records[1]['churn'] = 2
+    if view_stats.aggregate_by_date(DATE, records)['churn'] != 5:
+        return False, "日期汇总中的重复写入行数不正确"
+    return True, f"重复写入 {churn} 行，单文件保留 {len(fingerprints)} 个指纹，指纹文件 {len(remaining)} 个"
+
+
+def check_retention_rollups(stats_dir):
+    """按策略汇总旧日期后各维度的合计不变，归档日期一并替换，空间减少且重复执行不再修改"""
+    from datetime import date
+    import retention_stats
+
+    retention_dir = Path(stats_dir) / "retention"
+    retention_dir.mkdir()
+    days = {"2026-01-10": 'day', "2026-01-25": 'hour', "2026-02-20": 'raw'}
+    for date_str in days:
+        records = [make_record(i, date_str) for i in range(1200)]
+        records[5]['churn'] = 4
+        records[7].update(weight=3, sampling='record')
+        write_records(retention_dir, records, date_str)
+    stats_archive.archive_day(retention_dir / "2026-01-25.jsonl", block_size=4096)
+
+    def totals():
+        result = {}
+        for date_str in days:
+            records = list(view_stats.iter_stats_file(date_str, stats_dir=retention_dir))
+            summary = view_stats.aggregate_by_date(date_str, records)
+            result[date_str] = (
+                {k: summary[k] for k in ('total_operations', 'total_additions', 'total_deletions', 'churn')},
+                view_stats.aggregate_by_user(records),
+                view_stats.aggregate_by_session(records),
+            )
+        return result
+
+    expected = totals()
+    results = retention_stats.apply_policy(retention_dir, 30, 40, today=date(2026, 3, 1))
+    if [(r[0], r[1]) for r in results] != [("2026-01-10", 'day'), ("2026-01-25", 'hour')]:
+        return False, f"汇总的日期或粒度不正确: {[(r[0], r[1]) for r in results]}"
+    if totals() != expected:
+        return False, "汇总后的日期、用户或会话合计与汇总前不一致"
+    if list(retention_dir.glob("*.jsonl.gz*")):
+        return False, "汇总后归档文件应被删除"
+    if any(r[5] >= r[4] for r in results):
+        return False, "汇总后文件没有变小"
+    if {retention_stats.day_level(d, retention_dir) for d in days} != {'day', 'hour', 'raw'}:
+        return False, "日期文件的粒度不正确"
+    if retention_stats.apply_policy(retention_dir, 30, 40, today=date(2026, 3, 1)):
+        return False, "重复执行不应再修改文件"
+
+    # 按小时的汇总到期后继续汇总为按天
+    later = retention_stats.apply_policy(retention_dir, 30, 40, today=date(2026, 3, 10))
+    if [(r[0], r[1]) for r in later] != [("2026-01-25", 'day')] or totals() != expected:
+        return False, "按小时汇总再按天汇总后合计不一致"
+    before, after = sum(r[4] for r in results), sum(r[5] for r in results)
+
+    # 汇总持有日期文件的锁：等锁期间追加的记录包含在汇总结果中，不会在替换时丢失
+    import threading
+    import post_stat
+    locked_path = retention_dir / "2026-02-20.jsonl"
+    late = dict(make_record(0, "2026-02-20"), additions=1000, net_change=1000)
+    with open(locked_path, 'a', encoding='utf-8') as f:
+        post_stat.lock_file(f)
+        worker = threading.Thread(target=retention_stats.rollup_day, args=("2026-02-20", retention_dir, 'day'))
+        worker.start()
+        worker.join(0.3)
+        blocked = worker.is_alive()
+        f.write(stats_codec.dumps(late) + '\n')
+        f.flush()
+        post_stat.unlock_file(f)
+    worker.join()
+    rolled = list(view_stats.iter_stats_file("2026-02-20", stats_dir=retention_dir))
+    if not blocked or sum(r['additions'] for r in rolled) != expected["2026-02-20"][0]['total_additions'] + 1000:
+        return False, "汇总应等待日期文件的锁，并包含等锁期间追加的记录"
+
+    # CSV 导出保留汇总行的操作数和粒度
+    import csv
+    import io
+    out = io.StringIO()
+    view_stats.write_rows(rolled, 'csv', view_stats.RECORD_ROW_FIELDS, out)
+    exported = list(csv.DictReader(io.StringIO(out.getvalue())))
+    operations = view_stats.aggregate_by_date("2026-02-20", rolled)['total_operations']
+    if sum(int(r['operations']) for r in exported) != operations or {r['rollup'] for r in exported} != {'day'}:
+        return False, "CSV 导出丢失了汇总行的操作数或粒度"
+    return True, f"汇总 {len(results)} 天：{before} -> {after} 字节，{later[0][3]} 行按天汇总"
+
+
+def check_query_api(stats_dir):
+    """查询 API 的分组结果与逐条计算一致，并为各日期选择运行计数、会话索引或汇总行"""
+    from datetime import date
+    import retention_stats
+    from stats_api import Stats
+
+    query_dir = Path(stats_dir) / "query"
+    query_dir.mkdir()
+    days = ("2026-01-05", "2026-03-02", "2026-03-03")
+    records = []
+    for date_str in days:
+        day_records = [make_record(i, date_str) for i in range(300)]
+        day_records[9].update(weight=5, sampling='record')
+        write_records(query_dir, day_records, date_str)
+        records += day_records
+    retention_stats.apply_policy(query_dir, 30, 365, today=date(2026, 3, 3))
+
+    def expected(keys, match=lambda r: True):
+        groups = {}
+        for r in filter(match, records):
+            key = tuple(r['timestamp'][:13] if k == 'hour' else r['timestamp'][:10] if k == 'date'
+                        else str(r[view_stats.GROUP_KEYS[k][0]]) for k in keys)
+            w = r.get('weight', 1)
+            row = groups.setdefault(key, [0, 0, 0])
+            row[0] += w
+            row[1] += w * r['additions']
+            row[2] += w * r['deletions']
+        return groups
+
+    stats = Stats.open(query_dir)
+    actual = {(row['tool'], row['hour']): [row['operations'], row['additions'], row['deletions']]
+              for row in stats.group_by('tool', 'hour').agg('operations', 'additions', 'deletions')}
+    if actual != expected(('tool', 'hour')):
+        return False, "按工具和小时分组的结果不一致"
+
+    by_date = stats.group_by('date').agg('operations', 'additions', 'deletions')
+    sources = [source for _, source, _ in by_date.plan()]
+    if sources != ['counters'] * len(days):
+        return False, f"只需计数时应读取运行计数: {sources}"
+    sources = [source for _, source, _ in by_date.agg('operations', 'first_time').plan()]
+    if sources != ['rollup', 'scan', 'scan']:
+        return False, f"按日期分组的数据来源不正确: {sources}"
+    if {(row['date'],): [row['operations'], row['additions'], row['deletions']] for row in by_date} \
+            != expected(('date',)):
+        return False, "按日期分组的结果不一致"
+
+    session = stats.range("2026-03-01").filter(session='session-1')
+    if {source for _, source, _ in session.group_by('date').plan()} != {'index'}:
+        return False, "按会话过滤时应使用会话索引"
+    in_range = [r for r in records if r['timestamp'] >= "2026-03-01" and r['session_id'] == 'session-1']
+    if list(session.records()) != in_range:
+        return False, "按会话读取的原始记录不一致"
+    if session.total()['operations'] != sum(r.get('weight', 1) for r in in_range):
+        return False, "会话合计不正确"
+
+    # 单维度、无过滤的 --group-by 逐条流式聚合，--explain 说明实际执行的路径而不是查询 API 的计划
+    original_dir = view_stats.STATS_DIR
+    view_stats.STATS_DIR = query_dir
+    try:
+        streaming = view_stats.explain_groups(('session',)).splitlines()
+        planned = view_stats.explain_groups(('session',), filters={'user': 'user1@example.com'})
+    finally:
+        view_stats.STATS_DIR = original_dir
+    if len(streaming) != len(days) or not all("流式聚合" in line for line in streaming) \
+            or "流式聚合" in planned:
+        return False, f"--explain 与实际执行的分组路径不一致: {streaming}"
+
+    user_total = stats.filter(user='user1@example.com').total()
+    if user_total['additions'] != expected(('user',))[('user1@example.com',)][1]:
+        return False, "按用户过滤的合计不正确"
+    try:
+        stats.group_by('weekday')
+        return False, "未知的分组维度应抛出 ValueError"
+    except ValueError:
+        pass
+    return True, f"{len(actual)} 个工具 × 小时分组，执行计划 {sources}"
+
+
+def check_git_reconcile(stats_dir):
+    """按邮箱和时间把提交匹配到会话，核对行数；解析过的提交按 SHA 缓存，重复运行不再调用 --numstat"""
+    import subprocess
+    import reconcile_stats
+
+    if shutil.which('git') is None:
+        return True, "未安装 git，跳过"
+
+    reconcile_dir = Path(stats_dir) / "reconcile"
+    repo = reconcile_dir / "repo"
+    repo.mkdir(parents=True)
+
+    def git(*args, when=None):
+        env = dict(os.environ, GIT_AUTHOR_NAME="dev", GIT_AUTHOR_EMAIL="Dev@Example.com",
+                   GIT_COMMITTER_NAME="dev", GIT_COMMITTER_EMAIL="dev@example.com")
+        if when:
+            env.update(GIT_AUTHOR_DATE=when, GIT_COMMITTER_DATE=when)
+        subprocess.run(['git', '-C', str(repo)] + list(args), env=env, check=True, capture_output=True)
+
+    git('init', '-q')
+    for i, lines in enumerate((5, 10, 15), 1):
+        (repo / f"f{i}.txt").write_text(''.join(f"{n}\n" for n in range(lines)))
+        git('add', '.')
+        git('commit', '-qm', f"c{i}", when=f"2026-02-10T10:0{i}:00+08:00")
+    git('commit', '-q', '--allow-empty', '-m', "manual", when="2026-02-10T18:00:00+08:00")
+
+    records = [
+        dict(make_record(0, "2026-02-10"), timestamp="2026-02-10T09:50:00+08:00", session_id="agent",
+             email="dev@example.com", additions=20, deletions=0, net_change=20),
+        dict(make_record(1, "2026-02-10"), timestamp="2026-02-10T10:00:00+08:00", session_id="agent",
+             email="dev@example.com", additions=4, deletions=2, net_change=2, weight=3, sampling='record'),
+        dict(make_record(2, "2026-02-10"), timestamp="2026-02-10T13:00:00+08:00", session_id="other",
+             email="dev@example.com", additions=7, deletions=1, net_change=6),
+    ]
+    write_records(reconcile_dir, records, "2026-02-10")
+
+    rows, commits, parsed, calls = reconcile_stats.run(repo, reconcile_dir, batch_size=2)
+    expected = {'sessions': 2, 'matched_sessions': 1, 'commits': 3, 'hook_additions': 32, 'hook_deletions': 6,
+                'git_additions': 30, 'git_deletions': 0, 'diff_additions': -2, 'unmatched_commits': 1}
+    if len(rows) != 1 or any(rows[0][k] != v for k, v in expected.items()):
+        return False, f"核对结果不正确: {rows}"
+    if (commits, parsed, calls) != (4, 4, 2):
+        return False, f"应分 2 批解析 4 个提交，实际 {parsed} 个、{calls} 次"
+
+    again, _, parsed, calls = reconcile_stats.run(repo, reconcile_dir, batch_size=2)
+    if again != rows or (parsed, calls) != (0, 0):
+        return False, f"重复运行应全部来自缓存，实际解析 {parsed} 个、调用 {calls} 次"
+    return True, f"{commits} 个提交分 2 批解析，3 个匹配到会话，重复运行 0 次 git --numstat"
+
+
+def check_bloom_dedup(stats_dir):
+    """布隆过滤器没有漏判、误判率低；写满或换日时轮换，只保留最近两代"""
+    import stats_dedup
+
+    bloom_dir = Path(stats_dir) / "bloom"
+    bloom_dir.mkdir()
+    keys = [f"id:toolu_{i}" for i in range(3000)]
+    for key in keys:
+        if stats_dedup.check_and_add(bloom_dir, "2026-03-01", key, bits=1 << 16, capacity=1000):
+            return False, f"首次出现的 {key} 被判为重复"
+    paths = stats_dedup.generations(bloom_dir)
+    if [p.name for p in paths] != ["2026-03-01.1.bloom", "2026-03-01.2.bloom"]:
+        return False, f"写满后应轮换并只保留两代: {[p.name for p in paths]}"
+    if not all(stats_dedup.check_and_add(bloom_dir, "2026-03-01", key) for key in keys[1000:]):
+        return False, "最近两代中的调用应判为重复"
+
+    # 换日后前一天最后一代仍可查询
+    if not stats_dedup.check_and_add(bloom_dir, "2026-03-02", keys[-1]):
+        return False, "跨午夜的重试应判为重复"
+    false_positives = sum(stats_dedup.check_and_add(bloom_dir, "2026-03-02", f"id:other_{i}") for i in range(2000))
+    if false_positives > 5:
+        return False, f"误判过多: {false_positives}/2000"
+
+    # 损坏的过滤器文件被丢弃重建
+    current = stats_dedup.generations(bloom_dir)[-1]
+    current.write_bytes(b"broken")
+    if stats_dedup.check_and_add(bloom_dir, "2026-03-02", "id:after-corruption"):
+        return False, "损坏的过滤器不应导致误判"
+    if not stats_dedup.check_and_add(bloom_dir, "2026-03-02", "id:after-corruption"):
+        return False, "重建后的过滤器应正常工作"
+
+    if stats_dedup.call_id({"tool_use_id": "toolu_1"}) != "id:toolu_1":
+        return False, "有 tool_use_id 时应直接使用"
+    if stats_dedup.call_id({"session_id": "s1"}) is not None:
+        return False, "没有 tool_use_id 时不应检查重复"
+    return True, f"3000 个调用轮换到第 3 代，2000 次新调用误判 {false_positives} 次"
+
+
+def check_binary_store(stats_dir):
+    """二进制存储与 JSONL 读取结果一致，hook 写入时增量同步，其他工具修改文件后退回 JSONL"""
+    import stats_binary
+    import stats_counters
+    from stats_api import Stats
+
+    binary_dir = Path(stats_dir) / "binary"
+    binary_dir.mkdir()
+    date_str = "2026-03-10"
+    records = [make_record(i, date_str) for i in range(400)]
+    records[3].update(bytes=120, chars=118, churn=2)
+    records[4].update(weight=7, sampling='session')
+    records[5].update(timestamp=f"{date_str}T10:00:00.250000+08:00", rollup='hour', operations=12)
+    records[6].update(timestamp=f"{date_str}T23:30:00+00:00", email="ユーザー@example.com")
+    stats_file = write_records(binary_dir, records[:300], date_str)
+
+    count, json_size, binary_size = stats_binary.convert_day(binary_dir, date_str)
+    if count != 300 or stats_binary.read_day(binary_dir, date_str) != records[:300]:
+        return False, "转换后读取的记录与 JSONL 不一致"
+
+    # hook 写入：已同步到写入前的位置时只追加这一条
+    for record in records[300:350]:
+        size_before = stats_file.stat().st_size
+        with open(stats_file, 'a', encoding='utf-8') as f:
+            f.write(stats_codec.dumps(record) + '\n')
+        stats_binary.sync(stats_file, record, size_before)
+    # 其他工具追加的行在下次同步时补齐，补齐前不使用存储
+    with open(stats_file, 'a', encoding='utf-8') as f:
+        for record in records[350:]:
+            f.write(stats_codec.dumps(record) + '\n')
+    if stats_binary.read_day(binary_dir, date_str) is not None:
+        return False, "日期文件变化后不应使用落后的存储"
+    stats_binary.sync(stats_file)
+    if stats_binary.read_day(binary_dir, date_str) != records \
+            or stats_binary.record_count(binary_dir, date_str) != len(records):
+        return False, "增量同步后的记录不一致"
+
+    stats = Stats.open(binary_dir)
+    query = stats.filter(user='user1@example.com').group_by('tool', 'hour')\
+        .agg('operations', 'additions', 'net_change', 'first_time', 'last_time')
+    if [source for _, source, _ in query.plan()] != ['binary']:
+        return False, f"存储一致时应读取二进制存储: {query.plan()}"
+    expected = list(query)
+    (binary_dir / ".binary").rename(binary_dir / ".binary-off")
+    if list(query) != expected:
+        return False, "二进制存储上的聚合与扫描结果不一致"
+    (binary_dir / ".binary-off").rename(binary_dir / ".binary")
+
+    # 整个文件被替换（inode 变化）后重建
+    write_records(binary_dir, records[:10], date_str)
+    if stats_binary.read_day(binary_dir, date_str) is not None:
+        return False, "文件被替换后不应使用旧存储"
+    stats_binary.sync(stats_file)
+    if stats_binary.read_day(binary_dir, date_str) != records[:10]:
+        return False, "文件被替换后应重建存储"
+
+    # 残行后拼接的记录：存储与读取 JSONL 一样找回
+    with open(stats_file, 'a', encoding='utf-8') as f:
+        f.write(stats_codec.dumps(records[10])[:40])
+        f.write(stats_codec.dumps(records[11]) + '\n')
+    stats_binary.sync(stats_file)
+    expected = list(view_stats.iter_day_records(stats_file, persist=False))
+    if expected != records[:10] + [records[11]] or stats_binary.read_day(binary_dir, date_str) != expected:
+        return False, "残行后的记录在存储与 JSONL 中不一致"
+
+    # 无法原样还原的记录：存储停在它之前，查看工具读取 JSONL，之后的写入不再重新扫描
+    odd = dict(records[10], model="opus")
+    size_before = stats_file.stat().st_size
+    with open(stats_file, 'a', encoding='utf-8') as f:
+        f.write(stats_codec.dumps(odd) + '\n')
+    try:
+        stats_binary.sync(stats_file, odd, size_before)
+        return False, "未知字段应抛出 ValueError"
+    except ValueError:
+        pass
+    if stats_binary.read_day(binary_dir, date_str) is not None:
+        return False, "有无法编码的记录时不应使用存储"
+    scans = []
+    original_scan = stats_counters._scan
+    stats_counters._scan = lambda *args: scans.append(args) or original_scan(*args)
+    try:
+        for record in records[12:17]:
+            size_before = stats_file.stat().st_size
+            with open(stats_file, 'a', encoding='utf-8') as f:
+                f.write(stats_codec.dumps(record) + '\n')
+            stats_binary.sync(stats_file, record, size_before)
+    finally:
+        stats_counters._scan = original_scan
+    if scans:
+        return False, f"遇到无法编码的记录后不应重复扫描: {len(scans)} 次"
+    try:
+        stats_binary.convert_day(binary_dir, date_str)
+        return False, "转换时应重新尝试并报告无法编码的记录"
+    except ValueError:
+        pass
+    os.replace(write_records(stats_dir, records[:20], date_str), stats_file)
+    stats_binary.sync(stats_file)
+    if stats_binary.read_day(binary_dir, date_str) != records[:20]:
+        return False, "日期文件被替换后应重新同步"
+    return True, f"{count} 条记录 {json_size} -> {binary_size} 字节（{binary_size / json_size:.0%}），增量同步一致"
+
+
+def check_install_snapshots(stats_dir):
+    """增量快照硬链接未变化的旧日期文件、复制今天和有变化的文件，按数量清理，恢复后数据一致"""
+    import contextlib
+    import io
+    import subprocess
+    import install
+
+    install_dir = Path(stats_dir) / "install"
+    log_dir = install_dir / "code-log"
+    (log_dir / ".counters").mkdir(parents=True)
+    today = view_stats.get_today_date().strftime("%Y-%m-%d")
+    write_records(log_dir, [make_record(i, "2026-01-01") for i in range(50)], "2026-01-01")
+    write_records(log_dir, [make_record(i, "2026-01-02") for i in range(50)], "2026-01-02")
+    write_records(log_dir, [make_record(i, today) for i in range(5)], today)
+    (log_dir / ".counters" / f"{today}.bin").write_bytes(b"counters")
+
+    installer = install.Installer(custom_path=str(install_dir), keep_snapshots=2)
+    installer.install_path = install_dir
+    first, linked, copied = installer.snapshot_data()
+    if (linked, copied) != (0, 4):
+        return False, f"第一个快照应全部复制: 硬链接 {linked}，复制 {copied}"
+
+    second, linked, copied = installer.snapshot_data()
+    if (linked, copied) != (2, 2):
+        return False, f"未变化的旧日期应硬链接: 硬链接 {linked}，复制 {copied}"
+    if (second / "2026-01-01.jsonl").stat().st_ino != (first / "2026-01-01.jsonl").stat().st_ino \
+            or (second / f"{today}.jsonl").stat().st_ino == (first / f"{today}.jsonl").stat().st_ino:
+        return False, "只有今天之前的日期文件应与上一个快照共用 inode"
+
+    # 旧日期被修改（如回填）后复制新内容；超出保留数量的快照被清理
+    with open(log_dir / "2026-01-02.jsonl", 'a', encoding='utf-8') as f:
+        f.write(stats_codec.dumps(make_record(50, "2026-01-02")) + '\n')
+    third, linked, copied = installer.snapshot_data()
+    if (linked, copied) != (1, 3):
+        return False, f"有变化的旧日期应复制: 硬链接 {linked}，复制 {copied}"
+    if installer.list_snapshots() != [second, third] or first.exists():
+        return False, f"应只保留最近 2 个快照: {[p.name for p in installer.list_snapshots()]}"
+    if (third / "2026-01-01.jsonl").read_bytes() != (log_dir / "2026-01-01.jsonl").read_bytes():
+        return False, "硬链接的快照内容不一致"
+
+    # 恢复：先为当前数据建快照，恢复内容与所选快照一致，最后仍只保留 2 个
+    expected = {p.relative_to(second): p.read_bytes() for p in second.rglob('*') if p.is_file()}
+    (log_dir / "2026-01-01.jsonl").unlink()
+    with contextlib.redirect_stdout(io.StringIO()):
+        installer.restore(second.name)
+    restored = {p.relative_to(log_dir): p.read_bytes() for p in log_dir.rglob('*') if p.is_file()}
+    if restored != expected:
+        return False, "恢复后的数据与快照不一致"
+    snapshots = installer.list_snapshots()
+    if len(snapshots) != 2 or (snapshots[-1] / "2026-01-01.jsonl").exists():
+        return False, f"恢复前应为当前数据创建快照并只保留 2 个: {[p.name for p in snapshots]}"
+
+    result = subprocess.run([sys.executable, str(HOOKS_DIR / "install.py"), "update", "--keep", "0"],
+                            capture_output=True, text=True)
+    if result.returncode != 2:
+        return False, "--keep 0 应被拒绝"
+    return True, "硬链接 2 个未变化文件，保留 2 个快照，恢复往返一致"
+
+
+TESTS = [
+    ("归档往返读取", check_archive_roundtrip),
+    ("归档范围查询", check_archive_range_query),
+    ("内存映射扫描", check_mapped_scanning),
+    ("指标导出服务", check_metrics_exporter),
+    ("多来源合并去重", check_merge_dedup),
+    ("损坏行容错读取", check_corrupt_lines),
+    ("会话索引", check_session_index),
+    ("Top-K 排行", check_top_k),
+    ("溢出到磁盘的分组聚合", check_spill_aggregate),
+    ("从会话记录回填", check_backfill),
+    ("数据快照", check_install_snapshots),
+    ("运行计数与预算", check_running_counters),
+    ("指标推送", check_metric_sinks),
+    ("加权采样", check_weighted_sampling),
+    ("重复写入检测", check_churn_fingerprints),
+    ("保留策略汇总", check_retention_rollups),
+    ("查询 API", check_query_api),
+    ("git 历史核对", check_git_reconcile),
+    ("重复调用抑制", check_bloom_dedup),
+    ("二进制记录存储", check_binary_store),
+]
+
+
+def main():
+    """主测试函数"""
+    print_header("view_stats.py 测试套件")
+
+    import platform
+    if platform.system() == 'Windows':
+        Color.disable()
+
+    print(f"🕐 测试时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+
+    stats_dir = Path(tempfile.mkdtemp(prefix="claude-stats-test-"))
+    view_stats.STATS_DIR = stats_dir
+    print(f"📁 临时统计目录: {stats_dir}")
+
+    tests_passed = 0
+    tests_failed = 0
+
+    try:
+        for test_num, (description, test_func) in enumerate(TESTS, 1):
+            print_test(test_num, description)
+            try:
+                success, message = test_func(stats_dir)
+            except Exception as e:
+                success, message = False, f"异常: {e}"
+
+            if success:
+                print_success(f"{description}测试通过: {message}")
+                tests_passed += 1
+            else:
+                print_error(f"{description}测试失败: {message}")
+                tests_failed += 1
+    finally:
+        shutil.rmtree(stats_dir, ignore_errors=True)
+
+    print_header("测试总结")
+    print(f"📊 总测试数: {tests_passed + tests_failed}")
+    print(f"{Color.GREEN}✓ 通过: {tests_passed}{Color.RESET}")
+    print(f"{Color.RED}✗ 失败: {tests_failed}{Color.RESET}")
+
+    if tests_failed == 0:
+        print(f"\n{Color.GREEN}{Color.BOLD}🎉 所有测试通过！{Color.RESET}")
+        return 0
+    print(f"\n{Color.RED}{Color.BOLD}❌ 有 {tests_failed} 个测试失败{Color.RESET}")
+    return 1
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    except KeyboardInterrupt:
+        print(f"\n\n{Color.YELLOW}测试被用户中断{Color.RESET}")
+        sys.exit(130)
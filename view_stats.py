@@ -4,16 +4,44 @@
 提供便捷的方式查看和分析 stats hook 收集的数据。
 """
 
-import json
+import heapq
+import math
+import mmap
+import os
 import sys
 from pathlib import Path
 from datetime import datetime, timezone, timedelta
 from collections import defaultdict
 
+import stats_binary
+import stats_codec
+import stats_counters
+import stats_archive
+import stats_spill
+
 # 路径配置
 SCRIPT_DIR = Path(__file__).resolve().parent
 STATS_DIR = SCRIPT_DIR / "code-log"
 
+# 原始文件超过该大小时按行边界切块，交给多个进程并行解析
+PARALLEL_MIN_BYTES = 64 * 1024 * 1024
+
+# 可选的内容指标字段（字节、字符、空行、注释行的净变化），旧记录按 0 计
+CONTENT_FIELDS = stats_codec.CONTENT_FIELDS
+
+# 分组聚合的默认内存预算（MB），分组数超出后溢出到磁盘
+DEFAULT_MEMORY_BUDGET_MB = 512
+
+# 统计换行符时每次处理的字节数
+COUNT_CHUNK_BYTES = 4 * 1024 * 1024
+
+# 各原始文件已校验位置的记录目录（每个日期文件一份），以及损坏行的隔离目录（以 . 开头，不会被当作日期文件）
+VALIDATION_DIR_NAME = ".validated"
+QUARANTINE_DIR_NAME = ".quarantine"
+
+# 每条记录的起始字节，用于在损坏的行中找回拼接在后面的完整记录
+RECORD_START = b'{"timestamp"'
+
 
 def get_today_date():
     """获取今天的日期（东八区）"""
@@ -21,97 +49,543 @@ def get_today_date():
     return datetime.now(beijing_tz).date()
 
 
-def list_available_dates():
-    """列出所有可用的统计日期"""
-    if not STATS_DIR.exists():
+def list_available_dates(stats_dir=None):
+    """列出所有可用的统计日期（默认读取 STATS_DIR）"""
+    stats_dir = Path(stats_dir) if stats_dir else STATS_DIR
+    if not stats_dir.exists():
         return []
 
-    dates = []
-    for file in STATS_DIR.glob("*.jsonl"):
+    dates = set()
+    # 同时匹配原始文件（.jsonl）和归档文件（.jsonl.gz / .jsonl.zst）
+    for file in stats_dir.glob("*.jsonl*"):
         try:
-            date_str = file.stem  # 获取文件名（不含扩展名）
+            date_str = file.name.split('.', 1)[0]  # 获取日期部分
             date_obj = datetime.strptime(date_str, "%Y-%m-%d").date()
-            dates.append(date_str)
+            dates.add(date_str)
         except ValueError:
             continue
 
     return sorted(dates)
 
 
-def read_stats_file(date_str):
-    """读取指定日期的统计文件"""
-    file_path = STATS_DIR / f"{date_str}.jsonl"
+def in_time_range(record, start=None, end=None):
+    """判断记录时间戳是否位于 [start, end) 内（同时区 ISO 字符串可直接比较）"""
+    timestamp = record.get('timestamp', '')
+    if start is not None and timestamp < start:
+        return False
+    if end is not None and timestamp >= end:
+        return False
+    return True
+
+
+class MappedStatsFile:
+    """
+    原始 JSONL 日文件的只读内存映射。
+    使用 mmap.find / rfind 定位行边界，以 (start, end) 字节区间表示一行，
+    通过 view() 向解析器提供零拷贝的 memoryview 切片。
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._file = open(self.path, 'rb')
+        stat = os.fstat(self._file.fileno())
+        self.size = stat.st_size
+        self.ino = stat.st_ino
+        # 空文件无法映射
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+        self._view = memoryview(self._mm) if self._mm is not None else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        """释放映射（调用前需释放所有 view() 返回的切片）"""
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        self._file.close()
+
+    def view(self, start, end):
+        """返回 [start, end) 的零拷贝切片"""
+        return self._view[start:end]
+
+    def count_lines(self):
+        """统计行数：换行符个数，加上末尾缺少换行符的残行（hook 写入的文件不含空行）"""
+        if self._mm is None:
+            return 0
+        count = 0
+        for offset in range(0, self.size, COUNT_CHUNK_BYTES):
+            count += self._mm[offset:offset + COUNT_CHUNK_BYTES].count(b'\n')
+        if self._mm[self.size - 1] != ord('\n'):
+            count += 1
+        return count
+
+    def line_spans(self, start=0, end=None):
+        """产出 [start, end) 内每个非空行的 (行首, 行尾) 区间（不含换行符）"""
+        if self._mm is None:
+            return
+        end = self.size if end is None else end
+        find = self._mm.find
+        pos = start
+        while pos < end:
+            newline = find(b'\n', pos, end)
+            line_end = end if newline == -1 else newline
+            if line_end > pos:
+                yield pos, line_end
+            pos = line_end + 1
+
+    def tail_spans(self, n):
+        """从文件末尾用 rfind 向前定位最后 n 个非空行，按文件顺序返回区间"""
+        spans = []
+        if self._mm is None or n <= 0:
+            return spans
+        rfind = self._mm.rfind
+        line_end = self.size
+        while line_end > 0 and len(spans) < n:
+            newline = rfind(b'\n', 0, line_end)
+            line_start = newline + 1
+            if line_end > line_start:
+                spans.append((line_start, line_end))
+            if newline == -1:
+                break
+            line_end = newline
+        spans.reverse()
+        return spans
+
+    def split(self, parts):
+        """把文件切成最多 parts 个按行边界对齐的 (start, end) 区间，用于并行解析"""
+        if self._mm is None:
+            return []
+        chunk_size = max(1, self.size // max(1, parts))
+        chunks = []
+        start = 0
+        while start < self.size:
+            newline = self._mm.find(b'\n', min(start + chunk_size, self.size) - 1)
+            end = self.size if newline == -1 else newline + 1
+            chunks.append((start, end))
+            start = end
+        return chunks
+
+    def decode_line(self, start, end):
+        """校验并解析一行，不符合记录结构时返回 None"""
+        with self.view(start, end) as line:
+            try:
+                return stats_codec.decode_record(line)
+            except ValueError:
+                return None
+
+    def read_bytes(self, start, end):
+        """复制 [start, end) 的原始字节"""
+        return self._mm[start:end]
+
+    def complete_size(self):
+        """最后一个换行符之后的位置，即完整行的总字节数"""
+        if self._mm is None:
+            return 0
+        return self._mm.rfind(b'\n') + 1
+
+    def decode_spans(self, spans):
+        """解析给定区间的记录，跳过损坏的行；每个切片解析后立即释放"""
+        records = []
+        for start, end in spans:
+            record = self.decode_line(start, end)
+            if record is not None:
+                records.append(record)
+        return records
+
+
+def salvage_record(raw):
+    """
+    从损坏的行中找回拼接在残行后面的完整记录。
+    写入中途崩溃会留下没有换行符的残行，下一条记录紧接其后，两者成为同一行。
+    """
+    pos = raw.rfind(RECORD_START)
+    if pos <= 0:
+        return None
+    try:
+        return stats_codec.decode_record(raw[pos:])
+    except ValueError:
+        return None
 
-    if not file_path.exists():
+
+def scan_spans(mapped, start=0, end=None, validated=0, known_bad=(), bad=None):
+    """
+    逐行容错解析 [start, end) 内的记录。
+    validated 之前的内容已经校验过，只做解析并跳过已知的损坏行；
+    之后的每一行都完整校验，损坏的行记入 bad（行首偏移, 原始字节）后跳过，从下一个换行符继续。
+    末尾没有换行符的残行可能仍在写入，只跳过，不算损坏。
+    """
+    for line_start, line_end in mapped.line_spans(start, end):
+        if line_start < validated:
+            if line_start in known_bad:
+                record = salvage_record(mapped.read_bytes(line_start, line_end))
+            else:
+                with mapped.view(line_start, line_end) as line:
+                    try:
+                        record = stats_codec.loads(line)
+                    except ValueError:
+                        record = None
+        else:
+            record = mapped.decode_line(line_start, line_end)
+            if record is None:
+                if line_end == mapped.size:
+                    continue
+                raw = mapped.read_bytes(line_start, line_end)
+                if bad is not None:
+                    bad.append((line_start, raw))
+                record = salvage_record(raw)
+        if record is not None:
+            yield record
+
+
+# 本进程中各原始文件的已校验位置（绝对路径 -> 状态），同一文件再次读取时不必重新载入
+_validation_cache = {}
+
+
+def validation_state_path(file_path):
+    """某个原始文件的已校验位置记录文件"""
+    file_path = Path(file_path)
+    return file_path.parent / VALIDATION_DIR_NAME / f"{file_path.name}.json"
+
+
+def load_validation_entry(file_path):
+    """读取原始文件的已校验位置：{'offset', 'ino', 'bad'}，没有记录时返回 None"""
+    key = str(Path(file_path).absolute())
+    if key not in _validation_cache:
+        try:
+            with open(validation_state_path(file_path), 'rb') as f:
+                entry = stats_codec.loads(f.read())
+        except (OSError, ValueError):
+            entry = None
+        _validation_cache[key] = entry if isinstance(entry, dict) else None
+    return _validation_cache[key]
+
+
+def validated_prefix(entry, mapped):
+    """
+    返回 (已校验位置, 已知损坏行的偏移集合)。
+    文件被替换（inode 变化）、截断，或该位置不在行边界上时从头校验。
+    """
+    if not entry or entry.get('ino') != mapped.ino:
+        return 0, set()
+    offset = entry.get('offset', 0)
+    if offset > mapped.size or (offset and mapped.read_bytes(offset - 1, offset) != b'\n'):
+        return 0, set()
+    return offset, set(entry.get('bad', ()))
+
+
+def quarantine_lines(file_path, bad):
+    """把损坏的行追加到 .quarantine/ 下的同名文件，保留偏移和原始内容，返回隔离文件路径"""
+    quarantine_dir = file_path.parent / QUARANTINE_DIR_NAME
+    quarantine_dir.mkdir(exist_ok=True)
+    quarantine_path = quarantine_dir / file_path.name
+    with open(quarantine_path, 'a', encoding='utf-8') as f:
+        for offset, raw in bad:
+            f.write(stats_codec.dumps({
+                'offset': offset,
+                'data': raw.decode('utf-8', errors='backslashreplace'),
+            }) + '\n')
+    return quarantine_path
+
+
+def record_validation(file_path, ino, offset, known_bad, bad, persist=True):
+    """
+    记录已校验位置，下次读取时跳过这部分的校验；新发现的损坏行在 persist 时隔离到 .quarantine/。
+    persist 为 False（合并等只读的来源目录）或统计目录不可写时只保存在本进程内存中，不写入目录。
+    """
+    file_path = Path(file_path)
+    entry = load_validation_entry(file_path)
+    if not bad and entry and entry.get('ino') == ino and entry.get('offset') == offset:
+        return
+
+    _validation_cache[str(file_path.absolute())] = {
+        'offset': offset,
+        'ino': ino,
+        'bad': sorted(known_bad | {line_start for line_start, _ in bad}),
+    }
+    persist = persist and os.access(file_path.parent, os.W_OK)
+    if bad and not persist:
+        print(f"警告：{file_path} 中有 {len(bad)} 行损坏数据已跳过", file=sys.stderr)
+    if not persist:
+        return
+
+    try:
+        if bad:
+            quarantine_path = quarantine_lines(file_path, bad)
+            print(f"警告：{file_path} 中有 {len(bad)} 行损坏数据已跳过，原始内容已隔离到 {quarantine_path}",
+                  file=sys.stderr)
+
+        state_path = validation_state_path(file_path)
+        state_path.parent.mkdir(exist_ok=True)
+        tmp_path = state_path.with_name(f"{state_path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(stats_codec.dumps(_validation_cache[str(file_path.absolute())]))
+        os.replace(tmp_path, state_path)
+    except OSError:
+        pass
+
+
+def _parse_chunk(path, start, end, validated=0, known_bad=()):
+    """并行解析的工作进程函数：解析文件 [start, end) 区间内的记录，返回 (记录, 损坏行)"""
+    bad = []
+    with MappedStatsFile(path) as mapped:
+        records = list(scan_spans(mapped, start, end, validated, set(known_bad), bad))
+    return records, bad
+
+
+def read_mapped_parallel(file_path, workers=None):
+    """将大文件按行边界切块，在进程池中并行解析，结果按文件顺序合并"""
+    from concurrent.futures import ProcessPoolExecutor
+
+    workers = workers or os.cpu_count() or 1
+    entry = load_validation_entry(file_path)
+    with MappedStatsFile(file_path) as mapped:
+        chunks = mapped.split(workers * 4)
+        validated, known_bad = validated_prefix(entry, mapped)
+        ino = mapped.ino
+        complete = mapped.complete_size()
+
+    records = []
+    bad = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_parse_chunk, str(file_path), start, end, validated, sorted(known_bad))
+                   for start, end in chunks]
+        for future in futures:
+            chunk_records, chunk_bad = future.result()
+            records.extend(chunk_records)
+            bad.extend(chunk_bad)
+
+    record_validation(file_path, ino, complete, known_bad, bad)
+    return records
+
+
+def iter_raw_records(file_path, persist=True):
+    """容错地逐条产出原始日文件的记录，读完后更新已校验位置（persist 为 False 时不写入统计目录）"""
+    entry = load_validation_entry(file_path)
+    bad = []
+    with MappedStatsFile(file_path) as mapped:
+        validated, known_bad = validated_prefix(entry, mapped)
+        yield from scan_spans(mapped, validated=validated, known_bad=known_bad, bad=bad)
+        ino = mapped.ino
+        complete = mapped.complete_size()
+    record_validation(file_path, ino, complete, known_bad, bad, persist)
+
+
+def iter_archive_records(file_path, start=None, end=None):
+    """容错地逐条产出归档文件的记录（只解压时间范围相交的块），跳过损坏的行"""
+    skipped = 0
+    for line in stats_archive.iter_archive_lines(file_path, start, end):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield stats_codec.decode_record(line)
+        except ValueError:
+            record = salvage_record(line)
+            if record is None:
+                skipped += 1
+            else:
+                yield record
+    if skipped:
+        print(f"警告：{file_path} 中有 {skipped} 行损坏数据已跳过", file=sys.stderr)
+
+
+def count_records(date_str):
+    """统计某天的记录数：原始文件用内存映射计数，归档文件读取索引"""
+    file_path = stats_archive.find_day_file(date_str, STATS_DIR)
+    if file_path is None:
+        return 0
+    if stats_archive.archive_codec(file_path):
+        index = stats_archive.read_index(file_path)
+        if index is not None:
+            return index['records']
+        return sum(1 for _ in stats_archive.iter_archive_lines(file_path))
+    count = stats_binary.record_count(STATS_DIR, date_str)
+    if count is not None:
+        return count
+    with MappedStatsFile(file_path) as mapped:
+        return mapped.count_lines()
+
+
+def read_recent_records(date_str, n):
+    """
+    读取某天最后 n 条记录：原始文件用 rfind 只定位并解析末尾的行。
+    末尾有损坏的行时继续向前取行，直到解析出 n 条记录或到达文件开头。
+    """
+    file_path = stats_archive.find_day_file(date_str, STATS_DIR)
+    if file_path is None:
+        return []
+    if stats_archive.archive_codec(file_path):
+        return read_stats_file(date_str)[-n:]
+    with MappedStatsFile(file_path) as mapped:
+        wanted = n
+        while True:
+            spans = mapped.tail_spans(wanted)
+            records = mapped.decode_spans(spans)
+            if len(records) >= n or len(spans) < wanted:
+                return records[-n:] if n > 0 else []
+            wanted += n - len(records)
+
+
+def iter_day_records(file_path, start=None, end=None, persist=True):
+    """逐条产出某天数据文件的记录；归档文件只解压时间范围相交的块"""
+    if stats_archive.archive_codec(file_path):
+        return iter_archive_records(file_path, start, end)
+    return iter_raw_records(file_path, persist)
+
+
+def read_stats_file(date_str, start=None, end=None):
+    """
+    读取指定日期的统计文件。
+    透明支持原始 JSONL 和归档文件；提供 start / end（ISO 时间）时只返回该时间范围内的记录，
+    归档文件只解压范围相交的块。损坏的行会被跳过，不影响其后的记录。
+    有与日期文件一致的二进制存储（stats_binary.py）时直接解码二进制记录。
+    """
+    file_path = stats_archive.find_day_file(date_str, STATS_DIR)
+
+    if file_path is None:
         return []
 
     records = []
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            for line in f:
-                line = line.strip()
-                if line:
-                    records.append(json.loads(line))
-    except Exception as e:
+        binary = None if stats_archive.archive_codec(file_path) else stats_binary.open_day(STATS_DIR, date_str)
+        if binary is not None:
+            records = list(stats_binary.iter_decode(*binary))
+        elif not stats_archive.archive_codec(file_path) and file_path.stat().st_size >= PARALLEL_MIN_BYTES:
+            records = read_mapped_parallel(file_path)
+        else:
+            records = list(iter_day_records(file_path, start, end))
+    except OSError as e:
         print(f"错误：读取文件 {file_path} 失败 - {e}", file=sys.stderr)
 
+    if start is not None or end is not None:
+        records = [r for r in records if in_time_range(r, start, end)]
+
     return records
 
 
+def iter_stats_file(date_str, start=None, end=None, stats_dir=None, persist=True):
+    """
+    流式逐条产出某天的记录，不整体加载到内存（默认读取 STATS_DIR）。
+    persist 为 False 时不在统计目录中保存校验位置和隔离文件（用于只读的来源目录）。
+    """
+    file_path = stats_archive.find_day_file(date_str, stats_dir or STATS_DIR)
+
+    if file_path is None:
+        return
+
+    binary = None if stats_archive.archive_codec(file_path) else stats_binary.open_day(file_path.parent, date_str)
+    try:
+        records = stats_binary.iter_decode(*binary) if binary else iter_day_records(file_path, start, end, persist)
+        for record in records:
+            if in_time_range(record, start, end):
+                yield record
+    except OSError as e:
+        print(f"错误：读取文件 {file_path} 失败 - {e}", file=sys.stderr)
+
+
+def dates_in_range(from_date=None, to_date=None):
+    """返回 [from_date, to_date] 范围内（含两端）有数据的日期"""
+    return [d for d in list_available_dates()
+            if (from_date is None or d >= from_date) and (to_date is None or d <= to_date)]
+
+
+def iter_range_records(from_date=None, to_date=None):
+    """按日期顺序流式产出范围内的所有记录"""
+    for date_str in dates_in_range(from_date, to_date):
+        yield from iter_stats_file(date_str)
+
+
+def parse_time_bound(date_str, value):
+    """将 HH:MM[:SS] 或完整 ISO 时间转换为与记录一致的东八区 ISO 字符串"""
+    if value is None:
+        return None
+    if 'T' in value:
+        return value
+    parts = value.split(':')
+    if len(parts) == 2:
+        parts.append('00')
+    hour, minute, second = (int(p) for p in parts)
+    return f"{date_str}T{hour:02d}:{minute:02d}:{second:02d}+08:00"
+
+
 def aggregate_by_date(date_str, records):
     """按日期聚合统计"""
     if not records:
         return None
 
-    total_additions = sum(r['additions'] for r in records)
-    total_deletions = sum(r['deletions'] for r in records)
-    net_change = sum(r['net_change'] for r in records)
+    # 采样记录按权重放大（未采样的记录权重为 1）；汇总行（retention_stats）自带操作数
+    total_additions = sum(r.get('weight', 1) * r['additions'] for r in records)
+    total_deletions = sum(r.get('weight', 1) * r['deletions'] for r in records)
+    net_change = sum(r.get('weight', 1) * r['net_change'] for r in records)
 
-    return {
+    summary = {
         'date': date_str,
         'total_additions': total_additions,
         'total_deletions': total_deletions,
         'net_change': net_change,
-        'total_operations': len(records),
+        'total_operations': sum(r.get('operations', r.get('weight', 1)) for r in records),
         'first_time': records[0]['timestamp'] if records else None,
         'last_time': records[-1]['timestamp'] if records else None
     }
+    for field in CONTENT_FIELDS:
+        summary[field] = sum(r.get('weight', 1) * r.get(field, 0) for r in records)
+
+    # 有采样记录时附带估计值的 95% 误差范围
+    if any('weight' in r for r in records):
+        import stats_sampling
+        estimate = stats_sampling.ErrorEstimate()
+        for record in records:
+            estimate.add(record)
+        summary['sampled'] = estimate.sampled
+        summary['errors'] = estimate.bounds()
+    return summary
+
+
+def format_errors(errors):
+    """采样估计的 95% 误差范围说明"""
+    return (f"操作 ±{errors['operations']} | 新增 ±{errors['additions']} | "
+            f"删除 ±{errors['deletions']} | 净变化 ±{errors['net_change']}")
 
 
 def aggregate_by_user(records):
     """按用户聚合统计"""
-    user_stats = defaultdict(lambda: {
-        'additions': 0,
-        'deletions': 0,
-        'net_change': 0,
-        'operations': 0
-    })
+    user_stats = defaultdict(lambda: dict.fromkeys(('additions', 'deletions', 'net_change', 'operations')
+                                                 + CONTENT_FIELDS, 0))
 
     for record in records:
         email = record.get('email', 'unknown')
-        user_stats[email]['additions'] += record['additions']
-        user_stats[email]['deletions'] += record['deletions']
-        user_stats[email]['net_change'] += record['net_change']
-        user_stats[email]['operations'] += 1
+        w = record.get('weight', 1)
+        user_stats[email]['additions'] += w * record['additions']
+        user_stats[email]['deletions'] += w * record['deletions']
+        user_stats[email]['net_change'] += w * record['net_change']
+        user_stats[email]['operations'] += record.get('operations', w)
+        for field in CONTENT_FIELDS:
+            user_stats[email][field] += w * record.get(field, 0)
 
     return dict(user_stats)
 
 
 def aggregate_by_tool(records):
     """按工具聚合统计"""
-    tool_stats = defaultdict(lambda: {
-        'additions': 0,
-        'deletions': 0,
-        'net_change': 0,
-        'operations': 0
-    })
+    tool_stats = defaultdict(lambda: dict.fromkeys(('additions', 'deletions', 'net_change', 'operations')
+                                                 + CONTENT_FIELDS, 0))
 
     for record in records:
         tool = record.get('tool', 'Unknown')
-        tool_stats[tool]['additions'] += record['additions']
-        tool_stats[tool]['deletions'] += record['deletions']
-        tool_stats[tool]['net_change'] += record['net_change']
-        tool_stats[tool]['operations'] += 1
+        w = record.get('weight', 1)
+        tool_stats[tool]['additions'] += w * record['additions']
+        tool_stats[tool]['deletions'] += w * record['deletions']
+        tool_stats[tool]['net_change'] += w * record['net_change']
+        tool_stats[tool]['operations'] += record.get('operations', w)
+        for field in CONTENT_FIELDS:
+            tool_stats[tool][field] += w * record.get(field, 0)
 
     return dict(tool_stats)
 
@@ -123,15 +597,19 @@ def aggregate_by_session(records):
         'deletions': 0,
         'net_change': 0,
         'operations': 0,
+        **dict.fromkeys(CONTENT_FIELDS, 0),
         'tools': set()
     })
 
     for record in records:
         session_id = record.get('session_id', 'unknown')
-        session_stats[session_id]['additions'] += record['additions']
-        session_stats[session_id]['deletions'] += record['deletions']
-        session_stats[session_id]['net_change'] += record['net_change']
-        session_stats[session_id]['operations'] += 1
+        w = record.get('weight', 1)
+        session_stats[session_id]['additions'] += w * record['additions']
+        session_stats[session_id]['deletions'] += w * record['deletions']
+        session_stats[session_id]['net_change'] += w * record['net_change']
+        session_stats[session_id]['operations'] += record.get('operations', w)
+        for field in CONTENT_FIELDS:
+            session_stats[session_id][field] += w * record.get(field, 0)
         session_stats[session_id]['tools'].add(record.get('tool', 'Unknown'))
 
     # 转换 set 为 list 以便 JSON 序列化
@@ -142,12 +620,262 @@ def aggregate_by_session(records):
             'deletions': stats['deletions'],
             'net_change': stats['net_change'],
             'operations': stats['operations'],
+            **{field: stats[field] for field in CONTENT_FIELDS},
             'tools': sorted(list(stats['tools']))
         }
 
     return result
 
 
+# 可导出的分组维度：维度名 -> (记录字段, 缺省值)
+GROUP_KEYS = {
+    'user': ('email', 'unknown'),
+    'tool': ('tool', 'Unknown'),
+    'session': ('session_id', 'unknown'),
+}
+
+STAT_FIELDS = ('additions', 'deletions', 'net_change', 'operations') + CONTENT_FIELDS
+DATE_ROW_FIELDS = ('date',) + STAT_FIELDS + ('first_time', 'last_time')
+SUMMARY_ROW_FIELDS = ('group', 'key') + STAT_FIELDS + ('tools',)
+# 逐条记录导出（--dump / --recent / --session）的列，包含采样记录的权重和汇总行的操作数，供重新加权
+RECORD_ROW_FIELDS = stats_codec.RECORD_FIELDS + CONTENT_FIELDS + stats_codec.SAMPLING_FIELDS \
+    + stats_codec.ROLLUP_FIELDS
+
+
+# --group-by 可用的维度（可用逗号组合多个）
+QUERY_GROUP_KEYS = ('date', 'hour') + tuple(GROUP_KEYS)
+
+
+def parse_group_by(value):
+    """解析 --group-by：逗号分隔的维度，如 tool,hour"""
+    keys = tuple(dict.fromkeys(key.strip() for key in value.split(',') if key.strip()))
+    if not keys:
+        raise ValueError("--group-by 至少需要一个维度")
+    for key in keys:
+        if key not in QUERY_GROUP_KEYS:
+            raise ValueError(f"不能按 '{key}' 分组（可用：{'、'.join(QUERY_GROUP_KEYS)}）")
+    return keys
+
+
+def parse_filters(specs):
+    """解析 --filter KEY=VALUE 列表，返回 {维度: 值}"""
+    filters = {}
+    for spec in specs or ():
+        key, sep, value = spec.partition('=')
+        if not sep or key not in GROUP_KEYS:
+            raise ValueError(f"无效的过滤条件 '{spec}'（格式 KEY=VALUE，KEY 可用：{'、'.join(GROUP_KEYS)}）")
+        if filters.get(key, value) != value:
+            raise ValueError(f"'{key}' 有多个不同的过滤条件")
+        filters[key] = value
+    return filters
+
+
+def open_query(from_date=None, to_date=None, filters=None):
+    """日期范围和过滤条件对应的查询（stats_api.Stats），执行时自动选择数据来源"""
+    from stats_api import Stats
+    return Stats(STATS_DIR).range(from_date, to_date).filter(**(filters or {}))
+
+
+def iter_date_rows(from_date=None, to_date=None, filters=None):
+    """日期汇总行（每天一行，按日期排序）"""
+    return iter(open_query(from_date, to_date, filters).group_by('date').agg(*DATE_ROW_FIELDS[1:]))
+
+
+def streams_groups(keys, filters=None):
+    """单个 user / tool / session 维度且没有过滤条件时不经查询 API，逐条读取记录流式聚合"""
+    return len(keys) == 1 and keys[0] in GROUP_KEYS and not filters
+
+
+def iter_query_rows(keys, from_date=None, to_date=None, filters=None, max_keys=None):
+    """
+    按一个或多个维度分组的汇总行。
+    单个 user / tool / session 维度且没有过滤条件时流式聚合（超出 max_keys 时溢出到磁盘），
+    其余组合交给查询 API。
+    """
+    if streams_groups(keys, filters):
+        return iter_group_rows(keys[0], iter_range_records(from_date, to_date), max_keys)
+    if keys == ('date',):
+        return iter_date_rows(from_date, to_date, filters)
+    return iter(open_query(from_date, to_date, filters).group_by(*keys).agg(*STAT_FIELDS))
+
+
+def query_row_fields(keys):
+    """--group-by 结果行的字段顺序"""
+    if len(keys) == 1:
+        return group_row_fields(keys[0])
+    return keys + STAT_FIELDS
+
+
+def iter_aggregate(group, records, max_keys=None):
+    """
+    按 user / tool / session 流式聚合，按键排序产出 (键, 统计)。
+    内存中的分组数超过 max_keys 时按哈希分区溢出到磁盘，结果与内存聚合一致。
+    """
+    field, default = GROUP_KEYS[group]
+    aggregator = stats_spill.SpillingAggregator(field, default, with_tools=(group == 'session'),
+                                                max_keys=max_keys)
+    for record in records:
+        aggregator.add(record)
+    yield from aggregator.results()
+
+
+def iter_group_rows(group, records, max_keys=None):
+    """按 user / tool / session 分组，产出按键排序的汇总行（超出 max_keys 个分组时溢出到磁盘）"""
+    for key, stats in iter_aggregate(group, records, max_keys):
+        row = {group: key}
+        row.update(stats)
+        yield row
+
+
+def group_row_fields(group):
+    """分组行的字段顺序"""
+    if group == 'date':
+        return DATE_ROW_FIELDS
+    if group == 'hour':
+        return (group,) + STAT_FIELDS
+    if group == 'session':
+        return (group,) + STAT_FIELDS + ('tools',)
+    return (group,) + STAT_FIELDS
+
+
+# --top 的 --by 取值 -> 分组维度
+TOP_GROUPS = {'sessions': 'session', 'users': 'user', 'tools': 'tool'}
+
+# 近似模式默认为每个名次保留的计数器数量
+APPROX_CAPACITY_FACTOR = 50
+
+
+def top_k(group, records, n, metric='operations', max_keys=None):
+    """精确 top-K：流式聚合后用大小为 n 的堆选出前 n 名，无需对全部分组排序"""
+    return heapq.nlargest(n, iter_aggregate(group, records, max_keys), key=lambda item: item[1][metric])
+
+
+class SpaceSaving:
+    """
+    Space-Saving 近似 top-K（权重必须非负）。
+    只保留 capacity 个计数器：新键到来且计数器已满时替换计数最小的键，并继承其计数作为误差，
+    每个键的真实值位于 [计数 - 误差, 计数] 之间。内存与分组数无关。
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        # (计数, 键) 最小堆；计数只增不减，每次更新压入新条目，旧条目在弹出时丢弃
+        self._heap = []
+
+    def add(self, key, weight=1):
+        if key in self.counts:
+            self.counts[key] += weight
+        elif len(self.counts) < self.capacity:
+            self.counts[key] = weight
+            self.errors[key] = 0
+        else:
+            min_key, min_count = self._pop_min()
+            del self.counts[min_key]
+            del self.errors[min_key]
+            self.counts[key] = min_count + weight
+            self.errors[key] = min_count
+        heapq.heappush(self._heap, (self.counts[key], key))
+        if len(self._heap) > 4 * self.capacity:
+            self._heap = [(count, k) for k, count in self.counts.items()]
+            heapq.heapify(self._heap)
+
+    def _pop_min(self):
+        """弹出当前计数最小的键"""
+        while True:
+            count, key = heapq.heappop(self._heap)
+            if self.counts.get(key) == count:
+                return key, count
+
+    def top(self, n):
+        """前 n 名：[(键, 计数, 误差)]"""
+        best = heapq.nlargest(n, self.counts.items(), key=lambda item: item[1])
+        return [(key, count, self.errors[key]) for key, count in best]
+
+
+def approx_top_k(group, records, n, metric='operations', capacity=None):
+    """Space-Saving 近似 top-K，返回 [(键, 估计值, 误差)]"""
+    field, default = GROUP_KEYS[group]
+    sketch = SpaceSaving(capacity or n * APPROX_CAPACITY_FACTOR)
+    for record in records:
+        w = record.get('weight', 1)
+        sketch.add(record.get(field, default),
+                   record.get('operations', w) if metric == 'operations' else w * record.get(metric, 0))
+    return sketch.top(n)
+
+
+def iter_top_rows(group, n, metric='operations', from_date=None, to_date=None, approx=False, capacity=None,
+                  max_keys=None):
+    """产出排行榜行（含名次）；近似模式只有排序指标和误差"""
+    records = iter_range_records(from_date, to_date)
+    if approx:
+        for rank, (key, count, error) in enumerate(approx_top_k(group, records, n, metric, capacity), 1):
+            yield {'rank': rank, group: key, metric: count, 'error': error}
+        return
+    for rank, (key, stats) in enumerate(top_k(group, records, n, metric, max_keys), 1):
+        row = {'rank': rank, group: key}
+        row.update(stats)
+        yield row
+
+
+def top_row_fields(group, metric, approx=False):
+    """排行榜行的字段顺序"""
+    if approx:
+        return ('rank', group, metric, 'error')
+    return ('rank',) + group_row_fields(group)
+
+
+def iter_summary_rows(date_str, records):
+    """把单日摘要展开为扁平行：一行日期汇总 + 各用户 / 工具 / 会话行"""
+    summary = aggregate_by_date(date_str, records)
+    if not summary:
+        return
+    yield {
+        'group': 'date', 'key': date_str,
+        'additions': summary['total_additions'],
+        'deletions': summary['total_deletions'],
+        'net_change': summary['net_change'],
+        'operations': summary['total_operations'],
+        **{field: summary[field] for field in CONTENT_FIELDS},
+    }
+    for group in ('user', 'tool', 'session'):
+        for row in iter_group_rows(group, records):
+            flat = {'group': group, 'key': row.pop(group)}
+            flat.update(row)
+            yield flat
+
+
+def write_rows(rows, fmt, fieldnames, out=None):
+    """
+    流式输出字典行，边产生边写出，不整体物化。
+    fmt: json（单个数组）、jsonl（每行一个对象）或 csv（列表字段以 ; 连接）。
+    返回输出的行数。
+    """
+    out = out or sys.stdout
+    count = 0
+
+    if fmt == 'csv':
+        import csv
+        writer = csv.DictWriter(out, fieldnames=fieldnames, extrasaction='ignore', restval='')
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({k: ';'.join(v) if isinstance(v, list) else v for k, v in row.items()})
+            count += 1
+    elif fmt == 'json':
+        out.write('[')
+        for row in rows:
+            out.write(('\n  ' if count == 0 else ',\n  ') + stats_codec.dumps(row))
+            count += 1
+        out.write('\n]\n' if count else ']\n')
+    else:
+        for row in rows:
+            out.write(stats_codec.dumps(row) + '\n')
+            count += 1
+
+    return count
+
+
 def print_header(title):
     """打印标题"""
     print("\n" + "=" * 60)
@@ -155,14 +883,20 @@ def print_header(title):
     print("=" * 60)
 
 
-def show_summary(date_str=None):
-    """显示摘要"""
+def show_summary(date_str=None, start=None, end=None):
+    """显示摘要（可选 start / end 限定当天的时间范围）"""
     if date_str is None:
         date_str = get_today_date().strftime("%Y-%m-%d")
 
-    print_header(f"📊 统计摘要 - {date_str}")
+    start = parse_time_bound(date_str, start)
+    end = parse_time_bound(date_str, end)
+
+    title = f"📊 统计摘要 - {date_str}"
+    if start or end:
+        title += f"（{start or '开始'} 至 {end or '结束'}）"
+    print_header(title)
 
-    records = read_stats_file(date_str)
+    records = read_stats_file(date_str, start, end)
 
     if not records:
         print(f"\n⚠️  {date_str} 没有统计记录")
@@ -177,6 +911,13 @@ def show_summary(date_str=None):
     print(f"📊 净变化：{date_summary['net_change']:+d}")
     print(f"🕐 首次记录：{date_summary['first_time']}")
     print(f"🕐 最后记录：{date_summary['last_time']}")
+    if date_summary.get('errors'):
+        print(f"🎲 采样估计：{date_summary['sampled']} 条采样记录，95% 误差范围 {format_errors(date_summary['errors'])}")
+    if any(date_summary[field] for field in CONTENT_FIELDS):
+        print(f"📝 内容变化：字节 {date_summary['bytes']:+d} | 字符 {date_summary['chars']:+d} | "
+              f"空行 {date_summary['blank_lines']:+d} | 注释行 {date_summary['comment_lines']:+d}")
+    if date_summary['churn']:
+        print(f"🔁 重复写入：{date_summary['churn']} 行此前在同一文件中写入或删除过")
 
     # 按用户统计
     user_stats = aggregate_by_user(records)
@@ -186,6 +927,8 @@ def show_summary(date_str=None):
             print(f"\n用户：{email}")
             print(f"  操作数：{stats['operations']}")
             print(f"  新增：+{stats['additions']} | 删除：-{stats['deletions']} | 净变化：{stats['net_change']:+d}")
+            if stats['churn']:
+                print(f"  重复写入：{stats['churn']} 行")
 
     # 按工具统计
     tool_stats = aggregate_by_tool(records)
@@ -200,21 +943,189 @@ def show_summary(date_str=None):
     session_stats = aggregate_by_session(records)
     if session_stats:
         print_header(f"💬 会话统计（共 {len(session_stats)} 个会话）")
-        for session_id, stats in sorted(session_stats.items(), key=lambda x: x[1]['operations'], reverse=True)[:5]:
+        top_sessions = heapq.nlargest(5, session_stats.items(), key=lambda x: x[1]['operations'])
+        cross_day_sessions = session_summaries([session_id for session_id, _ in top_sessions])
+        for session_id, stats in top_sessions:
             print(f"\nSession：{session_id}")
             print(f"  操作数：{stats['operations']}")
             print(f"  工具：{', '.join(stats['tools'])}")
             print(f"  新增：+{stats['additions']} | 删除：-{stats['deletions']} | 净变化：{stats['net_change']:+d}")
+            combined = cross_day_sessions.get(session_id)
+            if combined:
+                print(f"  跨 {len(combined['days'])} 天合计：操作数 {combined['operations']} | "
+                      f"新增 +{combined['additions']} | 删除 -{combined['deletions']} | "
+                      f"净变化 {combined['net_change']:+d}（--session 查看详情）")
 
         if len(session_stats) > 5:
             print(f"\n... 还有 {len(session_stats) - 5} 个会话")
 
 
-def show_history():
-    """显示历史统计"""
+def session_summaries(session_ids):
+    """
+    从会话索引读取跨越多天的会话的合并汇总：会话 ID -> 汇总。
+    只在索引已建立时使用（由 --session 首次建立），索引不可用时返回空字典。
+    """
+    import session_index
+    import sqlite3
+
+    if not (STATS_DIR / session_index.INDEX_NAME).exists():
+        return {}
+    try:
+        with session_index.open_index(STATS_DIR) as index:
+            summaries = {session_id: index.summary(session_id) for session_id in session_ids}
+    except (sqlite3.Error, OSError):
+        return {}
+    return {session_id: summary for session_id, summary in summaries.items()
+            if summary and len(summary['days']) > 1}
+
+
+def iter_session_records(session_id):
+    """
+    按时间顺序产出一个会话在所有日期的记录。
+    通过会话索引直接定位相关日期和字节区间；索引不可用（如目录只读）时扫描所有日期。
+    """
+    import session_index
+    import sqlite3
+
+    try:
+        index = session_index.open_index(STATS_DIR)
+    except (sqlite3.Error, OSError):
+        index = None
+
+    if index is None:
+        for record in iter_range_records():
+            if record.get('session_id', 'unknown') == session_id:
+                yield record
+        return
+
+    with index:
+        yield from index.iter_records(session_id)
+
+
+def split_by_date(records):
+    """把按时间排序的记录按日期分组：日期 -> 记录列表（保持顺序）"""
+    groups = {}
+    for record in records:
+        groups.setdefault(record.get('timestamp', '')[:10], []).append(record)
+    return groups
+
+
+def show_session(session_id):
+    """显示单个会话跨越所有日期的合并汇总、每天的分项和全部记录"""
+    print_header(f"💬 会话 - {session_id}")
+
+    records = list(iter_session_records(session_id))
+    if not records:
+        print(f"\n⚠️  没有找到会话 {session_id} 的记录")
+        return
+
+    days = split_by_date(records)
+    stats = aggregate_by_session(records)[session_id]
+    emails = sorted({r.get('email', 'unknown') for r in records})
+
+    print(f"\n📅 跨越日期：{', '.join(days)}")
+    print(f"👤 用户：{', '.join(emails)}")
+    print(f"🔧 工具：{', '.join(stats['tools'])}")
+    print(f"📈 总操作数：{stats['operations']}")
+    print(f"➕ 新增行数：{stats['additions']}")
+    print(f"➖ 删除行数：{stats['deletions']}")
+    print(f"📊 净变化：{stats['net_change']:+d}")
+    print(f"🕐 首次记录：{records[0].get('timestamp', 'N/A')}")
+    print(f"🕐 最后记录：{records[-1].get('timestamp', 'N/A')}")
+
+    if len(days) > 1:
+        print_header("📅 按日期统计")
+        for date_str, day_records in days.items():
+            summary = aggregate_by_date(date_str, day_records)
+            print(f"{date_str}: 操作 {summary['total_operations']:3d} | "
+                  f"+{summary['total_additions']:4d} | -{summary['total_deletions']:4d} | "
+                  f"净变化 {summary['net_change']:+5d}")
+
+    print_header(f"📝 全部记录（{len(records)} 条）")
+    for i, record in enumerate(records, 1):
+        print_record_line(i, record)
+
+
+COUNTER_ROW_FIELDS = ('date', 'kind', 'key') + stats_counters.COUNT_FIELDS
+
+
+def parse_counter_spec(spec):
+    """解析 --counter 参数：day、session / user / tool（列出全部）或 session:ID 这样的单个键"""
+    kind, sep, key = spec.partition(':')
+    if kind not in stats_counters.KINDS or (kind == 'day' and sep):
+        raise ValueError(f"无效的计数项 '{spec}'（可用：day、session[:ID]、user[:EMAIL]、tool[:NAME]）")
+    return kind, (key if sep else None)
+
+
+def refresh_counters(date_str, stats_dir=None):
+    """
+    在 hook 使用的同一把锁内把计数补齐到日期文件的当前状态（通常已是最新，只检查文件头）。
+    统计目录只读时跳过，直接读取现有计数（默认 STATS_DIR）。
+    """
+    file_path = Path(stats_dir or STATS_DIR) / f"{date_str}.jsonl"
+    if not file_path.exists():
+        return
+    import post_stat
+
+    try:
+        with open(file_path, 'a', encoding='utf-8') as f:
+            post_stat.lock_file(f)
+            try:
+                stats_counters.sync(file_path)
+            finally:
+                post_stat.unlock_file(f)
+    except OSError:
+        pass
+
+
+def iter_counter_rows(spec, date_str):
+    """
+    从运行计数文件读取某天的计数行，不解析日期文件。
+    指定键时只读取该键的槽位，否则列出该类别的全部键（按变动行数降序）。
+    """
+    kind, key = parse_counter_spec(spec)
+    refresh_counters(date_str)
+    counters = stats_counters.open_counters(STATS_DIR, date_str)
+    if counters is None:
+        return
+
+    with counters:
+        if kind == 'day' or key is not None:
+            counts = counters.get(kind, key or '')
+            entries = [(kind, key or '', counts)] if counts else []
+        else:
+            entries = sorted(counters.entries(kind),
+                             key=lambda e: (-stats_counters.metric_value(e[2], 'lines'), e[1]))
+
+    for entry_kind, entry_key, counts in entries:
+        yield {'date': date_str, 'kind': entry_kind, 'key': entry_key, **counts}
+
+
+def show_counter(spec, date_str=None):
+    """显示运行计数（O(1) 读取，不扫描当天的记录）"""
+    date_str = date_str or get_today_date().strftime("%Y-%m-%d")
+    kind, key = parse_counter_spec(spec)
+    label = stats_counters.KIND_LABELS[kind] if kind != 'day' else '全天'
+    print_header(f"🔢 运行计数 - {date_str} {label}{f' {key}' if key else ''}")
+
+    count = 0
+    for count, row in enumerate(iter_counter_rows(spec, date_str), 1):
+        if count == 1:
+            print()
+        name = row['key'] or '合计'
+        print(f"{name}: {row['operations']:3d} 操作 | "
+              f"+{row['additions']:5d} / -{row['deletions']:5d} | "
+              f"净变化：{row['net_change']:+6d}")
+
+    if count == 0:
+        print("\n⚠️  没有找到计数（该日期没有记录，或记录早于运行计数功能）")
+
+
+def show_history(from_date=None, to_date=None):
+    """显示历史统计（可选日期范围）"""
     print_header("📅 历史统计")
 
-    dates = list_available_dates()
+    dates = dates_in_range(from_date, to_date)
 
     if not dates:
         print("\n⚠️  没有找到任何统计记录")
@@ -226,16 +1137,24 @@ def show_history():
     total_deletions = 0
     total_net = 0
     total_ops = 0
+    # 各天的采样误差相互独立，合计的误差范围为各天误差的平方和开方
+    error_squares = None
 
     for date_str in dates:
         records = read_stats_file(date_str)
         summary = aggregate_by_date(date_str, records)
 
         if summary:
-            print(f"{date_str}: "
-                  f"{summary['total_operations']:3d} 操作 | "
-                  f"+{summary['total_additions']:5d} / -{summary['total_deletions']:5d} | "
-                  f"净变化：{summary['net_change']:+6d}")
+            line = (f"{date_str}: "
+                    f"{summary['total_operations']:3d} 操作 | "
+                    f"+{summary['total_additions']:5d} / -{summary['total_deletions']:5d} | "
+                    f"净变化：{summary['net_change']:+6d}")
+            if summary.get('errors'):
+                line += f" | 采样误差 ±{summary['errors']['operations']} 操作"
+                error_squares = error_squares or dict.fromkeys(summary['errors'], 0)
+                for field, bound in summary['errors'].items():
+                    error_squares[field] += bound * bound
+            print(line)
 
             total_additions += summary['total_additions']
             total_deletions += summary['total_deletions']
@@ -247,34 +1166,208 @@ def show_history():
     print(f"总新增行：+{total_additions}")
     print(f"总删除行：-{total_deletions}")
     print(f"净变化：{total_net:+d}")
+    if error_squares:
+        errors = {field: math.ceil(math.sqrt(value)) for field, value in error_squares.items()}
+        print(f"采样误差（95%）：{format_errors(errors)}")
     print(f"日期范围：{dates[0]} 至 {dates[-1]}")
 
 
 def show_recent(n=10):
     """显示最近的记录"""
     today = get_today_date().strftime("%Y-%m-%d")
-    records = read_stats_file(today)
+    recent_records = read_recent_records(today, n)
 
     print_header(f"🕐 最近 {n} 条记录 - {today}")
 
-    if not records:
+    if not recent_records:
         print(f"\n⚠️  今天没有统计记录")
         return
 
-    recent_records = records[-n:]
-
     print(f"\n显示 {len(recent_records)} 条记录：\n")
 
     for i, record in enumerate(recent_records, 1):
-        timestamp = record.get('timestamp', 'N/A')
-        tool = record.get('tool', 'Unknown')
-        email = record.get('email', 'unknown')
-        additions = record.get('additions', 0)
-        deletions = record.get('deletions', 0)
-        net = record.get('net_change', 0)
+        print_record_line(i, record)
+
+
+def print_record_line(i, record):
+    """打印一条记录"""
+    timestamp = record.get('timestamp', 'N/A')
+    tool = record.get('tool', 'Unknown')
+    email = record.get('email', 'unknown')
+    additions = record.get('additions', 0)
+    deletions = record.get('deletions', 0)
+    net = record.get('net_change', 0)
+
+    line = (f"{i:2d}. [{timestamp}] {tool:12s} | "
+            f"{email:25s} | +{additions:3d}/-{deletions:3d} (净:{net:+4d})")
+    if 'rollup' in record:
+        line += f" [{'按小时' if record['rollup'] == 'hour' else '按天'}汇总 {record.get('operations', 0)} 次]"
+    print(line)
+
+
+def describe_range(from_date=None, to_date=None):
+    """日期范围的显示文本"""
+    if from_date is None and to_date is None:
+        return "全部日期"
+    return f"{from_date or '最早'} 至 {to_date or '最新'}"
+
+
+def show_list(from_date=None, to_date=None):
+    """列出可用日期及每天的记录数"""
+    dates = dates_in_range(from_date, to_date)
+    if dates:
+        print("可用的统计日期：")
+        for date in dates:
+            print(f"  {date}  ({count_records(date)} 条记录)")
+    else:
+        print("没有找到任何统计记录")
 
-        print(f"{i:2d}. [{timestamp}] {tool:12s} | "
-              f"{email:25s} | +{additions:3d}/-{deletions:3d} (净:{net:+4d})")
+
+def iter_dump_records(from_date=None, to_date=None, filters=None):
+    """日期范围内满足过滤条件的原始记录（按会话过滤时通过会话索引定位）"""
+    if filters:
+        return open_query(from_date, to_date, filters).records()
+    return iter_range_records(from_date, to_date)
+
+
+def show_dump(from_date=None, to_date=None, filters=None):
+    """逐条显示日期范围内的原始记录"""
+    print_header(f"📜 原始记录 - {describe_range(from_date, to_date)}{describe_filters(filters)}")
+
+    count = 0
+    for count, record in enumerate(iter_dump_records(from_date, to_date, filters), 1):
+        if count == 1:
+            print()
+        print_record_line(count, record)
+
+    if count == 0:
+        print("\n⚠️  没有找到任何统计记录")
+
+
+def describe_filters(filters):
+    """过滤条件的说明文字（没有条件时为空）"""
+    if not filters:
+        return ""
+    return "（" + "，".join(f"{key}={value}" for key, value in filters.items()) + "）"
+
+
+# 文本输出的分组统计只需要这几项，运行计数即可回答
+GROUP_TEXT_FIELDS = ('operations', 'additions', 'deletions', 'net_change')
+
+
+def group_query(keys, from_date=None, to_date=None, filters=None, fields=GROUP_TEXT_FIELDS):
+    """--group-by 对应的查询"""
+    return open_query(from_date, to_date, filters).group_by(*keys).agg(*fields)
+
+
+def explain_groups(keys, from_date=None, to_date=None, filters=None, fields=GROUP_TEXT_FIELDS):
+    """
+    --group-by 的执行计划说明。
+    流式聚合的分组不经查询 API：每天的记录与 iter_stats_file 一样读取二进制存储或扫描日期文件。
+    """
+    if not streams_groups(keys, filters):
+        return group_query(keys, from_date, to_date, filters, fields).explain()
+    lines = []
+    for date_str in dates_in_range(from_date, to_date):
+        source = "二进制存储" if stats_binary.record_count(STATS_DIR, date_str) is not None else "扫描日期文件"
+        lines.append(f"{date_str}: {source}（逐条流式聚合，超出内存预算时溢出到磁盘）")
+    return '\n'.join(lines) or "（没有需要读取的日期）"
+
+
+def show_groups(keys, from_date=None, to_date=None, filters=None, max_keys=None):
+    """按一个或多个维度分组显示日期范围内的统计"""
+    labels = {'date': '日期', 'hour': '小时', 'user': '用户', 'tool': '工具', 'session': '会话'}
+    print_header(f"📋 按{'、'.join(labels[key] for key in keys)}分组 - "
+                 f"{describe_range(from_date, to_date)}{describe_filters(filters)}")
+
+    if streams_groups(keys, filters):
+        rows = iter_group_rows(keys[0], iter_range_records(from_date, to_date), max_keys)
+    else:
+        rows = group_query(keys, from_date, to_date, filters)
+
+    count = 0
+    for count, row in enumerate(rows, 1):
+        if count == 1:
+            print()
+        print(f"{' | '.join(str(row[key]) for key in keys)}: "
+              f"{row['operations']:3d} 操作 | "
+              f"+{row['additions']:5d} / -{row['deletions']:5d} | "
+              f"净变化：{row['net_change']:+6d}")
+
+    if count == 0:
+        print("\n⚠️  没有找到任何统计记录")
+
+
+def show_top(group, n, metric='operations', from_date=None, to_date=None, approx=False, capacity=None,
+             max_keys=None):
+    """显示日期范围内的 top-N 排行榜"""
+    labels = {'user': '用户', 'tool': '工具', 'session': '会话'}
+    metric_labels = {'operations': '操作数', 'additions': '新增行数', 'deletions': '删除行数', 'net_change': '净变化',
+                     'churn': '重复写入行数'}
+    title = f"🏆 {labels[group]}排行（按{metric_labels[metric]}）- {describe_range(from_date, to_date)}"
+    if approx:
+        title += "（近似）"
+    print_header(title)
+
+    count = 0
+    for count, row in enumerate(iter_top_rows(group, n, metric, from_date, to_date, approx, capacity, max_keys), 1):
+        if count == 1:
+            print()
+        if approx:
+            print(f"{row['rank']:3d}. {row[group]}: ≈{row[metric]}（误差 ≤ {row['error']}）")
+        else:
+            line = (f"{row['rank']:3d}. {row[group]}: "
+                    f"{row['operations']:3d} 操作 | "
+                    f"+{row['additions']:5d} / -{row['deletions']:5d} | "
+                    f"净变化：{row['net_change']:+6d}")
+            if metric == 'churn':
+                line += f" | 重复写入：{row['churn']:5d}"
+            print(line)
+
+    if count == 0:
+        print("\n⚠️  没有找到任何统计记录")
+
+
+def export_rows(args):
+    """以机器可读格式（json / jsonl / csv）流式输出当前模式的结果"""
+    from_date = args.from_date
+    to_date = args.to_date
+    max_keys = stats_spill.keys_for_budget(args.memory_budget)
+
+    if args.list:
+        rows = ({'date': d, 'records': count_records(d)} for d in dates_in_range(from_date, to_date))
+        fields = ('date', 'records')
+    elif args.dump:
+        rows = iter_dump_records(from_date, to_date, args.filters)
+        fields = RECORD_ROW_FIELDS
+    elif args.top:
+        group = TOP_GROUPS[args.by]
+        rows = iter_top_rows(group, args.top, args.metric, from_date, to_date, args.approx, args.capacity,
+                             max_keys)
+        fields = top_row_fields(group, args.metric, args.approx)
+    elif args.group_by:
+        rows = iter_query_rows(args.group_by, from_date, to_date, args.filters, max_keys)
+        fields = query_row_fields(args.group_by)
+    elif args.history:
+        rows = iter_date_rows(from_date, to_date)
+        fields = DATE_ROW_FIELDS
+    elif args.recent:
+        rows = read_recent_records(get_today_date().strftime("%Y-%m-%d"), args.recent)
+        fields = RECORD_ROW_FIELDS
+    elif args.session:
+        rows = iter_session_records(args.session)
+        fields = RECORD_ROW_FIELDS
+    elif args.counter:
+        rows = iter_counter_rows(args.counter, args.date or get_today_date().strftime("%Y-%m-%d"))
+        fields = COUNTER_ROW_FIELDS
+    else:
+        date_str = args.date or get_today_date().strftime("%Y-%m-%d")
+        start = parse_time_bound(date_str, args.start)
+        end = parse_time_bound(date_str, args.end)
+        rows = iter_summary_rows(date_str, read_stats_file(date_str, start, end))
+        fields = SUMMARY_ROW_FIELDS
+
+    write_rows(rows, args.format, fields)
 
 
 def main():
@@ -288,46 +1381,126 @@ def main():
 示例：
   %(prog)s                    # 显示今天的统计摘要
   %(prog)s --date 2026-02-01  # 显示指定日期的统计
+  %(prog)s --date 2026-02-01 --start 09:00 --end 12:00  # 只统计该时间段
   %(prog)s --history          # 显示所有历史统计
   %(prog)s --recent 20        # 显示最近 20 条记录
   %(prog)s --list             # 列出所有可用的日期
+  %(prog)s --session abc123   # 显示一个会话跨越所有日期的汇总和记录
+  %(prog)s --group-by user --from 2026-01-01 --to 2026-01-31  # 按用户汇总一段日期
+  %(prog)s --group-by tool,hour --filter user=dev@example.com  # 某个用户按工具和小时汇总
+  %(prog)s --group-by date --filter session=abc123 --explain  # 查看查询从哪些数据来源读取
+  %(prog)s --top 10 --by users --metric additions --from 2026-01-01  # 新增行数前 10 的用户
+  %(prog)s --top 5 --by sessions --metric churn                      # 反复改写代码最多的会话
+  %(prog)s --top 20 --by sessions --approx                     # 近似的会话排行（内存固定）
+  %(prog)s --dump --from 2026-01-01 --format jsonl > records.jsonl  # 流式导出原始记录
+  %(prog)s --history --format csv                              # 每日汇总导出为 CSV
         """
     )
 
     parser.add_argument('--date', '-d', help='指定日期（YYYY-MM-DD）')
+    parser.add_argument('--start', metavar='HH:MM', help='摘要的起始时间（含）')
+    parser.add_argument('--end', metavar='HH:MM', help='摘要的结束时间（不含）')
     parser.add_argument('--history', '-H', action='store_true', help='显示历史统计')
     parser.add_argument('--recent', '-r', type=int, metavar='N', help='显示最近 N 条记录')
     parser.add_argument('--list', '-l', action='store_true', help='列出所有可用的日期')
+    parser.add_argument('--dump', action='store_true', help='输出日期范围内的原始记录')
+    parser.add_argument('--session', '-s', metavar='ID', help='显示单个会话跨越所有日期的汇总和记录')
+    parser.add_argument('--counter', '-c', metavar='SPEC',
+                        help='读取运行计数（O(1)，不扫描记录）：day、session、user、tool 或 session:ID 等')
+    parser.add_argument('--group-by', '-g', metavar='KEYS',
+                        help=f'按维度汇总日期范围内的统计，多个维度用逗号分隔（{"、".join(QUERY_GROUP_KEYS)}）')
+    parser.add_argument('--filter', action='append', metavar='KEY=VALUE',
+                        help=f'--group-by / --dump 的过滤条件，可重复（KEY 可用：{"、".join(GROUP_KEYS)}）')
+    parser.add_argument('--explain', action='store_true',
+                        help='只显示 --group-by / --dump 的执行计划（每个日期读取的数据来源）')
+    parser.add_argument('--top', type=int, metavar='N', help='显示日期范围内的前 N 名排行榜')
+    parser.add_argument('--by', choices=list(TOP_GROUPS), default='sessions', help='排行榜维度（默认 sessions）')
+    parser.add_argument('--metric', choices=['operations', 'additions', 'deletions', 'net_change', 'churn'],
+                        default='operations', help='排行榜排序指标（默认 operations）')
+    parser.add_argument('--approx', action='store_true',
+                        help='使用 Space-Saving 近似排行（内存固定，适合数量极多的会话）')
+    parser.add_argument('--capacity', type=int, metavar='M',
+                        help=f'近似模式保留的计数器数量（默认 N × {APPROX_CAPACITY_FACTOR}）')
+    parser.add_argument('--memory-budget', type=float, metavar='MB', default=DEFAULT_MEMORY_BUDGET_MB,
+                        help=f'--group-by / --top 聚合的内存预算，超出后溢出到磁盘（默认 {DEFAULT_MEMORY_BUDGET_MB}）')
+    parser.add_argument('--from', dest='from_date', metavar='DATE', help='日期范围起点（含，YYYY-MM-DD）')
+    parser.add_argument('--to', dest='to_date', metavar='DATE', help='日期范围终点（含，YYYY-MM-DD）')
+    parser.add_argument('--dir', help='统计目录（默认 code-log，可指定 merge_stats.py 合并后的目录）')
+    parser.add_argument('--format', '-f', choices=['text', 'json', 'jsonl', 'csv'], default='text',
+                        help='输出格式（默认 text；其他格式流式输出，便于下游工具处理）')
 
     args = parser.parse_args()
 
+    if args.approx and args.metric == 'net_change':
+        parser.error("--approx 不支持 net_change（Space-Saving 要求权重非负）")
+    if args.counter:
+        try:
+            parse_counter_spec(args.counter)
+        except ValueError as e:
+            parser.error(str(e))
+    try:
+        if args.group_by:
+            args.group_by = parse_group_by(args.group_by)
+        args.filters = parse_filters(args.filter)
+    except ValueError as e:
+        parser.error(str(e))
+    if (args.filters or args.explain) and not (args.group_by or args.dump):
+        parser.error("--filter / --explain 只能与 --group-by 或 --dump 一起使用")
+    if args.top and args.date and not (args.from_date or args.to_date):
+        args.from_date = args.to_date = args.date
+
+    global STATS_DIR
+    if args.dir:
+        STATS_DIR = Path(args.dir)
+
     # 检查 stats 目录是否存在
     if not STATS_DIR.exists():
         print(f"错误：统计目录不存在: {STATS_DIR}", file=sys.stderr)
         print(f"提示：请先使用 stats hook 生成一些统计数据", file=sys.stderr)
         sys.exit(1)
 
-    if args.list:
-        dates = list_available_dates()
-        if dates:
-            print("可用的统计日期：")
-            for date in dates:
-                print(f"  {date}")
+    if args.explain:
+        if args.group_by:
+            fields = GROUP_TEXT_FIELDS if args.format == 'text' else STAT_FIELDS
+            print(explain_groups(args.group_by, args.from_date, args.to_date, args.filters, fields))
         else:
-            print("没有找到任何统计记录")
+            print(open_query(args.from_date, args.to_date, args.filters).explain())
+
+    elif args.format != 'text':
+        export_rows(args)
+
+    elif args.list:
+        show_list(args.from_date, args.to_date)
+
+    elif args.dump:
+        show_dump(args.from_date, args.to_date, args.filters)
+
+    elif args.top:
+        show_top(TOP_GROUPS[args.by], args.top, args.metric, args.from_date, args.to_date,
+                 args.approx, args.capacity, stats_spill.keys_for_budget(args.memory_budget))
+
+    elif args.group_by:
+        show_groups(args.group_by, args.from_date, args.to_date, args.filters,
+                    stats_spill.keys_for_budget(args.memory_budget))
 
     elif args.history:
-        show_history()
+        show_history(args.from_date, args.to_date)
 
     elif args.recent:
         show_recent(args.recent)
 
+    elif args.session:
+        show_session(args.session)
+
+    elif args.counter:
+        show_counter(args.counter, args.date)
+
     elif args.date:
-        show_summary(args.date)
+        show_summary(args.date, args.start, args.end)
 
     else:
         # 默认显示今天的摘要
-        show_summary()
+        show_summary(start=args.start, end=args.end)
 
 
 if __name__ == "__main__":